@@ -15,13 +15,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 __author__ = "Tobias Kraft"
-__version__ = "1.104"
+__version__ = "1.129"
 
 import time
 from requests.sessions import Session
 from requests.auth import HTTPBasicAuth
 from requests.auth import HTTPDigestAuth
-from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 import os
 import logging
@@ -32,19 +31,33 @@ import sys
 from packaging import version
 import argparse 
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, Future
+import threading
+from abc import ABC, abstractmethod
 from config_provider import ConfigFileConfigProvider, MqttHandler, ConfigProviderChain
+from config_model import ConfigError, load_config
+from inverter_store import InverterStore
+from async_engine import AsyncEngine, CreateAsyncDTU, CreateAsyncPowermeter
+from cycle_timing import CycleTimer
+from metrics import MetricsRegistry, MetricsServer, InstrumentedHTTPAdapter, cycle_timer_samples
+from limit_status import LimitStatusPoller
+from json_path import get_json_path_extractor
+from rolling_stats import RollingWindow
 import json
 
-session = Session()
+# set by multi_site.py if several sites run in one process, the site then uses the shared session, thread pool and engine
+SITE_CONTEXT = globals().get('SITE_CONTEXT')
+session = Session() if SITE_CONTEXT is None else SITE_CONTEXT.session
 logging.basicConfig(
     format='%(asctime)s %(levelname)-8s %(message)s',
     level=logging.INFO,
     datefmt='%Y-%m-%d %H:%M:%S')
-logger = logging.getLogger()
+logger = logging.getLogger() if SITE_CONTEXT is None else logging.getLogger(SITE_CONTEXT.name)
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-c', '--config', help='Override configuration file path')
-args = parser.parse_args()
+parser.add_argument('--record', help='Write the powermeter readings, DTU responses and limits to a trace file (see trace_replay.py)')
+args = parser.parse_args(None if SITE_CONTEXT is None else SITE_CONTEXT.arguments)
 
 try:
     config = ConfigParser()
@@ -70,7 +83,7 @@ if ENABLE_LOG_TO_FILE:
         os.makedirs(Path.joinpath(Path(__file__).parent.resolve(), 'log'))
 
     rotating_file_handler = TimedRotatingFileHandler(
-        filename=Path.joinpath(Path.joinpath(Path(__file__).parent.resolve(), 'log'),'log'),
+        filename=Path.joinpath(Path.joinpath(Path(__file__).parent.resolve(), 'log'),'log' if SITE_CONTEXT is None else SITE_CONTEXT.name),
         when='midnight',
         interval=2,
         backupCount=LOG_BACKUP_COUNT)
@@ -102,7 +115,10 @@ def CastToInt(pValueToCast):
         raise
 
 def SetLimit(pLimit):
+    PendingAcks = []
     try:
+        # pipelined mode: the acknowledges of the previous limits decide if the limit has to be sent again
+        ReconcileLimitAcks()
         if not hasattr(SetLimit, "LastLimit"):
             SetLimit.LastLimit = CastToInt(0)
         if not hasattr(SetLimit, "LastLimitAck"):
@@ -127,29 +143,20 @@ def SetLimit(pLimit):
 
         RemainingLimit = CastToInt(pLimit)
 
-        RemainingLimit -= GetMinWattFromAllInverters()
+        Fleet = FLEET_AGGREGATES.Get()
+        RemainingLimit -= Fleet.MinWatt
 
         # Handle non-battery inverters first
-        if RemainingLimit >= GetMaxWattFromAllNonBatteryInverters() - GetMinWattFromAllNonBatteryInverters():
-            nonBatteryInvertersLimit = GetMaxWattFromAllNonBatteryInverters() - GetMinWattFromAllNonBatteryInverters()
+        if RemainingLimit >= Fleet.MaxWattNonBattery - Fleet.MinWattNonBattery:
+            nonBatteryInvertersLimit = Fleet.MaxWattNonBattery - Fleet.MinWattNonBattery
         else:
             nonBatteryInvertersLimit = RemainingLimit
 
-        for i in range(INVERTER_COUNT):
-            if not AVAILABLE[i] or HOY_BATTERY_MODE[i]:
-                continue
-
-            # Calculate proportional limit for non-battery inverters
-            NewLimit = CastToInt(nonBatteryInvertersLimit * (HOY_MAX_WATT[i] - GetMinWatt(i)) / (GetMaxWattFromAllNonBatteryInverters() - GetMinWattFromAllNonBatteryInverters()))
-
-            NewLimit += GetMinWatt(i)
-
-            # Apply the calculated limit to the inverter
-            NewLimit = ApplyLimitsToSetpointInverter(i, NewLimit)
+        # Calculate proportional limits for non-battery inverters, clamped and compensated
+        Limits, CompensatedLimits = INVERTERS.allocate_limits(Fleet.NonBatteryInverters, nonBatteryInvertersLimit, Fleet.MaxWattNonBattery - Fleet.MinWattNonBattery)
+        for i, Limit, NewLimit in zip(Fleet.NonBatteryInverters, Limits, CompensatedLimits):
             if HOY_COMPENSATE_WATT_FACTOR[i] != 1:
-                logger.info('Ahoy: Inverter "%s": compensate Limit from %s Watt to %s Watt', NAME[i], CastToInt(NewLimit), CastToInt(NewLimit*HOY_COMPENSATE_WATT_FACTOR[i]))
-                NewLimit = CastToInt(NewLimit * HOY_COMPENSATE_WATT_FACTOR[i])
-                NewLimit = ApplyLimitsToMaxInverterLimits(i, NewLimit)
+                logger.info('Ahoy: Inverter "%s": compensate Limit from %s Watt to %s Watt', NAME[i], Limit, CastToInt(Limit*HOY_COMPENSATE_WATT_FACTOR[i]))
 
             if (NewLimit == CastToInt(CURRENT_LIMIT[i])) and LASTLIMITACKNOWLEDGED[i]:
                 logger.info('Inverter "%s": Already at %s Watt',NAME[i],CastToInt(NewLimit))
@@ -158,42 +165,32 @@ def SetLimit(pLimit):
             LASTLIMITACKNOWLEDGED[i] = True
 
             PublishInverterState(i, "limit", NewLimit)
-            DTU.SetLimit(i, NewLimit)
-            if not DTU.WaitForAck(i, SET_LIMIT_TIMEOUT_SECONDS):
-                SetLimit.LastLimitAck = False
-                LASTLIMITACKNOWLEDGED[i] = False
+            CYCLE_TIMER.call('set_limit', DTU.SetLimit, i, NewLimit, device=InverterTimingKey(i))
+            PendingAcks.append(i)
+            if not IsParallelDispatch():
+                WaitForLimitAcks(PendingAcks)
+                PendingAcks.clear()
 
         # Adjust RemainingLimit based on what was assigned to non-battery inverters
         RemainingLimit -= nonBatteryInvertersLimit
 
         # Then handle battery inverters based on priority
         for j in range(1, 6):
-            batteryMaxWattSamePrio = GetMaxWattFromAllBatteryInvertersSamePrio(j)
+            batteryMaxWattSamePrio = Fleet.MaxWattBatteryPrio.get(j, 0)
+            batteryMinWattSamePrio = Fleet.MinWattBatteryPrio.get(j, 0)
             if batteryMaxWattSamePrio <= 0:
                 continue
 
-            if RemainingLimit >= batteryMaxWattSamePrio - GetMinWattFromAllBatteryInvertersWithSamePriority(j):
-                LimitPrio = batteryMaxWattSamePrio - GetMinWattFromAllBatteryInvertersWithSamePriority(j)
+            if RemainingLimit >= batteryMaxWattSamePrio - batteryMinWattSamePrio:
+                LimitPrio = batteryMaxWattSamePrio - batteryMinWattSamePrio
             else:
                 LimitPrio = RemainingLimit 
 
-            for i in range(INVERTER_COUNT):
-                if (not HOY_BATTERY_MODE[i]):
-                    continue
-                if (not AVAILABLE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]):
-                    continue
-                if CONFIG_PROVIDER.get_battery_priority(i) != j:
-                    continue
-
-                # Calculate proportional limit for battery inverters
-                NewLimit = CastToInt(LimitPrio * (HOY_MAX_WATT[i] - GetMinWatt(i)) / (GetMaxWattFromAllBatteryInvertersSamePrio(j) - GetMinWattFromAllBatteryInvertersWithSamePriority(j)))
-                NewLimit += GetMinWatt(i)
-
-                NewLimit = ApplyLimitsToSetpointInverter(i, NewLimit)
+            # Calculate proportional limits for battery inverters of this priority
+            Limits, CompensatedLimits = INVERTERS.allocate_limits(Fleet.BatteryInvertersPrio[j], LimitPrio, batteryMaxWattSamePrio - batteryMinWattSamePrio)
+            for i, Limit, NewLimit in zip(Fleet.BatteryInvertersPrio[j], Limits, CompensatedLimits):
                 if HOY_COMPENSATE_WATT_FACTOR[i] != 1:
-                    logger.info('Ahoy: Inverter "%s": compensate Limit from %s Watt to %s Watt', NAME[i], CastToInt(NewLimit), CastToInt(NewLimit*HOY_COMPENSATE_WATT_FACTOR[i]))
-                    NewLimit = CastToInt(NewLimit * HOY_COMPENSATE_WATT_FACTOR[i])
-                    NewLimit = ApplyLimitsToMaxInverterLimits(i, NewLimit)
+                    logger.info('Ahoy: Inverter "%s": compensate Limit from %s Watt to %s Watt', NAME[i], Limit, CastToInt(Limit*HOY_COMPENSATE_WATT_FACTOR[i]))
 
                 if (NewLimit == CastToInt(CURRENT_LIMIT[i])) and LASTLIMITACKNOWLEDGED[i]:
                     logger.info('Inverter "%s": Already at %s Watt',NAME[i],CastToInt(NewLimit))
@@ -202,17 +199,79 @@ def SetLimit(pLimit):
                 LASTLIMITACKNOWLEDGED[i] = True
 
                 PublishInverterState(i, "limit", NewLimit)
-                DTU.SetLimit(i, NewLimit)
-                if not DTU.WaitForAck(i, SET_LIMIT_TIMEOUT_SECONDS):
-                    SetLimit.LastLimitAck = False
-                    LASTLIMITACKNOWLEDGED[i] = False
+                CYCLE_TIMER.call('set_limit', DTU.SetLimit, i, NewLimit, device=InverterTimingKey(i))
+                PendingAcks.append(i)
+                if not IsParallelDispatch():
+                    WaitForLimitAcks(PendingAcks)
+                    PendingAcks.clear()
 
             RemainingLimit -= LimitPrio
+
+        # parallel mode: all limits are sent, now wait for all acknowledges at once
+        WaitForLimitAcks(PendingAcks)
+        PendingAcks.clear()
     except:
         logger.error("Exception at SetLimit")
         SetLimit.LastLimitAck = False
+        for i in PendingAcks:
+            LASTLIMITACKNOWLEDGED[i] = False
         raise
 
+def IsParallelDispatch():
+    return PIPELINED_LIMIT_ACK or ENGINE is not None or DTU.IsParallel()
+
+def InverterTimingKey(pInverterId):
+    return f'inverter/{pInverterId}'
+
+async def TimedAsyncWaitForAck(pInverterId):
+    with CYCLE_TIMER.span('wait_for_ack', InverterTimingKey(pInverterId)):
+        return await ASYNC_DTU.WaitForAck(pInverterId, SET_LIMIT_TIMEOUT_SECONDS)
+
+def MarkLimitNotAcknowledged(pInverterId):
+    SetLimit.LastLimitAck = False
+    LASTLIMITACKNOWLEDGED[pInverterId] = False
+    METRICS.inc('hoymiles_ack_timeouts_total', {'inverter': str(pInverterId)})
+
+def WaitForLimitAcks(pInverterIds):
+    # wait_for_acks: time the cycle waited for the whole group, wait_for_ack: time of every inverter (see DTU.WaitForAcks)
+    if not pInverterIds:
+        return
+    if PIPELINED_LIMIT_ACK:
+        # the control loop goes on, the acknowledges are checked by ReconcileLimitAcks()
+        Deadline = time.time() + SET_LIMIT_TIMEOUT_SECONDS
+        for i in pInverterIds:
+            PENDING_LIMIT_ACKS[i] = Deadline
+        return
+    with CYCLE_TIMER.span('wait_for_acks'):
+        if ENGINE is not None:
+            acks = dict(zip(pInverterIds, ENGINE.gather([TimedAsyncWaitForAck(i) for i in pInverterIds], return_exceptions=False)))
+        else:
+            acks = DTU.WaitForAcks(pInverterIds, SET_LIMIT_TIMEOUT_SECONDS)
+    for i, ack in acks.items():
+        if not ack:
+            MarkLimitNotAcknowledged(i)
+
+def ReconcileLimitAcks():
+    # one status request per pending limit. A limit that is not acknowledged until its deadline is marked like a
+    # timeout of WaitForAck, so the next SetLimit sends it again.
+    for i, Deadline in list(PENDING_LIMIT_ACKS.items()):
+        try:
+            ack = DTU.IsLimitAcknowledged(i)
+        except Exception as e:
+            ack = False
+            logger.error('Exception at ReconcileLimitAcks, Inverter "%s"', NAME[i])
+            if hasattr(e, 'message'):
+                logger.error(e.message)
+            else:
+                logger.error(e)
+        if ack:
+            del PENDING_LIMIT_ACKS[i]
+            logger.info('Inverter "%s": Limit acknowledged', NAME[i])
+        elif time.time() >= Deadline:
+            del PENDING_LIMIT_ACKS[i]
+            logger.info('Inverter "%s": Limit timeout!', NAME[i])
+            MarkLimitNotAcknowledged(i)
+
 def ResetInverterData(pInverterId):
     attributes_to_delete = [
         "LastLimit",
@@ -236,14 +295,18 @@ def ResetInverterData(pInverterId):
                     target_object[key][pInverterId] = value
 
     LASTLIMITACKNOWLEDGED[pInverterId] = False
-    HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId] = []
+    PENDING_LIMIT_ACKS.pop(pInverterId, None)
+    HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId].clear()
     CURRENT_LIMIT[pInverterId] = -1
-    HOY_BATTERY_GOOD_VOLTAGE[pInverterId] = True
+    if not HOY_BATTERY_GOOD_VOLTAGE[pInverterId]:
+        HOY_BATTERY_GOOD_VOLTAGE[pInverterId] = True
+        FLEET_AGGREGATES.Invalidate()
     TEMPERATURE[pInverterId] = str('--- degC')
 
 def GetHoymilesAvailable():
     try:
         GetHoymilesAvailable = False
+        DTU.PrefetchStatus()
         for i in range(INVERTER_COUNT):
             try:
                 WasAvail = AVAILABLE[i]
@@ -260,6 +323,8 @@ def GetHoymilesAvailable():
                     logger.error(e.message)
                 else:
                     logger.error(e)
+            if AVAILABLE[i] != WasAvail:
+                FLEET_AGGREGATES.Invalidate()
         return GetHoymilesAvailable
     except:
         logger.error('Exception at GetHoymilesAvailable')
@@ -287,15 +352,11 @@ def GetHoymilesPanelMinVoltage(pInverterId):
         if not AVAILABLE[pInverterId]:
             return 0
         
-        HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId].append(DTU.GetPanelMinVoltage(pInverterId))
-        
-        # calculate mean over last x values
-        if len(HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId]) > HOY_BATTERY_AVERAGE_CNT[pInverterId]:
-            HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId].pop(0)
-        from statistics import mean
-        
-        logger.info('Average min-panel voltage, inverter "%s": %s Volt',NAME[pInverterId], mean(HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId]))
-        return mean(HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId])
+        # mean over the last HOY_BATTERY_AVERAGE_CNT values
+        HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId].add(DTU.GetPanelMinVoltage(pInverterId))
+        MeanVoltage = HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST[pInverterId].mean()
+        logger.info('Average min-panel voltage, inverter "%s": %s Volt',NAME[pInverterId], MeanVoltage)
+        return MeanVoltage
     except:
         logger.error("Exception at GetHoymilesPanelMinVoltage, Inverter %s not reachable", pInverterId)
         raise
@@ -349,6 +410,7 @@ def GetCheckBattery():
                     result = True
                     continue
                 minVoltage = GetHoymilesPanelMinVoltage(i)
+                PreviousState = (HOY_BATTERY_GOOD_VOLTAGE[i], HOY_MAX_WATT[i])
 
                 if minVoltage <= HOY_BATTERY_THRESHOLD_OFF_LIMIT_IN_V[i]:
                     SetHoymilesPowerStatus(i, False)
@@ -376,6 +438,8 @@ def GetCheckBattery():
                         HOY_MAX_WATT[i] = CONFIG_PROVIDER.get_normal_wattage(i)
                         SetLimit.LastLimit = -1
 
+                if (HOY_BATTERY_GOOD_VOLTAGE[i], HOY_MAX_WATT[i]) != PreviousState:
+                    FLEET_AGGREGATES.Invalidate()
                 if HOY_BATTERY_GOOD_VOLTAGE[i]:
                     result = True
             except:
@@ -387,6 +451,12 @@ def GetCheckBattery():
 
 def GetHoymilesTemperature():
     try:
+        if ENGINE is not None:
+            results = ENGINE.gather([ASYNC_DTU.GetTemperature(i) for i in range(INVERTER_COUNT)])
+            for i, result in enumerate(results):
+                if isinstance(result, Exception):
+                    logger.error("Exception at GetHoymilesTemperature, Inverter %s not reachable", i)
+            return
         for i in range(INVERTER_COUNT):
             try:
                 DTU.GetTemperature(i)
@@ -396,21 +466,34 @@ def GetHoymilesTemperature():
         logger.error("Exception at GetHoymilesTemperature")
         raise
 
-def GetHoymilesActualPower():
+def ReadHoymilesActualPower():
     try:
-        try:
-            Watts = abs(INTERMEDIATE_POWERMETER.GetPowermeterWatts())
-            logger.info(f"intermediate meter {INTERMEDIATE_POWERMETER.__class__.__name__}: {Watts} Watt")
-            return Watts
-        except Exception as e:
-            logger.error("Exception at GetHoymilesActualPower")
-            if hasattr(e, 'message'):
-                logger.error(e.message)
+        with CYCLE_TIMER.span('intermediate_meter', INTERMEDIATE_POWERMETER.__class__.__name__):
+            if ENGINE is not None:
+                Watts = abs(ENGINE.run(ASYNC_INTERMEDIATE_POWERMETER.GetPowermeterWatts()))
             else:
-                logger.error(e)
-            logger.error("try reading actual power from DTU:")
+                Watts = abs(INTERMEDIATE_POWERMETER.GetPowermeterWatts())
+        logger.info(f"intermediate meter {INTERMEDIATE_POWERMETER.__class__.__name__}: {Watts} Watt")
+        return Watts
+    except Exception as e:
+        logger.error("Exception at GetHoymilesActualPower")
+        if hasattr(e, 'message'):
+            logger.error(e.message)
+        else:
+            logger.error(e)
+        logger.error("try reading actual power from DTU:")
+        if ENGINE is not None:
+            Watts = ENGINE.run(ASYNC_DTU.GetPowermeterWatts())
+        else:
             Watts = DTU.GetPowermeterWatts()
-            logger.info(f"intermediate meter {DTU.__class__.__name__}: {Watts} Watt")
+        logger.info(f"intermediate meter {DTU.__class__.__name__}: {Watts} Watt")
+        return Watts
+
+def GetHoymilesActualPower(pPrefetched: Future = None):
+    try:
+        if pPrefetched is not None:
+            return pPrefetched.result()
+        return ReadHoymilesActualPower()
     except:
         logger.error("Exception at GetHoymilesActualPower")
         if SET_INVERTER_TO_MIN_ON_POWERMETER_ERROR:
@@ -419,7 +502,11 @@ def GetHoymilesActualPower():
 
 def GetPowermeterWatts():
     try:
-        Watts = POWERMETER.GetPowermeterWatts()
+        with CYCLE_TIMER.span('powermeter', POWERMETER.__class__.__name__):
+            if ENGINE is not None:
+                Watts = ENGINE.run(ASYNC_POWERMETER.GetPowermeterWatts())
+            else:
+                Watts = POWERMETER.GetPowermeterWatts()
         logger.info(f"powermeter {POWERMETER.__class__.__name__}: {Watts} Watt")
         return Watts
     except:
@@ -428,13 +515,52 @@ def GetPowermeterWatts():
             SetLimit(0)        
         raise
 
+class CycleSample:
+    # grid power (the last reading of the poll loop) and actual production of one control cycle
+    def __init__(self, pTimestamp: float, pPowermeterWatts: int, pActualPower: Future = None):
+        self.Timestamp = pTimestamp
+        self.PowermeterWatts = pPowermeterWatts
+        self.ActualPower = pActualPower
+        self.ActualPowerWatts = None
+
+    def GetActualPower(self):
+        if self.ActualPowerWatts is None:
+            self.ActualPowerWatts = GetHoymilesActualPower(self.ActualPower)
+        return self.ActualPowerWatts
+
+def SubmitRead(pFunction):
+    if ENGINE is not None:
+        return ENGINE.submit(ENGINE.call(pFunction))
+    return FETCH_EXECUTOR.submit(pFunction)
+
+def GetCycleSample(pTimestamp: float, pPowermeterWatts: int, pWithActualPower: bool):
+    # the grid power is the last reading of the poll loop, it is not read again. The intermediate meter (or the DTU)
+    # is read in the background and only waited for when the actual power is used, errors are handled there.
+    ActualPower = SubmitRead(ReadHoymilesActualPower) if pWithActualPower else None
+    return CycleSample(pTimestamp, pPowermeterWatts, ActualPower)
+
+def PowermeterPolls():
+    # yields the remaining time of the loop interval before every powermeter read
+    if not EVENT_DRIVEN_LOOP:
+        for x in range(CastToInt(LOOP_INTERVAL_IN_SECONDS / POLL_INTERVAL_IN_SECONDS)):
+            yield CastToInt((LOOP_INTERVAL_IN_SECONDS / POLL_INTERVAL_IN_SECONDS - x) * POLL_INTERVAL_IN_SECONDS)
+            time.sleep(POLL_INTERVAL_IN_SECONDS)
+        return
+    # event driven: push capable powermeters wake up the loop as soon as a new value arrives
+    LoopEnd = time.time() + LOOP_INTERVAL_IN_SECONDS
+    RemainingDelay = LOOP_INTERVAL_IN_SECONDS
+    while RemainingDelay > 0:
+        yield RemainingDelay
+        if not POWERMETER.WaitForNewValue(LoopEnd - time.time(), POLL_INTERVAL_IN_SECONDS):
+            return
+        RemainingDelay = LoopEnd - time.time()
+
 def GetMinWatt(pInverter: int):
-    min_watt_percent = CONFIG_PROVIDER.get_min_wattage_in_percent(pInverter)
-    return int(HOY_INVERTER_WATT[pInverter] * min_watt_percent / 100)
+    return FLEET_AGGREGATES.Get().InverterMinWatt[pInverter]
 
-def CutLimitToProduction(pSetpoint):
+def CutLimitToProduction(pSetpoint, pSample: CycleSample):
     if pSetpoint != GetMaxWattFromAllInverters():
-        ActualPower = GetHoymilesActualPower()
+        ActualPower = pSample.GetActualPower()
         # prevent the setpoint from running away...
         if pSetpoint > ActualPower + (GetMaxWattFromAllInverters() * MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER / 100):
             pSetpoint = CastToInt(ActualPower + (GetMaxWattFromAllInverters() * MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER / 100))
@@ -448,24 +574,11 @@ def ApplyLimitsToSetpoint(pSetpoint):
         pSetpoint = GetMinWattFromAllInverters()
     return pSetpoint
 
-def ApplyLimitsToSetpointInverter(pInverter, pSetpoint):
-    if pSetpoint > HOY_MAX_WATT[pInverter]:
-        pSetpoint = HOY_MAX_WATT[pInverter]
-    if pSetpoint < GetMinWatt(pInverter):
-        pSetpoint = GetMinWatt(pInverter)
-    return pSetpoint
-
-def ApplyLimitsToMaxInverterLimits(pInverter, pSetpoint):
-    if pSetpoint > HOY_INVERTER_WATT[pInverter]:
-        pSetpoint = HOY_INVERTER_WATT[pInverter]
-    if pSetpoint < GetMinWatt(pInverter):
-        pSetpoint = GetMinWatt(pInverter)
-    return pSetpoint
-
 def CrossCheckLimit():
     try:
         for i in range(INVERTER_COUNT):
-            if AVAILABLE[i]:
+            # a pending limit may not be active yet
+            if AVAILABLE[i] and i not in PENDING_LIMIT_ACKS:
                 DTULimitInW = DTU.GetActualLimitInW(i)
                 LimitMax = float(CURRENT_LIMIT[i] + HOY_INVERTER_WATT[i] * 0.05)
                 LimitMin = float(CURRENT_LIMIT[i] - HOY_INVERTER_WATT[i] * 0.05)
@@ -478,69 +591,231 @@ def CrossCheckLimit():
 
 def GetMaxWattFromAllInverters():
     # Max possible Watts, can be reduced on battery mode
-    maxWatt = 0
-    for i in range(INVERTER_COUNT):
-        if (not AVAILABLE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]):
-            continue
-        maxWatt = maxWatt + HOY_MAX_WATT[i]
-    return maxWatt
+    return FLEET_AGGREGATES.Get().MaxWatt
 
 def GetMaxWattFromAllBatteryInvertersSamePrio(pPriority):
-    return sum(
-        HOY_MAX_WATT[i] for i in range(INVERTER_COUNT)
-        if AVAILABLE[i] and HOY_BATTERY_GOOD_VOLTAGE[i] and HOY_BATTERY_MODE[i] and CONFIG_PROVIDER.get_battery_priority(i) == pPriority
-    )
+    return FLEET_AGGREGATES.Get().MaxWattBatteryPrio.get(pPriority, 0)
 
 def GetMaxInverterWattFromAllInverters():
     # Max possible Watts (physically) - Inverter Specification!
-    maxWatt = 0
-    for i in range(INVERTER_COUNT):
-        if (not AVAILABLE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]):
-            continue
-        maxWatt = maxWatt + HOY_INVERTER_WATT[i]
-    return maxWatt
+    return FLEET_AGGREGATES.Get().MaxInverterWatt
 
 def GetMaxWattFromAllNonBatteryInverters():
-    return sum(
-        HOY_MAX_WATT[i] for i in range(INVERTER_COUNT)
-        if AVAILABLE[i] and not HOY_BATTERY_MODE[i] and HOY_BATTERY_GOOD_VOLTAGE[i]
-    )
+    return FLEET_AGGREGATES.Get().MaxWattNonBattery
 
 def GetMinWattFromAllInverters():
-    minWatt = 0
-    for i in range(INVERTER_COUNT):
-        if (not AVAILABLE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]):
-            continue
-        minWatt = minWatt + GetMinWatt(i)
-    return minWatt
+    return FLEET_AGGREGATES.Get().MinWatt
 
 def GetMinWattFromAllNonBatteryInverters():
-    minWatt = 0
-    for i in range(INVERTER_COUNT):
-        if (not AVAILABLE[i]) or (HOY_BATTERY_MODE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]):
-            continue
-        minWatt = minWatt + GetMinWatt(i)
-    return minWatt
+    return FLEET_AGGREGATES.Get().MinWattNonBattery
 
 def GetMinWattFromAllBatteryInverters():
-    minWatt = 0
-    for i in range(INVERTER_COUNT):
-        if (not AVAILABLE[i]) or (not HOY_BATTERY_MODE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]):
-            continue
-        minWatt = minWatt + GetMinWatt(i)
-    return minWatt  
+    return FLEET_AGGREGATES.Get().MinWattBattery
 
 def GetMinWattFromAllBatteryInvertersWithSamePriority(pPriority):
-    minWatt = 0
-    for i in range(INVERTER_COUNT):
-        if (not AVAILABLE[i]) or (not HOY_BATTERY_MODE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]) or (CONFIG_PROVIDER.get_battery_priority(i) != pPriority):
-            continue
-        minWatt = minWatt + GetMinWatt(i)
-    return minWatt  
+    return FLEET_AGGREGATES.Get().MinWattBatteryPrio.get(pPriority, 0)
+
+class FleetAggregates:
+    # sums over all available inverters, per group and per battery priority. They are only calculated again after AVAILABLE,
+    # HOY_BATTERY_GOOD_VOLTAGE, HOY_MAX_WATT or the configuration changed, see Invalidate()
+    def __init__(self, inverter_count: int):
+        self.inverter_count = inverter_count
+        self.Valid = False
+
+    def Invalidate(self):
+        self.Valid = False
+
+    def Get(self):
+        if not self.Valid:
+            self.Update()
+        return self
+
+    def Update(self):
+        self.InverterMinWatt = INVERTERS.min_watt
+        for i in range(self.inverter_count):
+            self.InverterMinWatt[i] = int(HOY_INVERTER_WATT[i] * CONFIG_PROVIDER.get_min_wattage_in_percent(i) / 100)
+        self.MaxWatt = 0
+        self.MaxInverterWatt = 0
+        self.MinWatt = 0
+        self.MaxWattNonBattery = 0
+        self.MinWattNonBattery = 0
+        self.MinWattBattery = 0
+        self.MaxWattBatteryPrio = {}
+        self.MinWattBatteryPrio = {}
+        self.BatteryInvertersPrio = {j: [] for j in range(1, 6)}
+        self.NonBatteryInverters = []
+        for i in range(self.inverter_count):
+            if AVAILABLE[i] and not HOY_BATTERY_MODE[i]:
+                self.NonBatteryInverters.append(i)
+            if (not AVAILABLE[i]) or (not HOY_BATTERY_GOOD_VOLTAGE[i]):
+                continue
+            self.MaxWatt += HOY_MAX_WATT[i]
+            self.MaxInverterWatt += HOY_INVERTER_WATT[i]
+            self.MinWatt += self.InverterMinWatt[i]
+            if not HOY_BATTERY_MODE[i]:
+                self.MaxWattNonBattery += HOY_MAX_WATT[i]
+                self.MinWattNonBattery += self.InverterMinWatt[i]
+                continue
+            Priority = CONFIG_PROVIDER.get_battery_priority(i)
+            self.MinWattBattery += self.InverterMinWatt[i]
+            self.MaxWattBatteryPrio[Priority] = self.MaxWattBatteryPrio.get(Priority, 0) + HOY_MAX_WATT[i]
+            self.MinWattBatteryPrio[Priority] = self.MinWattBatteryPrio.get(Priority, 0) + self.InverterMinWatt[i]
+            if Priority in self.BatteryInvertersPrio:
+                self.BatteryInvertersPrio[Priority].append(i)
+        self.Valid = True
+
+class ControlSettings:
+    # control points of one cycle, they can be changed by the config provider (e.g. MQTT)
+    def __init__(self):
+        self.JumpToLimitPercent = CONFIG_PROVIDER.on_grid_usage_jump_to_limit_percent()
+        self.FastLimitDecrease = CONFIG_PROVIDER.on_grid_feed_fast_limit_decrease()
+        self.TargetPoint = CONFIG_PROVIDER.get_powermeter_target_point()
+        self.MaxPoint = CONFIG_PROVIDER.get_powermeter_max_point()
+        self.MinPoint = CONFIG_PROVIDER.get_powermeter_min_point()
+        self.Tolerance = CONFIG_PROVIDER.get_powermeter_tolerance()
+        if self.MaxPoint < (self.TargetPoint + self.Tolerance):
+            self.MaxPoint = self.TargetPoint + self.Tolerance + 50
+            logger.info(
+                'Warning: POWERMETER_MAX_POINT < POWERMETER_TARGET_POINT + POWERMETER_TOLERANCE. Setting POWERMETER_MAX_POINT to ' + str(
+                    self.MaxPoint))
+
+class Controller(ABC):
+    # calculates the limit setpoint of all inverters, the setpoint is clamped to the min/max watt of the inverters afterwards
+    def PollSetpoint(self, pPreviousSetpoint, pPowermeterWatts, pSettings: ControlSettings):
+        # called for every powermeter reading during the loop interval. A setpoint is sent at once and ends the polling,
+        # None waits for the end of the interval.
+        # Immediate reaction of all controllers: above POWERMETER_MAX_POINT the limit is raised (or jumps to
+        # ON_GRID_USAGE_JUMP_TO_LIMIT_PERCENT) and the cycle ends, below POWERMETER_MIN_POINT it is reduced if
+        # ON_GRID_FEED_FAST_LIMIT_DECREASE is set.
+        if pPowermeterWatts > pSettings.MaxPoint:
+            if pSettings.JumpToLimitPercent > 0:
+                Setpoint = CastToInt(GetMaxInverterWattFromAllInverters() * pSettings.JumpToLimitPercent / 100)
+                if (Setpoint <= pPreviousSetpoint) and (pSettings.JumpToLimitPercent != 100):
+                    Setpoint = pPreviousSetpoint + pPowermeterWatts - pSettings.TargetPoint
+            else:
+                Setpoint = pPreviousSetpoint + pPowermeterWatts - pSettings.TargetPoint
+            return Setpoint
+        if (pPowermeterWatts < pSettings.MinPoint) and pSettings.FastLimitDecrease:
+            return pPreviousSetpoint + pPowermeterWatts - pSettings.TargetPoint
+        return None
+
+    def NeedsActualPower(self, pPreviousSetpoint):
+        # True if CycleSetpoint uses the actual production (intermediate meter or DTU)
+        return False
+
+    @abstractmethod
+    def CycleSetpoint(self, pPreviousSetpoint, pSetpoint, pSample: CycleSample, pSettings: ControlSettings):
+        # called at the end of the loop interval, None keeps the limit
+        pass
+
+class HeuristicController(Controller):
+    # the rule based control: correct the limit by the deviation from the target point, approximate large reductions
+    # in several passes (SLOW_APPROX_*) and jump on grid usage (ON_GRID_USAGE_JUMP_TO_LIMIT_PERCENT, see PollSetpoint)
+    def NeedsActualPower(self, pPreviousSetpoint):
+        return pPreviousSetpoint >= GetMaxWattFromAllInverters()
+
+    def CycleSetpoint(self, pPreviousSetpoint, pSetpoint, pSample: CycleSample, pSettings: ControlSettings):
+        powermeterWatts = pSample.PowermeterWatts
+        newLimitSetpoint = pSetpoint
+        # producing too much power: reduce limit
+        if powermeterWatts < (pSettings.TargetPoint - pSettings.Tolerance):
+            if pPreviousSetpoint >= GetMaxWattFromAllInverters():
+                hoymilesActualPower = pSample.GetActualPower()
+                newLimitSetpoint = hoymilesActualPower + powermeterWatts - pSettings.TargetPoint
+                LimitDifference = abs(hoymilesActualPower - newLimitSetpoint)
+                if LimitDifference > SLOW_APPROX_LIMIT:
+                    newLimitSetpoint = newLimitSetpoint + (LimitDifference * SLOW_APPROX_FACTOR_IN_PERCENT / 100)
+                if newLimitSetpoint > hoymilesActualPower:
+                    newLimitSetpoint = hoymilesActualPower
+                logger.info("overproducing: reduce limit based on actual power")
+            else:
+                newLimitSetpoint = pPreviousSetpoint + powermeterWatts - pSettings.TargetPoint
+                # check if it is necessary to approximate to the setpoint with some more passes. this reduce overshoot
+                LimitDifference = abs(pPreviousSetpoint - newLimitSetpoint)
+                if LimitDifference > SLOW_APPROX_LIMIT:
+                    logger.info("overproducing: reduce limit based on previous limit setpoint by approximation")
+                    newLimitSetpoint = newLimitSetpoint + (LimitDifference * SLOW_APPROX_FACTOR_IN_PERCENT / 100)
+                else:
+                    logger.info("overproducing: reduce limit based on previous limit setpoint")
+
+        # producing too little power: increase limit
+        elif powermeterWatts > (pSettings.TargetPoint + pSettings.Tolerance):
+            if pPreviousSetpoint < GetMaxWattFromAllInverters():
+                newLimitSetpoint = pPreviousSetpoint + powermeterWatts - pSettings.TargetPoint
+                logger.info("Not enough energy producing: increasing limit")
+            else:
+                logger.info("Not enough energy producing: limit already at maximum")
+        return newLimitSetpoint
+
+class PIDController(Controller):
+    # PID control of the grid power in incremental (velocity) form, once per loop interval:
+    # setpoint = base + KP * (error - last error) + KI * error + KD * (change of the grid power - last change),
+    # error = grid power - target point, the gains are per loop interval.
+    # The base is the current limit, with feed forward the actual production (intermediate powermeter or DTU), so the
+    # limit follows what the inverters really produce. The integral is the setpoint itself: it is clamped to the
+    # min/max watt of the inverters and can not wind up, a limit set outside of the controller (poll loop,
+    # CutLimitToProduction) is taken over without a jump. Within the tolerance the limit is kept.
+    # Grid usage above POWERMETER_MAX_POINT and feed-in below POWERMETER_MIN_POINT are handled immediately by the
+    # poll loop (Controller.PollSetpoint), as with the heuristic.
+    def __init__(self, pKp: float, pKi: float, pKd: float, pFeedForward: bool):
+        self.Kp = pKp
+        self.Ki = pKi
+        self.Kd = pKd
+        self.FeedForward = pFeedForward
+        self.LastError = None
+        self.LastPowermeterWatts = None
+        self.LastChange = 0
+        self.LastOutput = None
+
+    def NeedsActualPower(self, pPreviousSetpoint):
+        return self.FeedForward
+
+    def CycleSetpoint(self, pPreviousSetpoint, pSetpoint, pSample: CycleSample, pSettings: ControlSettings):
+        Error = pSample.PowermeterWatts - pSettings.TargetPoint
+        if self.LastError is None or pSetpoint != self.LastOutput:
+            # start or the limit was changed outside of the controller: no proportional or derivative kick
+            self.LastError = Error
+            self.LastPowermeterWatts = pSample.PowermeterWatts
+            self.LastChange = 0
+        Proportional = self.Kp * (Error - self.LastError)
+        # derivative of the measurement, a new target point does not cause a kick
+        Change = pSample.PowermeterWatts - self.LastPowermeterWatts
+        Derivative = self.Kd * (Change - self.LastChange)
+        self.LastError = Error
+        self.LastPowermeterWatts = pSample.PowermeterWatts
+        self.LastChange = Change
+        if abs(Error) <= pSettings.Tolerance:
+            self.LastOutput = pSetpoint
+            return pSetpoint
+
+        Base = pSample.GetActualPower() if self.FeedForward else pSetpoint
+        Output = Base + Proportional + self.Ki * Error + Derivative
+        self.LastOutput = CastToInt(max(min(Output, GetMaxWattFromAllInverters()), GetMinWattFromAllInverters()))
+        logger.info("PID: error %s Watt, base %s Watt: limit %s Watt", CastToInt(Error), CastToInt(Base), self.LastOutput)
+        return self.LastOutput
+
+def SubmitInBackground(pFunction, *args):
+    # the control loop does not wait for the result, an exception is logged when the call is done
+    Future = ENGINE.submit(ENGINE.call(pFunction, *args))
+    Future.add_done_callback(lambda pFuture: LogBackgroundException(pFunction.__qualname__, pFuture))
+    return Future
+
+def LogBackgroundException(pName, pFuture):
+    if pFuture.cancelled() or pFuture.exception() is None:
+        return
+    logger.error("Exception at %s", pName)
+    logger.error(pFuture.exception())
 
 def PublishConfigState():
     if MQTT is None:
         return
+    if ENGINE is not None:
+        # publish in the background, the control loop does not wait for it
+        SubmitInBackground(PublishConfigStateNow)
+        return
+    PublishConfigStateNow()
+
+def PublishConfigStateNow():
     MQTT.publish_state("on_grid_usage_jump_to_limit_percent", CONFIG_PROVIDER.on_grid_usage_jump_to_limit_percent())
     MQTT.publish_state("on_grid_feed_fast_limit_decrease", CONFIG_PROVIDER.on_grid_feed_fast_limit_decrease())
     MQTT.publish_state("powermeter_target_point", CONFIG_PROVIDER.get_powermeter_target_point())
@@ -554,6 +829,18 @@ def PublishConfigState():
         MQTT.publish_inverter_state(i, "reduce_watt", CONFIG_PROVIDER.get_reduce_wattage(i))
         MQTT.publish_inverter_state(i, "battery_priority", CONFIG_PROVIDER.get_battery_priority(i))
 
+def PublishCycleTiming():
+    if MQTT is None or TIMING_PUBLISH_INTERVAL_IN_SECONDS <= 0:
+        return
+    if time.time() < PublishCycleTiming.NextPublish:
+        return
+    PublishCycleTiming.NextPublish = time.time() + TIMING_PUBLISH_INTERVAL_IN_SECONDS
+    if ENGINE is not None:
+        SubmitInBackground(CYCLE_TIMER.publish, MQTT.publish_state)
+        return
+    CYCLE_TIMER.publish(MQTT.publish_state)
+PublishCycleTiming.NextPublish = 0
+
 def PublishGlobalState(state_name, state_value):
     if MQTT is None:
         return
@@ -564,10 +851,24 @@ def PublishInverterState(inverter_idx, state_name, state_value):
         return
     MQTT.publish_inverter_state(inverter_idx, state_name, state_value)
 
+def CreateSession(pPoolMaxSize: int = 2):
+    # keep-alive connections of a single device, with the same retry settings as the shared session
+    deviceSession = Session()
+    deviceAdapter = InstrumentedHTTPAdapter(METRICS, max_retries=retry, pool_connections=1, pool_maxsize=pPoolMaxSize)
+    deviceSession.mount('http://', deviceAdapter)
+    deviceSession.mount('https://', deviceAdapter)
+    return deviceSession
+
 class Powermeter:
     def GetPowermeterWatts(self) -> int:
         raise NotImplementedError()
 
+    def WaitForNewValue(self, pTimeoutInS: float, pPollIntervalInS: float) -> bool:
+        # blocks until a new value can be read, returns False if no new value arrived within the timeout.
+        # powermeters without push support are polled.
+        time.sleep(max(0, min(pTimeoutInS, pPollIntervalInS)))
+        return True
+
 class Tasmota(Powermeter):
     def __init__(self, ip: str, user: str, password: str, json_status: str, json_payload_mqtt_prefix: str, json_power_mqtt_label: str, json_power_input_mqtt_label: str, json_power_output_mqtt_label: str, json_power_calculate: bool):
         self.ip = ip
@@ -602,16 +903,20 @@ class Shelly(Powermeter):
         self.user = user
         self.password = password
         self.emeterindex = emeterindex
+        # small pool: a meter is read by the control loop and by at most one background read
+        self.session = CreateSession(2)
+        # the digest auth object keeps the nonce and the nonce count, so only the first request gets the 401 challenge
+        self.digest_auth = HTTPDigestAuth(self.user, self.password)
 
     def GetJson(self, path):
         url = f'http://{self.ip}{path}'
         headers = {"content-type": "application/json"}
-        return session.get(url, headers=headers, auth=(self.user, self.password), timeout=10).json()
+        return self.session.get(url, headers=headers, auth=(self.user, self.password), timeout=10).json()
 
     def GetRpcJson(self, path):
         url = f'http://{self.ip}/rpc{path}'
         headers = {"content-type": "application/json"}
-        return session.get(url, headers=headers, auth=HTTPDigestAuth(self.user, self.password), timeout=10).json()
+        return self.session.get(url, headers=headers, auth=self.digest_auth, timeout=10).json()
 
     def GetPowermeterWatts(self) -> int:
         raise NotImplementedError()
@@ -775,14 +1080,64 @@ class DebugReader(Powermeter):
         return CastToInt(input("Enter Powermeter Watts: "))
 
 class DTU(Powermeter):
-    def __init__(self, inverter_count: int):
+    def __init__(self, inverter_count: int, parallel_workers: int = 1, inverter_ids: list = None):
         self.inverter_count = inverter_count
+        # ids of the inverters connected to this DTU, the position in this list is the id used by the DTU itself
+        self.inverter_ids = list(range(inverter_count)) if inverter_ids is None else list(inverter_ids)
+        self.LocalIds = {pInverterId: LocalId for LocalId, pInverterId in enumerate(self.inverter_ids)}
+        # bounded thread pool to wait for the acknowledges of several inverters at once
+        self.executor = None
+        if parallel_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=parallel_workers, thread_name_prefix=self.__class__.__name__)
+        # snapshot of the documents read in the current control cycle, see InvalidateCache()
+        self.Cache = {}
+        self.CacheLock = threading.Lock()
+
+    def GetJson(self, path):
+        raise NotImplementedError()
+
+    def GetCachedValue(self, key, loader):
+        # every value is loaded at most once per snapshot, concurrent readers wait for the same request
+        with self.CacheLock:
+            future = self.Cache.get(key)
+            owner = future is None
+            if owner:
+                future = self.Cache[key] = Future()
+        if owner:
+            try:
+                future.set_result(loader())
+            except Exception as e:
+                with self.CacheLock:
+                    if self.Cache.get(key) is future:
+                        del self.Cache[key]
+                future.set_exception(e)
+        return future.result()
+
+    def GetCachedJson(self, path):
+        return self.GetCachedValue(path, lambda: self.GetJson(path))
+
+    def InvalidateCache(self):
+        # called at the start of every control cycle, after the powermeter polling and after every command sent to the DTU
+        with self.CacheLock:
+            self.Cache = {}
+
+    def PrefetchStatus(self):
+        # loads the status of all inverters (see GetAvailable) into the cache
+        return
+
+    def GetLocalId(self, pInverterId: int):
+        return self.LocalIds[pInverterId]
 
     def GetACPower(self, pInverterId: int):
         raise NotImplementedError()
 
+    def GetProducingInverters(self):
+        return [pInverterId for pInverterId in self.inverter_ids if AVAILABLE[pInverterId] and HOY_BATTERY_GOOD_VOLTAGE[pInverterId]]
+
     def GetPowermeterWatts(self):
-        return sum(self.GetACPower(pInverterId) for pInverterId in range(self.inverter_count) if AVAILABLE[pInverterId] and HOY_BATTERY_GOOD_VOLTAGE[pInverterId])
+        if self.IsParallel():
+            return sum(self.executor.map(self.GetACPower, self.GetProducingInverters()))
+        return sum(self.GetACPower(pInverterId) for pInverterId in self.GetProducingInverters())
     
     def CheckMinVersion(self):
         raise NotImplementedError()
@@ -804,6 +1159,23 @@ class DTU(Powermeter):
     
     def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
         raise NotImplementedError()
+
+    def IsLimitAcknowledged(self, pInverterId: int):
+        # one status request without waiting, None if the state is not known yet
+        raise NotImplementedError()
+
+    def IsParallel(self):
+        return self.executor is not None
+
+    def TimedWaitForAck(self, pInverterId: int, pTimeoutInS: int):
+        with CYCLE_TIMER.span('wait_for_ack', InverterTimingKey(pInverterId)):
+            return self.WaitForAck(pInverterId, pTimeoutInS)
+
+    def WaitForAcks(self, pInverterIds: list, pTimeoutInS: int):
+        if not self.IsParallel():
+            return {pInverterId: self.TimedWaitForAck(pInverterId, pTimeoutInS) for pInverterId in pInverterIds}
+        acks = self.executor.map(lambda pInverterId: self.TimedWaitForAck(pInverterId, pTimeoutInS), pInverterIds)
+        return dict(zip(pInverterIds, acks))
     
     def SetLimit(self, pInverterId: int, pLimit: int):
         raise NotImplementedError()
@@ -812,11 +1184,13 @@ class DTU(Powermeter):
         raise NotImplementedError()
     
 class AhoyDTU(DTU):
-    def __init__(self, inverter_count: int, ip: str, password: str):
-        super().__init__(inverter_count)
+    def __init__(self, inverter_count: int, ip: str, password: str, parallel_workers: int = 1, inverter_ids: list = None):
+        super().__init__(inverter_count, parallel_workers, inverter_ids)
         self.ip = ip
         self.password = password
         self.Token = ''
+        self.AhoyVersion = ''
+        self.FieldNames = {}
 
     def GetJson(self, path):
         url = f'http://{self.ip}{path}'
@@ -832,11 +1206,53 @@ class AhoyDTU(DTU):
         url = f'http://{self.ip}{path}'
         return session.post(url, json = obj, timeout=10).json()
 
-    def GetACPower(self, pInverterId):
+    def UpdateFieldNames(self):
         ParsedData = self.GetJson('/api/live')
-        ActualPower_index = ParsedData["ch0_fld_names"].index("P_AC")
-        ParsedData = self.GetJson(f'/api/inverter/id/{pInverterId}')
-        return CastToInt(ParsedData["ch"][0][ActualPower_index])
+        # checked first, the version change must not clear the field names that are loaded here
+        self.CheckVersionChange(self.GetGenericVersion(ParsedData))
+        self.FieldNames = {
+            'ch0_fld_names': ParsedData['ch0_fld_names'],
+            'fld_names': ParsedData['fld_names'],
+        }
+        logger.info('Ahoy: Field names loaded')
+
+    @staticmethod
+    def GetGenericVersion(ParsedData):
+        try:
+            return str(ParsedData["generic"]["version"])
+        except (KeyError, TypeError):
+            return None
+
+    def CheckVersionChange(self, pAhoyVersion: str):
+        # field names are only read once, a new Ahoy version could change their order
+        if pAhoyVersion is None:
+            return
+        if self.AhoyVersion and pAhoyVersion != self.AhoyVersion:
+            logger.info('Ahoy: Version changed from %s to %s, reload field names', self.AhoyVersion, pAhoyVersion)
+            self.FieldNames = {}
+        self.AhoyVersion = pAhoyVersion
+
+    def GetFieldIndex(self, pListName: str, pFieldName: str):
+        if pListName not in self.FieldNames:
+            self.UpdateFieldNames()
+        try:
+            return self.FieldNames[pListName].index(pFieldName)
+        except ValueError:
+            # lookup failed, maybe the field names are outdated
+            self.UpdateFieldNames()
+            return self.FieldNames[pListName].index(pFieldName)
+
+    def GetChannelValue(self, ParsedData, pChannel: int, pFieldName: str):
+        ListName = 'ch0_fld_names' if pChannel == 0 else 'fld_names'
+        try:
+            return ParsedData['ch'][pChannel][self.GetFieldIndex(ListName, pFieldName)]
+        except IndexError:
+            self.FieldNames = {}
+            return ParsedData['ch'][pChannel][self.GetFieldIndex(ListName, pFieldName)]
+
+    def GetACPower(self, pInverterId):
+        ParsedData = self.GetCachedJson(f'/api/inverter/id/{self.GetLocalId(pInverterId)}')
+        return CastToInt(self.GetChannelValue(ParsedData, 0, "P_AC"))
 
     def CheckMinVersion(self):
         MinVersion = '0.8.80'
@@ -846,50 +1262,46 @@ class AhoyDTU(DTU):
         except:
             AhoyVersion = str((ParsedData["generic"]["version"]))
         logger.info('Ahoy: Current Version: %s',AhoyVersion)
+        self.CheckVersionChange(AhoyVersion)
         if version.parse(AhoyVersion) < version.parse(MinVersion):
             logger.error('Error: Your AHOY Version is too old! Please update at least to Version %s - you can find the newest dev-releases here: https://github.com/lumapu/ahoy/actions',MinVersion)
             quit()
 
+    def PrefetchStatus(self):
+        self.GetCachedJson('/api/index')
+
     def GetAvailable(self, pInverterId: int):
-        ParsedData = self.GetJson('/api/index')
-        Available = bool(ParsedData["inverter"][pInverterId]["is_avail"])
+        ParsedData = self.GetCachedJson('/api/index')
+        self.CheckVersionChange(self.GetGenericVersion(ParsedData))
+        Available = bool(ParsedData["inverter"][self.GetLocalId(pInverterId)]["is_avail"])
         logger.info('Ahoy: Inverter "%s" Available: %s',NAME[pInverterId], Available)
         return Available
 
     def GetActualLimitInW(self, pInverterId: int):
-        ParsedData = self.GetJson(f'/api/inverter/id/{pInverterId}')
+        ParsedData = self.GetCachedJson(f'/api/inverter/id/{self.GetLocalId(pInverterId)}')
         LimitInPercent = float(ParsedData['power_limit_read'])
         LimitInW = HOY_INVERTER_WATT[pInverterId] * LimitInPercent / 100
         return LimitInW
 
     def GetInfo(self, pInverterId: int):
-        ParsedData = self.GetJson('/api/live')
-        temp_index = ParsedData["ch0_fld_names"].index("Temp")
-        
-        ParsedData = self.GetJson(f'/api/inverter/id/{pInverterId}')
+        ParsedData = self.GetCachedJson(f'/api/inverter/id/{self.GetLocalId(pInverterId)}')
         SERIAL_NUMBER[pInverterId] = str(ParsedData['serial'])
         NAME[pInverterId] = str(ParsedData['name'])
-        TEMPERATURE[pInverterId] = str(ParsedData["ch"][0][temp_index]) + ' degC'
+        TEMPERATURE[pInverterId] = str(self.GetChannelValue(ParsedData, 0, "Temp")) + ' degC'
         logger.info('Ahoy: Inverter "%s" / serial number "%s" / temperature %s',NAME[pInverterId],SERIAL_NUMBER[pInverterId],TEMPERATURE[pInverterId])
 
     def GetTemperature(self, pInverterId: int):
-        ParsedData = self.GetJson('/api/live')
-        temp_index = ParsedData["ch0_fld_names"].index("Temp")
-
-        ParsedData = self.GetJson(f'/api/inverter/id/{pInverterId}')
-        TEMPERATURE[pInverterId] = str(ParsedData["ch"][0][temp_index]) + ' degC'
+        ParsedData = self.GetCachedJson(f'/api/inverter/id/{self.GetLocalId(pInverterId)}')
+        TEMPERATURE[pInverterId] = str(self.GetChannelValue(ParsedData, 0, "Temp")) + ' degC'
         logger.info('Ahoy: Inverter "%s" temperature: %s',NAME[pInverterId],TEMPERATURE[pInverterId])
 
     def GetPanelMinVoltage(self, pInverterId: int):
-        ParsedData = self.GetJson('/api/live')
-        PanelVDC_index = ParsedData["fld_names"].index("U_DC")
-
-        ParsedData = self.GetJson(f'/api/inverter/id/{pInverterId}')
+        ParsedData = self.GetCachedJson(f'/api/inverter/id/{self.GetLocalId(pInverterId)}')
         PanelVDC = []
         ExcludedPanels = GetNumberArray(HOY_BATTERY_IGNORE_PANELS[pInverterId])
         for i in range(1, len(ParsedData['ch']), 1):
             if i not in ExcludedPanels:
-                PanelVDC.append(float(ParsedData['ch'][i][PanelVDC_index]))
+                PanelVDC.append(float(self.GetChannelValue(ParsedData, i, "U_DC")))
         minVdc = float('inf')
         for i in range(len(PanelVDC)):
             if (minVdc > PanelVDC[i]) and (PanelVDC[i] > 5):
@@ -897,14 +1309,9 @@ class AhoyDTU(DTU):
         if minVdc == float('inf'):
             minVdc = 0
 
-        # save last 5 min-values in list and return the "highest" value.
-        HOY_PANEL_VOLTAGE_LIST[pInverterId].append(minVdc)
-        if len(HOY_PANEL_VOLTAGE_LIST[pInverterId]) > 5:
-            HOY_PANEL_VOLTAGE_LIST[pInverterId].pop(0)
-        max_value = None
-        for num in HOY_PANEL_VOLTAGE_LIST[pInverterId]:
-            if (max_value is None or num > max_value):
-                max_value = num
+        # save last 5 min-values and return the "highest" value.
+        HOY_PANEL_VOLTAGE_LIST[pInverterId].add(minVdc)
+        max_value = HOY_PANEL_VOLTAGE_LIST[pInverterId].max()
 
         logger.info('Lowest panel voltage inverter "%s": %s Volt',NAME[pInverterId],max_value)
         return max_value
@@ -915,8 +1322,7 @@ class AhoyDTU(DTU):
             timeout_start = time.time()
             while time.time() < timeout_start + timeout:
                 time.sleep(0.5)
-                ParsedData = self.GetJson(f'/api/inverter/id/{pInverterId}')
-                ack = bool(ParsedData['power_limit_ack'])
+                ack = self.IsLimitAcknowledged(pInverterId)
                 if ack:
                     break
             if ack:
@@ -930,10 +1336,14 @@ class AhoyDTU(DTU):
             else:
                 logger.error('Ahoy: Inverter "%s" WaitForAck: "%s"', NAME[pInverterId], e)
             return False
+
+    def IsLimitAcknowledged(self, pInverterId: int):
+        ParsedData = self.GetJson(f'/api/inverter/id/{self.GetLocalId(pInverterId)}')
+        return bool(ParsedData['power_limit_ack'])
     
     def SetLimit(self, pInverterId: int, pLimit: int):
         logger.info('Ahoy: Inverter "%s": setting new limit from %s Watt to %s Watt',NAME[pInverterId],CastToInt(CURRENT_LIMIT[pInverterId]),CastToInt(pLimit))
-        myobj = {'cmd': 'limit_nonpersistent_absolute', 'val': pLimit, "id": pInverterId, "token": self.Token}
+        myobj = {'cmd': 'limit_nonpersistent_absolute', 'val': pLimit, "id": self.GetLocalId(pInverterId), "token": self.Token}
         response = self.GetResponseJson('/api/ctrl', myobj)
         if response["success"] == False and response["error"] == "ERR_PROTECTED":
             self.Authenticate()
@@ -942,13 +1352,14 @@ class AhoyDTU(DTU):
         if response["success"] == False:
             raise Exception("Error: SetLimitAhoy Request error")
         CURRENT_LIMIT[pInverterId] = pLimit
+        self.InvalidateCache()
 
     def SetPowerStatus(self, pInverterId: int, pActive: bool):
         if pActive:
             logger.info('Ahoy: Inverter "%s": Turn on',NAME[pInverterId])
         else:
             logger.info('Ahoy: Inverter "%s": Turn off',NAME[pInverterId])
-        myobj = {'cmd': 'power', 'val': CastToInt(pActive == True), "id": pInverterId, "token": self.Token}
+        myobj = {'cmd': 'power', 'val': CastToInt(pActive == True), "id": self.GetLocalId(pInverterId), "token": self.Token}
         response = self.GetResponseJson('/api/ctrl', myobj)
         if response["success"] == False and response["error"] == "ERR_PROTECTED":
             self.Authenticate()
@@ -956,6 +1367,7 @@ class AhoyDTU(DTU):
             return
         if response["success"] == False:
             raise Exception("Error: SetPowerStatus Request error")
+        self.InvalidateCache()
 
     def Authenticate(self):
         logger.info('Ahoy: Authenticating...')
@@ -967,11 +1379,17 @@ class AhoyDTU(DTU):
         logger.info('Ahoy: Authenticating successful, received Token: %s', self.Token)
 
 class OpenDTU(DTU):
-    def __init__(self, inverter_count: int, ip: str, user: str, password: str):
-        super().__init__(inverter_count)
+    # a limit status older than this is read again, WaitForAck polls in the same interval
+    LIMIT_STATUS_MAX_AGE_IN_SECONDS = 0.5
+
+    def __init__(self, inverter_count: int, ip: str, user: str, password: str, parallel_workers: int = 1, inverter_ids: list = None):
+        super().__init__(inverter_count, parallel_workers, inverter_ids)
         self.ip = ip
         self.user = user
         self.password = password
+        self.LimitStatus = LimitStatusPoller(lambda: self.GetJson('/api/limit/status'))
+        # inverter id -> time of the last limit command, an acknowledge is only read from a newer status
+        self.LimitSentAt = {}
 
     def GetJson(self, path):
         url = f'http://{self.ip}{path}'
@@ -982,9 +1400,34 @@ class OpenDTU(DTU):
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         return session.post(url=url, headers=headers, data=sendStr, auth=HTTPBasicAuth(self.user, self.password), timeout=10).json()
 
+    def GetFleetData(self):
+        # one /api/livedata/status response contains all inverters, it is parsed once per snapshot
+        return self.GetCachedValue('fleet', lambda: {str(inverter['serial']): inverter for inverter in self.GetCachedJson('/api/livedata/status')['inverters']})
+
+    def PrefetchStatus(self):
+        self.GetFleetData()
+
+    def GetInverterData(self, pInverterId: int):
+        if SERIAL_NUMBER[pInverterId] == '':
+            # serial number not yet known (see GetInfo), use the position in the inverter list
+            return self.GetCachedJson('/api/livedata/status')['inverters'][self.GetLocalId(pInverterId)]
+        InverterData = self.GetFleetData().get(SERIAL_NUMBER[pInverterId])
+        if InverterData is None:
+            raise Exception(f'Error: OpenDTU: Inverter with serial number "{SERIAL_NUMBER[pInverterId]}" not found')
+        return InverterData
+
+    def GetInverterDetails(self, pInverterId: int):
+        # depending on the OpenDTU version the fleet response only contains a summary without AC/DC/INV values.
+        # Current versions have no request for the details of all inverters, they are read with one request per
+        # inverter (cached per snapshot), so power, temperature and panel voltage still cost a request per inverter.
+        InverterData = self.GetInverterData(pInverterId)
+        if 'AC' in InverterData:
+            return InverterData
+        return self.GetCachedJson(f'/api/livedata/status?inv={SERIAL_NUMBER[pInverterId]}')['inverters'][0]
+
     def GetACPower(self, pInverterId):
-        ParsedData = self.GetJson(f'/api/livedata/status?inv={SERIAL_NUMBER[pInverterId]}')
-        return CastToInt(ParsedData['inverters'][0]['AC']['0']['Power']['v'])
+        InverterData = self.GetInverterDetails(pInverterId)
+        return CastToInt(InverterData['AC']['0']['Power']['v'])
     
     def CheckMinVersion(self):
         MinVersion = 'v24.2.12'
@@ -998,39 +1441,41 @@ class OpenDTU(DTU):
             quit()
 
     def GetAvailable(self, pInverterId: int):
-        ParsedData = self.GetJson(f'/api/livedata/status?inv={SERIAL_NUMBER[pInverterId]}')
-        Reachable = bool(ParsedData['inverters'][0]["reachable"])
+        Reachable = bool(self.GetInverterData(pInverterId)["reachable"])
         logger.info('OpenDTU: Inverter "%s" reachable: %s',NAME[pInverterId],Reachable)
         return Reachable
     
+    def GetLimitStatus(self, pInverterId: int):
+        NotBefore = max(time.time() - self.LIMIT_STATUS_MAX_AGE_IN_SECONDS, self.LimitSentAt.get(pInverterId, 0))
+        return self.LimitStatus.get(NotBefore)[SERIAL_NUMBER[pInverterId]]
+
     def GetActualLimitInW(self, pInverterId: int):
-        ParsedData = self.GetJson('/api/limit/status')
-        limit_relative = float(ParsedData[SERIAL_NUMBER[pInverterId]]['limit_relative'])
+        limit_relative = float(self.GetLimitStatus(pInverterId)['limit_relative'])
         LimitInW = HOY_INVERTER_WATT[pInverterId] * limit_relative / 100
         return LimitInW
     
     def GetInfo(self, pInverterId: int):
         if SERIAL_NUMBER[pInverterId] == '':
-            ParsedData = self.GetJson('/api/livedata/status')
-            SERIAL_NUMBER[pInverterId] = str(ParsedData['inverters'][pInverterId]['serial'])
+            ParsedData = self.GetCachedJson('/api/livedata/status')
+            SERIAL_NUMBER[pInverterId] = str(ParsedData['inverters'][self.GetLocalId(pInverterId)]['serial'])
 
-        ParsedData = self.GetJson(f'/api/livedata/status?inv={SERIAL_NUMBER[pInverterId]}')
-        TEMPERATURE[pInverterId] = str(round(float((ParsedData['inverters'][0]['INV']['0']['Temperature']['v'])),1)) + ' degC'
-        NAME[pInverterId] = str(ParsedData['inverters'][0]['name'])
+        InverterData = self.GetInverterDetails(pInverterId)
+        TEMPERATURE[pInverterId] = str(round(float((InverterData['INV']['0']['Temperature']['v'])),1)) + ' degC'
+        NAME[pInverterId] = str(InverterData['name'])
         logger.info('OpenDTU: Inverter "%s" / serial number "%s" / temperature %s',NAME[pInverterId],SERIAL_NUMBER[pInverterId],TEMPERATURE[pInverterId])
 
     def GetTemperature(self, pInverterId: int):
-        ParsedData = self.GetJson(f'/api/livedata/status?inv={SERIAL_NUMBER[pInverterId]}')
-        TEMPERATURE[pInverterId] = str(round(float((ParsedData['inverters'][0]['INV']['0']['Temperature']['v'])),1)) + ' degC'
+        InverterData = self.GetInverterDetails(pInverterId)
+        TEMPERATURE[pInverterId] = str(round(float((InverterData['INV']['0']['Temperature']['v'])),1)) + ' degC'
         logger.info('OpenDTU: Inverter "%s" temperature: %s',NAME[pInverterId],TEMPERATURE[pInverterId])
 
     def GetPanelMinVoltage(self, pInverterId: int):
-        ParsedData = self.GetJson(f'/api/livedata/status?inv={SERIAL_NUMBER[pInverterId]}')
+        InverterData = self.GetInverterDetails(pInverterId)
         PanelVDC = []
         ExcludedPanels = GetNumberArray(HOY_BATTERY_IGNORE_PANELS[pInverterId])
-        for i in range(len(ParsedData['inverters'][0]['DC'])):
+        for i in range(len(InverterData['DC'])):
             if i not in ExcludedPanels:
-                PanelVDC.append(float(ParsedData['inverters'][0]['DC'][str(i)]['Voltage']['v']))
+                PanelVDC.append(float(InverterData['DC'][str(i)]['Voltage']['v']))
         minVdc = float('inf')
         for i in range(len(PanelVDC)):
             if (minVdc > PanelVDC[i]) and (PanelVDC[i] > 5):
@@ -1038,14 +1483,9 @@ class OpenDTU(DTU):
         if minVdc == float('inf'):
             minVdc = 0
 
-        # save last 5 min-values in list and return the "highest" value.
-        HOY_PANEL_VOLTAGE_LIST[pInverterId].append(minVdc)
-        if len(HOY_PANEL_VOLTAGE_LIST[pInverterId]) > 5:
-            HOY_PANEL_VOLTAGE_LIST[pInverterId].pop(0)
-        max_value = None
-        for num in HOY_PANEL_VOLTAGE_LIST[pInverterId]:
-            if (max_value is None or num > max_value):
-                max_value = num
+        # save last 5 min-values and return the "highest" value.
+        HOY_PANEL_VOLTAGE_LIST[pInverterId].add(minVdc)
+        max_value = HOY_PANEL_VOLTAGE_LIST[pInverterId].max()
 
         return max_value
 
@@ -1055,8 +1495,7 @@ class OpenDTU(DTU):
             timeout_start = time.time()
             while time.time() < timeout_start + timeout:
                 time.sleep(0.5)
-                ParsedData = self.GetJson('/api/limit/status')
-                ack = (ParsedData[SERIAL_NUMBER[pInverterId]]['limit_set_status'] == 'Ok')
+                ack = self.IsLimitAcknowledged(pInverterId)
                 if ack:
                     break
             if ack:
@@ -1071,14 +1510,19 @@ class OpenDTU(DTU):
                 logger.error('OpenDTU: Inverter "%s" WaitForAck: "%s"', NAME[pInverterId], e)
             return False
 
+    def IsLimitAcknowledged(self, pInverterId: int):
+        return self.GetLimitStatus(pInverterId)['limit_set_status'] == 'Ok'
+
     def SetLimit(self, pInverterId: int, pLimit: int):
         logger.info('OpenDTU: Inverter "%s": setting new limit from %s Watt to %s Watt',NAME[pInverterId],CastToInt(CURRENT_LIMIT[pInverterId]),CastToInt(pLimit))
         relLimit = CastToInt(pLimit / HOY_INVERTER_WATT[pInverterId] * 100)
         mySendStr = f'''data={{"serial":"{SERIAL_NUMBER[pInverterId]}", "limit_type":1, "limit_value":{relLimit}}}'''
+        self.LimitSentAt[pInverterId] = time.time()
         response = self.GetResponseJson('/api/limit/config', mySendStr)
         if response['type'] != 'success':
             raise Exception(f"Error: SetLimit error: {response['message']}")
         CURRENT_LIMIT[pInverterId] = pLimit
+        self.InvalidateCache()
 
     def SetPowerStatus(self, pInverterId: int, pActive: bool):
         if pActive:
@@ -1089,10 +1533,11 @@ class OpenDTU(DTU):
         response = self.GetResponseJson('/api/power/config', mySendStr)
         if response['type'] != 'success':
             raise Exception(f"Error: SetPowerStatus error: {response['message']}")
+        self.InvalidateCache()
         
 class DebugDTU(DTU):
-    def __init__(self, inverter_count: int):
-        super().__init__(inverter_count)
+    def __init__(self, inverter_count: int, parallel_workers: int = 1, inverter_ids: list = None):
+        super().__init__(inverter_count, parallel_workers, inverter_ids)
 
     def GetACPower(self, pInverterId):
         return CastToInt(input("Current AC-Power: "))
@@ -1123,6 +1568,9 @@ class DebugDTU(DTU):
     
     def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
         return True
+
+    def IsLimitAcknowledged(self, pInverterId: int):
+        return True
     
     def SetLimit(self, pInverterId: int, pLimit: int):
         logger.info('Debug: Inverter "%s": setting new limit from %s Watt to %s Watt',NAME[pInverterId],CastToInt(CURRENT_LIMIT[pInverterId]),CastToInt(pLimit))
@@ -1139,25 +1587,234 @@ class DebugDTU(DTU):
         self.Token = '12345'   
         logger.info('Debug: Authenticating successful, received Token: %s', self.Token)        
 
+class MultiDTU(DTU):
+    # several DTUs, every inverter is connected to one of them. Each DTU has its own worker thread: the requests to one
+    # DTU stay in order, the requests to different DTUs overlap. A cycle takes as long as the busiest DTU needs.
+    def __init__(self, inverter_count: int, dtus: list, ack_timeout: int):
+        super().__init__(inverter_count)
+        self.dtus = dtus
+        self.ack_timeout = ack_timeout
+        self.DtuIndex = {}
+        for DtuIndex, dtu in enumerate(dtus):
+            for pInverterId in dtu.inverter_ids:
+                self.DtuIndex[pInverterId] = DtuIndex
+        self.Workers = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'DTU{DtuIndex + 1}') for DtuIndex in range(len(dtus))]
+        self.AckExecutor = ThreadPoolExecutor(max_workers=len(dtus), thread_name_prefix='DTUAck')
+        # inverter id -> future of the last limit command (on sequential DTUs including its acknowledge)
+        self.PendingLimits = {}
+        self.PendingLock = threading.Lock()
+
+    def GetDTU(self, pInverterId: int):
+        return self.dtus[self.DtuIndex[pInverterId]]
+
+    def RunOnAll(self, pFunction):
+        # runs pFunction(dtu) on the worker of every DTU and waits for all results
+        futures = [worker.submit(pFunction, dtu) for dtu, worker in zip(self.dtus, self.Workers)]
+        return [future.result() for future in futures]
+
+    def InvalidateCache(self):
+        for dtu in self.dtus:
+            dtu.InvalidateCache()
+
+    def PrefetchStatus(self):
+        futures = [worker.submit(dtu.PrefetchStatus) for dtu, worker in zip(self.dtus, self.Workers)]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                # not cached, GetAvailable reads it again and logs the error
+                pass
+
+    def GetPowermeterWatts(self):
+        return sum(self.RunOnAll(lambda dtu: dtu.GetPowermeterWatts()))
+
+    def CheckMinVersion(self):
+        self.RunOnAll(lambda dtu: dtu.CheckMinVersion())
+
+    def GetACPower(self, pInverterId: int):
+        return self.GetDTU(pInverterId).GetACPower(pInverterId)
+
+    def GetAvailable(self, pInverterId: int):
+        return self.GetDTU(pInverterId).GetAvailable(pInverterId)
+
+    def GetActualLimitInW(self, pInverterId: int):
+        return self.GetDTU(pInverterId).GetActualLimitInW(pInverterId)
+
+    def GetInfo(self, pInverterId: int):
+        return self.GetDTU(pInverterId).GetInfo(pInverterId)
+
+    def GetTemperature(self, pInverterId: int):
+        return self.GetDTU(pInverterId).GetTemperature(pInverterId)
+
+    def GetPanelMinVoltage(self, pInverterId: int):
+        return self.GetDTU(pInverterId).GetPanelMinVoltage(pInverterId)
+
+    def IsParallel(self):
+        # SetLimit only queues the command, the acknowledges are collected by WaitForAcks
+        return True
+
+    def SendLimit(self, dtu: DTU, pInverterId: int, pLimit: int):
+        dtu.SetLimit(pInverterId, pLimit)
+        if dtu.IsParallel():
+            return None
+        # sequential DTU: wait for the acknowledge before the next command is sent to this DTU
+        return dtu.WaitForAck(pInverterId, self.ack_timeout)
+
+    def SetLimit(self, pInverterId: int, pLimit: int):
+        DtuIndex = self.DtuIndex[pInverterId]
+        future = self.Workers[DtuIndex].submit(self.SendLimit, self.dtus[DtuIndex], pInverterId, pLimit)
+        with self.PendingLock:
+            self.PendingLimits[pInverterId] = future
+
+    def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
+        with self.PendingLock:
+            future = self.PendingLimits.pop(pInverterId, None)
+        ack = future.result() if future is not None else None
+        if ack is None:
+            ack = self.GetDTU(pInverterId).WaitForAck(pInverterId, pTimeoutInS)
+        return ack
+
+    def IsLimitAcknowledged(self, pInverterId: int):
+        with self.PendingLock:
+            future = self.PendingLimits.get(pInverterId)
+            if future is not None:
+                if not future.done():
+                    # the command is still queued or waits for the acknowledge on a sequential DTU
+                    return None
+                del self.PendingLimits[pInverterId]
+        ack = future.result() if future is not None else None
+        if ack is None:
+            ack = self.GetDTU(pInverterId).IsLimitAcknowledged(pInverterId)
+        return ack
+
+    def WaitForDTUAcks(self, dtu: DTU, pInverterIds: list, pTimeoutInS: int):
+        if not dtu.IsParallel():
+            return {pInverterId: self.TimedWaitForAck(pInverterId, pTimeoutInS) for pInverterId in pInverterIds}
+        # parallel DTU: wait until all limits are sent, then for all acknowledges at once
+        with self.PendingLock:
+            futures = [self.PendingLimits.pop(pInverterId, None) for pInverterId in pInverterIds]
+        for future in futures:
+            if future is not None:
+                future.result()
+        return dtu.WaitForAcks(pInverterIds, pTimeoutInS)
+
+    def WaitForAcks(self, pInverterIds: list, pTimeoutInS: int):
+        # the acknowledges of the DTUs are collected concurrently
+        InverterIdsOfDTU = {}
+        for pInverterId in pInverterIds:
+            InverterIdsOfDTU.setdefault(self.DtuIndex[pInverterId], []).append(pInverterId)
+        futures = [self.AckExecutor.submit(self.WaitForDTUAcks, self.dtus[DtuIndex], InverterIds, pTimeoutInS) for DtuIndex, InverterIds in InverterIdsOfDTU.items()]
+        acks = {}
+        for future in futures:
+            acks.update(future.result())
+        return {pInverterId: acks[pInverterId] for pInverterId in pInverterIds}
+
+    def SetPowerStatus(self, pInverterId: int, pActive: bool):
+        # in order with the limit commands of the same DTU
+        DtuIndex = self.DtuIndex[pInverterId]
+        self.Workers[DtuIndex].submit(self.dtus[DtuIndex].SetPowerStatus, pInverterId, pActive).result()
+
 class Script(Powermeter):
-    def __init__(self, file: str, ip: str, user: str, password: str):
+    def __init__(self, file: str, ip: str, user: str, password: str, mode: str = 'once', read_timeout: float = 10):
         self.file = file
         self.ip = ip
         self.user = user
         self.password = password
+        # once: the script is started for every reading
+        # stream: the script is started once and prints a new reading per line
+        # request: the script is started once and prints one reading per line for every line it reads from stdin
+        self.mode = mode.strip().lower()
+        if self.mode not in ('once', 'stream', 'request'):
+            raise Exception(f'Error: unknown SCRIPT_MODE "{mode}", use once, stream or request')
+        self.read_timeout = read_timeout
+        self.process = None
+        self.value = None
+        self.timestamp = 0
+        self.timestamp_consumed = 0
+        self.condition = threading.Condition()
+
+    def StartProcess(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        if self.process is not None:
+            logger.error(f'script {self.file} exited with code {self.process.returncode}, restarting it')
+        process = subprocess.Popen(
+            [self.file, self.ip, self.user, self.password],
+            stdin=subprocess.PIPE if self.mode == 'request' else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        with self.condition:
+            self.process = process
+            self.value = None
+        threading.Thread(target=self.ReadLines, args=(process,), name='Script', daemon=True).start()
+
+    def StopProcess(self):
+        # watchdog: the process is killed and started again with the next reading
+        with self.condition:
+            process = self.process
+            self.process = None
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+
+    def ReadLines(self, pProcess):
+        for line in pProcess.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                value = int(float(line))
+            except ValueError:
+                logger.error(f'script {self.file}: invalid output "{line}"')
+                continue
+            with self.condition:
+                if pProcess is self.process:
+                    self.value = value
+                    self.timestamp = time.monotonic()
+                    self.condition.notify_all()
+        with self.condition:
+            self.condition.notify_all()
+
+    def has_exited(self):
+        return self.process is None or self.process.poll() is not None
 
     def GetPowermeterWatts(self):
-        power = subprocess.check_output([self.file, self.ip, self.user, self.password])
-        return CastToInt(power)
+        if self.mode == 'once':
+            power = subprocess.check_output([self.file, self.ip, self.user, self.password])
+            return CastToInt(power)
+        self.StartProcess()
+        with self.condition:
+            if self.mode == 'request':
+                requested = time.monotonic()
+                try:
+                    self.process.stdin.write('\n')
+                    self.process.stdin.flush()
+                except OSError:
+                    pass
+                has_value = lambda: self.timestamp > requested
+            else:
+                has_value = lambda: self.value is not None and time.monotonic() - self.timestamp <= self.read_timeout
+            self.condition.wait_for(lambda: has_value() or self.has_exited(), timeout=self.read_timeout)
+            if has_value():
+                self.timestamp_consumed = self.timestamp
+                return self.value
+            exited = self.has_exited()
+        self.StopProcess()
+        if exited:
+            raise Exception(f'script {self.file} exited')
+        raise TimeoutError(f'no value from script {self.file} within {self.read_timeout} seconds')
+
+    def WaitForNewValue(self, pTimeoutInS: float, pPollIntervalInS: float) -> bool:
+        if self.mode != 'stream':
+            return super().WaitForNewValue(pTimeoutInS, pPollIntervalInS)
+        self.StartProcess()
+        with self.condition:
+            return self.condition.wait_for(lambda: self.timestamp > self.timestamp_consumed or self.has_exited(), timeout=max(0, pTimeoutInS))
 
 def extract_json_value(data, path):
-    from jsonpath_ng import parse
-    jsonpath_expr = parse(path)
-    match = jsonpath_expr.find(data)
-    if match:
-        return int(float(match[0].value))
-    else:
-        raise ValueError("No match found for the JSON path")
+    return int(float(get_json_path_extractor(path).find(data)))
 
 class MqttPowermeter(Powermeter):
     def __init__(
@@ -1170,6 +1827,8 @@ class MqttPowermeter(Powermeter):
         json_path_outgoing: str = None,
         username: str = None,
         password: str = None,
+        max_value_age: float = 0,
+        new_value_timeout: float = 0,
     ):
         self.broker = broker
         self.port = port
@@ -1181,6 +1840,17 @@ class MqttPowermeter(Powermeter):
         self.password = password
         self.value_incoming = None
         self.value_outgoing = None
+        # time.monotonic() of the last received messages and of the newest message returned by GetPowermeterWatts
+        self.timestamp_incoming = None
+        self.timestamp_outgoing = None
+        self.timestamp_consumed = None
+        self.max_value_age = max_value_age
+        self.new_value_timeout = new_value_timeout
+        self.condition = threading.Condition()
+        # incoming and outgoing power in one message on the same topic, read with different JSON paths
+        self.same_topic = self.topic_outgoing == self.topic_incoming
+        if self.same_topic and (not self.json_path_incoming or not self.json_path_outgoing or self.json_path_incoming == self.json_path_outgoing):
+            raise Exception("Error: MQTT_TOPIC_OUTGOING = MQTT_TOPIC_INCOMING needs different MQTT_JSON_PATH_INCOMING and MQTT_JSON_PATH_OUTGOING")
 
         # Initialize MQTT client
         import paho.mqtt.client as mqtt
@@ -1207,29 +1877,58 @@ class MqttPowermeter(Powermeter):
         payload = msg.payload.decode()
         try:
             data = json.loads(payload)
-            if msg.topic == self.topic_incoming:
-                self.value_incoming = extract_json_value(data, self.json_path_incoming) if self.json_path_incoming else int(float(payload))
-                logger.info('MQTT: Incoming power: %s Watt', self.value_incoming)
-            elif msg.topic == self.topic_outgoing:
-                self.value_outgoing = extract_json_value(data, self.json_path_outgoing) if self.json_path_outgoing else int(float(payload))
-                logger.info('MQTT: Outgoing power: %s Watt', self.value_outgoing)
+            with self.condition:
+                if msg.topic == self.topic_incoming:
+                    self.value_incoming = extract_json_value(data, self.json_path_incoming) if self.json_path_incoming else int(float(payload))
+                    self.timestamp_incoming = time.monotonic()
+                    logger.info('MQTT: Incoming power: %s Watt', self.value_incoming)
+                    if self.same_topic:
+                        self.value_outgoing = extract_json_value(data, self.json_path_outgoing)
+                        self.timestamp_outgoing = self.timestamp_incoming
+                        logger.info('MQTT: Outgoing power: %s Watt', self.value_outgoing)
+                elif msg.topic == self.topic_outgoing:
+                    self.value_outgoing = extract_json_value(data, self.json_path_outgoing) if self.json_path_outgoing else int(float(payload))
+                    self.timestamp_outgoing = time.monotonic()
+                    logger.info('MQTT: Outgoing power: %s Watt', self.value_outgoing)
+                self.condition.notify_all()
         except json.JSONDecodeError:
             print("Failed to decode JSON")
 
-    def GetPowermeterWatts(self):
-        if self.value_incoming is None:
-            self.wait_for_message("incoming")
-        if self.topic_outgoing and self.value_outgoing is None:
-            self.wait_for_message("outgoing")
+    def has_values(self):
+        return self.timestamp_incoming is not None and (not self.topic_outgoing or self.timestamp_outgoing is not None)
+
+    def get_newest_timestamp(self):
+        return max(timestamp for timestamp in (self.timestamp_incoming, self.timestamp_outgoing) if timestamp is not None)
 
-        return self.value_incoming - (self.value_outgoing if self.value_outgoing is not None else 0)
+    def get_oldest_timestamp(self):
+        if not self.topic_outgoing:
+            return self.timestamp_incoming
+        return min(self.timestamp_incoming, self.timestamp_outgoing)
 
-    def wait_for_message(self, message_type, timeout=5):
-        start_time = time.time()
-        while (message_type == "incoming" and self.value_incoming is None) or (message_type == "outgoing" and self.value_outgoing is None):
-            if time.time() - start_time > timeout:
-                raise TimeoutError(f"Timeout waiting for MQTT {message_type} message")
-            time.sleep(1)
+    def has_new_value(self):
+        return self.has_values() and (self.timestamp_consumed is None or self.get_newest_timestamp() > self.timestamp_consumed)
+
+    def GetPowermeterWatts(self):
+        with self.condition:
+            # no value yet (startup or reconnect)
+            if not self.condition.wait_for(self.has_values, timeout=5):
+                raise TimeoutError("Timeout waiting for MQTT message")
+            if self.new_value_timeout > 0:
+                # prefer a value newer than the last one, keep the last one if nothing arrives in time
+                self.condition.wait_for(self.has_new_value, timeout=self.new_value_timeout)
+            age = time.monotonic() - self.get_oldest_timestamp()
+            if self.max_value_age > 0 and age > self.max_value_age:
+                raise TimeoutError(f"MQTT value is outdated, last message received {age:.0f} seconds ago")
+            self.timestamp_consumed = self.get_newest_timestamp()
+            return self.value_incoming - (self.value_outgoing if self.value_outgoing is not None else 0)
+
+    def WaitForNewValue(self, pTimeoutInS: float, pPollIntervalInS: float) -> bool:
+        with self.condition:
+            return self.condition.wait_for(self.has_new_value, timeout=max(0, pTimeoutInS))
+
+def GetMqttMaxValueAge(pSection: str) -> float:
+    # without MQTT_MAX_VALUE_AGE_IN_SECONDS a powermeter that stopped publishing raises after 3 loop intervals
+    return config.getfloat(pSection, 'MQTT_MAX_VALUE_AGE_IN_SECONDS', fallback=3 * CONFIG_MODEL.common.loop_interval_in_seconds)
 
 def CreatePowermeter() -> Powermeter:
     shelly_ip = config.get('SHELLY', 'SHELLY_IP')
@@ -1297,7 +1996,9 @@ def CreatePowermeter() -> Powermeter:
             config.get('SCRIPT', 'SCRIPT_FILE'),
             config.get('SCRIPT', 'SCRIPT_IP'),
             config.get('SCRIPT', 'SCRIPT_USER'),
-            config.get('SCRIPT', 'SCRIPT_PASS')
+            config.get('SCRIPT', 'SCRIPT_PASS'),
+            config.get('SCRIPT', 'SCRIPT_MODE', fallback='once'),
+            config.getfloat('SCRIPT', 'SCRIPT_READ_TIMEOUT_IN_SECONDS', fallback=10)
         )
     elif config.getboolean('SELECT_POWERMETER', 'USE_AMIS_READER'):
         return AmisReader(
@@ -1312,7 +2013,9 @@ def CreatePowermeter() -> Powermeter:
             config.get('MQTT_POWERMETER', 'MQTT_TOPIC_OUTGOING', fallback=None),
             config.get('MQTT_POWERMETER', 'MQTT_JSON_PATH_OUTGOING', fallback=None),
             config.get('MQTT_POWERMETER', 'MQTT_USERNAME', fallback=config.get('MQTT_CONFIG', 'MQTT_USERNAME', fallback=None)),
-            config.get('MQTT_POWERMETER', 'MQTT_PASSWORD', fallback=config.get('MQTT_CONFIG', 'MQTT_PASSWORD', fallback=None))
+            config.get('MQTT_POWERMETER', 'MQTT_PASSWORD', fallback=config.get('MQTT_CONFIG', 'MQTT_PASSWORD', fallback=None)),
+            GetMqttMaxValueAge('MQTT_POWERMETER'),
+            config.getfloat('MQTT_POWERMETER', 'MQTT_WAIT_FOR_NEW_VALUE_IN_SECONDS', fallback=0)
         )
     elif config.getboolean('SELECT_POWERMETER', 'USE_DEBUG_READER'):
         return DebugReader()    
@@ -1396,7 +2099,9 @@ def CreateIntermediatePowermeter(dtu: DTU) -> Powermeter:
             config.get('INTERMEDIATE_SCRIPT', 'SCRIPT_FILE_INTERMEDIATE'),
             config.get('INTERMEDIATE_SCRIPT', 'SCRIPT_IP_INTERMEDIATE'),
             config.get('INTERMEDIATE_SCRIPT', 'SCRIPT_USER_INTERMEDIATE'),
-            config.get('INTERMEDIATE_SCRIPT', 'SCRIPT_PASS_INTERMEDIATE')
+            config.get('INTERMEDIATE_SCRIPT', 'SCRIPT_PASS_INTERMEDIATE'),
+            config.get('INTERMEDIATE_SCRIPT', 'SCRIPT_MODE_INTERMEDIATE', fallback='once'),
+            config.getfloat('INTERMEDIATE_SCRIPT', 'SCRIPT_READ_TIMEOUT_IN_SECONDS_INTERMEDIATE', fallback=10)
         )
     elif config.getboolean('SELECT_INTERMEDIATE_METER', 'USE_MQTT_INTERMEDIATE'):
         return MqttPowermeter(
@@ -1407,7 +2112,9 @@ def CreateIntermediatePowermeter(dtu: DTU) -> Powermeter:
             config.get('INTERMEDIATE_MQTT', 'MQTT_TOPIC_OUTGOING', fallback=None),
             config.get('INTERMEDIATE_MQTT', 'MQTT_JSON_PATH_OUTGOING', fallback=None),
             config.get('INTERMEDIATE_MQTT', 'MQTT_USERNAME', fallback=config.get("MQTT_CONFIG", "MQTT_USERNAME", fallback=None)),
-            config.get('INTERMEDIATE_MQTT', 'MQTT_PASSWORD', fallback=config.get("MQTT_CONFIG", "MQTT_PASSWORD", fallback=None))
+            config.get('INTERMEDIATE_MQTT', 'MQTT_PASSWORD', fallback=config.get("MQTT_CONFIG", "MQTT_PASSWORD", fallback=None)),
+            GetMqttMaxValueAge('INTERMEDIATE_MQTT'),
+            config.getfloat('INTERMEDIATE_MQTT', 'MQTT_WAIT_FOR_NEW_VALUE_IN_SECONDS', fallback=0)
         )
     elif config.getboolean('SELECT_INTERMEDIATE_METER', 'USE_AMIS_READER_INTERMEDIATE'):
         return AmisReader(
@@ -1418,27 +2125,53 @@ def CreateIntermediatePowermeter(dtu: DTU) -> Powermeter:
     else:
         return dtu
 
+def CreateController() -> Controller:
+    Settings = CONFIG_MODEL.control
+    if Settings.controller == 'heuristic':
+        return HeuristicController()
+    if Settings.controller == 'pid':
+        return PIDController(Settings.pid_kp, Settings.pid_ki, Settings.pid_kd, Settings.pid_feed_forward)
+    raise Exception(f"Error: unknown CONTROLLER {Settings.controller}")
+
 def CreateDTU() -> DTU:
-    inverter_count = config.getint('COMMON', 'INVERTER_COUNT')
-    if config.getboolean('SELECT_DTU', 'USE_AHOY'):
-        return AhoyDTU(
-            inverter_count,
-            config.get('AHOY_DTU', 'AHOY_IP'),
-            config.get('AHOY_DTU', 'AHOY_PASS', fallback='')
-        )
-    elif config.getboolean('SELECT_DTU', 'USE_OPENDTU'):
-        return OpenDTU(
-            inverter_count,
-            config.get('OPEN_DTU', 'OPENDTU_IP'),
-            config.get('OPEN_DTU', 'OPENDTU_USER'),
-            config.get('OPEN_DTU', 'OPENDTU_PASS')
-        )
-    elif config.getboolean('SELECT_DTU', 'USE_DEBUG'):
-        return DebugDTU(
-            inverter_count
-        )    
+    inverter_count = CONFIG_MODEL.common.inverter_count
+    InverterIdsOfDTU = {}
+    for i in range(inverter_count):
+        InverterIdsOfDTU.setdefault(CONFIG_MODEL.inverters[i].dtu, []).append(i)
+    if list(InverterIdsOfDTU) == [1]:
+        return CreateSingleDTU(1, None)
+    dtus = [CreateSingleDTU(DtuNumber, InverterIdsOfDTU[DtuNumber]) for DtuNumber in sorted(InverterIdsOfDTU)]
+    return MultiDTU(inverter_count, dtus, CONFIG_MODEL.common.set_limit_timeout_seconds)
+
+def CreateSingleDTU(pDtuNumber: int, pInverterIds: list) -> DTU:
+    # DTU 1 is defined in [SELECT_DTU], every further DTU in its own section [DTU_x]
+    inverter_count = CONFIG_MODEL.common.inverter_count if pInverterIds is None else len(pInverterIds)
+    parallel_workers = CONFIG_MODEL.common.set_limit_parallel_workers
+    if pDtuNumber == 1:
+        if config.getboolean('SELECT_DTU', 'USE_AHOY'):
+            DtuType, Ip, User, Password = 'ahoy', config.get('AHOY_DTU', 'AHOY_IP'), '', config.get('AHOY_DTU', 'AHOY_PASS', fallback='')
+        elif config.getboolean('SELECT_DTU', 'USE_OPENDTU'):
+            DtuType, Ip, User, Password = 'opendtu', config.get('OPEN_DTU', 'OPENDTU_IP'), config.get('OPEN_DTU', 'OPENDTU_USER'), config.get('OPEN_DTU', 'OPENDTU_PASS')
+        elif config.getboolean('SELECT_DTU', 'USE_DEBUG'):
+            DtuType, Ip, User, Password = 'debug', '', '', ''
+        else:
+            raise Exception("Error: no DTU defined!")
+    else:
+        Section = 'DTU_' + str(pDtuNumber)
+        if not config.has_section(Section):
+            raise Exception(f"Error: DTU {pDtuNumber} is used by an inverter but [{Section}] is not defined!")
+        DtuType = config.get(Section, 'DTU_TYPE').strip().lower()
+        Ip = config.get(Section, 'DTU_IP', fallback='')
+        User = config.get(Section, 'DTU_USER', fallback='admin')
+        Password = config.get(Section, 'DTU_PASS', fallback='')
+    if DtuType == 'ahoy':
+        return AhoyDTU(inverter_count, Ip, Password, parallel_workers, pInverterIds)
+    elif DtuType == 'opendtu':
+        return OpenDTU(inverter_count, Ip, User, Password, parallel_workers, pInverterIds)
+    elif DtuType == 'debug':
+        return DebugDTU(inverter_count, parallel_workers, pInverterIds)
     else:
-        raise Exception("Error: no DTU defined!")
+        raise Exception(f'Error: unknown DTU_TYPE "{DtuType}" in [DTU_{pDtuNumber}], use ahoy, opendtu or debug')
 
 # ----- START -----
 logger.info("Author: %s / Script Version: %s",__author__, __version__)
@@ -1451,6 +2184,19 @@ if args.config:
 VERSION = config.get('VERSION', 'VERSION')
 logger.info("Config file V %s", VERSION)
 
+try:
+    CONFIG_MODEL = load_config(config)
+except ConfigError as e:
+    for error in e.errors:
+        logger.error(error)
+    raise
+
+# counters and gauges of the optional Prometheus endpoint, see METRICS_PORT
+METRICS = MetricsRegistry() if SITE_CONTEXT is None else MetricsRegistry({'site': SITE_CONTEXT.name})
+if SITE_CONTEXT is not None:
+    # the requests of the shared session are counted by multi_site.py
+    METRICS.include(SITE_CONTEXT.shared.metrics)
+
 MAX_RETRIES = config.getint('COMMON', 'MAX_RETRIES', fallback=3)
 RETRY_STATUS_CODES = config.get('COMMON', 'RETRY_STATUS_CODES', fallback='500,502,503,504')
 RETRY_BACKOFF_FACTOR = config.getfloat('COMMON', 'RETRY_BACKOFF_FACTOR', fallback=0.1)
@@ -1458,9 +2204,11 @@ retry = Retry(total=MAX_RETRIES,
               backoff_factor=RETRY_BACKOFF_FACTOR,
               status_forcelist=[int(status_code) for status_code in RETRY_STATUS_CODES.split(',')],
               allowed_methods={"GET", "POST"})
-adapter = HTTPAdapter(max_retries=retry)
-session.mount('http://', adapter)
-session.mount('https://', adapter)
+if SITE_CONTEXT is None:
+    # the shared session of several sites is set up by multi_site.py
+    adapter = InstrumentedHTTPAdapter(METRICS, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
 
 USE_AHOY = config.getboolean('SELECT_DTU', 'USE_AHOY')
 USE_OPENDTU = config.getboolean('SELECT_DTU', 'USE_OPENDTU')
@@ -1468,32 +2216,48 @@ AHOY_IP = config.get('AHOY_DTU', 'AHOY_IP')
 OPENDTU_IP = config.get('OPEN_DTU', 'OPENDTU_IP')
 OPENDTU_USER = config.get('OPEN_DTU', 'OPENDTU_USER')
 OPENDTU_PASS = config.get('OPEN_DTU', 'OPENDTU_PASS')
-DTU = CreateDTU()
-POWERMETER = CreatePowermeter()
-INTERMEDIATE_POWERMETER = CreateIntermediatePowermeter(DTU)
-INVERTER_COUNT = config.getint('COMMON', 'INVERTER_COUNT')
-LOOP_INTERVAL_IN_SECONDS = config.getint('COMMON', 'LOOP_INTERVAL_IN_SECONDS')
-SET_LIMIT_TIMEOUT_SECONDS = config.getint('COMMON', 'SET_LIMIT_TIMEOUT_SECONDS')
-SET_POWER_STATUS_DELAY_IN_SECONDS = config.getint('COMMON', 'SET_POWER_STATUS_DELAY_IN_SECONDS')
-POLL_INTERVAL_IN_SECONDS = config.getint('COMMON', 'POLL_INTERVAL_IN_SECONDS')
-MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER = config.getint('COMMON', 'MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER')
-SET_POWERSTATUS_CNT = config.getint('COMMON', 'SET_POWERSTATUS_CNT')
-SLOW_APPROX_FACTOR_IN_PERCENT = config.getint('COMMON', 'SLOW_APPROX_FACTOR_IN_PERCENT')
-LOG_TEMPERATURE = config.getboolean('COMMON', 'LOG_TEMPERATURE')
-SET_INVERTER_TO_MIN_ON_POWERMETER_ERROR = config.getboolean('COMMON', 'SET_INVERTER_TO_MIN_ON_POWERMETER_ERROR', fallback=False)
-powermeter_target_point = config.getint('CONTROL', 'POWERMETER_TARGET_POINT')
+if SITE_CONTEXT is not None and SITE_CONTEXT.devices is not None:
+    # devices given by the runner, e.g. the replay of a trace
+    DTU, POWERMETER, INTERMEDIATE_POWERMETER = SITE_CONTEXT.devices
+else:
+    DTU = CreateDTU()
+    POWERMETER = CreatePowermeter()
+    INTERMEDIATE_POWERMETER = CreateIntermediatePowermeter(DTU)
+TRACE_WRITER = None
+if args.record:
+    # the replay machinery is only loaded when a trace is recorded
+    from trace_replay import record_devices
+    logger.info("record trace to: " + args.record)
+    TRACE_WRITER, DTU, POWERMETER, INTERMEDIATE_POWERMETER = record_devices(args.record, DTU, POWERMETER, INTERMEDIATE_POWERMETER, globals())
+INVERTER_COUNT = CONFIG_MODEL.common.inverter_count
+LOOP_INTERVAL_IN_SECONDS = CONFIG_MODEL.common.loop_interval_in_seconds
+SET_LIMIT_TIMEOUT_SECONDS = CONFIG_MODEL.common.set_limit_timeout_seconds
+SET_POWER_STATUS_DELAY_IN_SECONDS = CONFIG_MODEL.common.set_power_status_delay_in_seconds
+POLL_INTERVAL_IN_SECONDS = CONFIG_MODEL.common.poll_interval_in_seconds
+EVENT_DRIVEN_LOOP = CONFIG_MODEL.common.event_driven_loop
+MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER = CONFIG_MODEL.common.max_difference_between_limit_and_outputpower
+SET_POWERSTATUS_CNT = CONFIG_MODEL.common.set_powerstatus_cnt
+SLOW_APPROX_FACTOR_IN_PERCENT = CONFIG_MODEL.common.slow_approx_factor_in_percent
+LOG_TEMPERATURE = CONFIG_MODEL.common.log_temperature
+SET_INVERTER_TO_MIN_ON_POWERMETER_ERROR = CONFIG_MODEL.common.set_inverter_to_min_on_powermeter_error
+PIPELINED_LIMIT_ACK = CONFIG_MODEL.common.pipelined_limit_ack
+# pipelined mode: inverter id -> deadline of the acknowledge of the last limit sent
+PENDING_LIMIT_ACKS = {}
+powermeter_target_point = CONFIG_MODEL.control.powermeter_target_point
+# numeric state of the inverters, the lists below are views of the store
+INVERTERS = InverterStore(INVERTER_COUNT)
+HOY_MAX_WATT = INVERTERS.max_watt
+HOY_INVERTER_WATT = INVERTERS.inverter_watt
+CURRENT_LIMIT = INVERTERS.current_limit
+AVAILABLE = INVERTERS.available
+LASTLIMITACKNOWLEDGED = INVERTERS.last_limit_acknowledged
+HOY_BATTERY_GOOD_VOLTAGE = INVERTERS.battery_good_voltage
+HOY_COMPENSATE_WATT_FACTOR = INVERTERS.compensate_watt_factor
+HOY_BATTERY_MODE = INVERTERS.battery_mode
 SERIAL_NUMBER = []
 ENABLED = []
 NAME = []
 TEMPERATURE = []
-HOY_MAX_WATT = []
-HOY_INVERTER_WATT = []
-CURRENT_LIMIT = []
-AVAILABLE = []
-LASTLIMITACKNOWLEDGED = []
-HOY_BATTERY_GOOD_VOLTAGE = []
-HOY_COMPENSATE_WATT_FACTOR = []
-HOY_BATTERY_MODE = []
 HOY_BATTERY_THRESHOLD_OFF_LIMIT_IN_V = []
 HOY_BATTERY_THRESHOLD_REDUCE_LIMIT_IN_V = []
 HOY_BATTERY_THRESHOLD_NORMAL_LIMIT_IN_V = []
@@ -1503,35 +2267,41 @@ HOY_PANEL_VOLTAGE_LIST = []
 HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST = []
 HOY_BATTERY_AVERAGE_CNT = []
 for i in range(INVERTER_COUNT):
-    SERIAL_NUMBER.append(config.get('INVERTER_' + str(i + 1), 'SERIAL_NUMBER', fallback=''))
-    ENABLED.append(config.getboolean('INVERTER_' + str(i + 1), 'ENABLED', fallback = True))
+    InverterSettings = CONFIG_MODEL.inverters[i]
+    SERIAL_NUMBER.append(InverterSettings.serial_number)
+    ENABLED.append(InverterSettings.enabled)
     NAME.append(str('yet unknown'))
     TEMPERATURE.append(str('--- degC'))
-    HOY_MAX_WATT.append(config.getint('INVERTER_' + str(i + 1), 'HOY_MAX_WATT'))
-    
-    if (config.get('INVERTER_' + str(i + 1), 'HOY_INVERTER_WATT') != ''):
-        HOY_INVERTER_WATT.append(config.getint('INVERTER_' + str(i + 1), 'HOY_INVERTER_WATT'))
-    else:
-        HOY_INVERTER_WATT.append(HOY_MAX_WATT[i])
-        
-    CURRENT_LIMIT.append(int(-1))
-    AVAILABLE.append(bool(False))
-    LASTLIMITACKNOWLEDGED.append(bool(False))
-    HOY_BATTERY_GOOD_VOLTAGE.append(bool(True))
-    HOY_BATTERY_MODE.append(config.getboolean('INVERTER_' + str(i + 1), 'HOY_BATTERY_MODE'))
-    HOY_BATTERY_THRESHOLD_OFF_LIMIT_IN_V.append(config.getfloat('INVERTER_' + str(i + 1), 'HOY_BATTERY_THRESHOLD_OFF_LIMIT_IN_V'))
-    HOY_BATTERY_THRESHOLD_REDUCE_LIMIT_IN_V.append(config.getfloat('INVERTER_' + str(i + 1), 'HOY_BATTERY_THRESHOLD_REDUCE_LIMIT_IN_V'))
-    HOY_BATTERY_THRESHOLD_NORMAL_LIMIT_IN_V.append(config.getfloat('INVERTER_' + str(i + 1), 'HOY_BATTERY_THRESHOLD_NORMAL_LIMIT_IN_V'))
-    HOY_BATTERY_THRESHOLD_ON_LIMIT_IN_V.append(config.getfloat('INVERTER_' + str(i + 1), 'HOY_BATTERY_THRESHOLD_ON_LIMIT_IN_V'))
-    HOY_COMPENSATE_WATT_FACTOR.append(config.getfloat('INVERTER_' + str(i + 1), 'HOY_COMPENSATE_WATT_FACTOR'))
-    HOY_BATTERY_IGNORE_PANELS.append(config.get('INVERTER_' + str(i + 1), 'HOY_BATTERY_IGNORE_PANELS'))
-    HOY_PANEL_VOLTAGE_LIST.append([])
-    HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST.append([])
-    HOY_BATTERY_AVERAGE_CNT.append(config.getint('INVERTER_' + str(i + 1), 'HOY_BATTERY_AVERAGE_CNT', fallback=1))
-SLOW_APPROX_LIMIT = CastToInt(GetMaxWattFromAllInverters() * config.getint('COMMON', 'SLOW_APPROX_LIMIT_IN_PERCENT') / 100)
-
-CONFIG_PROVIDER = ConfigFileConfigProvider(config)
+    HOY_MAX_WATT[i] = InverterSettings.hoy_max_watt
+    HOY_INVERTER_WATT[i] = InverterSettings.hoy_inverter_watt
+    HOY_BATTERY_MODE[i] = InverterSettings.hoy_battery_mode
+    HOY_BATTERY_THRESHOLD_OFF_LIMIT_IN_V.append(InverterSettings.hoy_battery_threshold_off_limit_in_v)
+    HOY_BATTERY_THRESHOLD_REDUCE_LIMIT_IN_V.append(InverterSettings.hoy_battery_threshold_reduce_limit_in_v)
+    HOY_BATTERY_THRESHOLD_NORMAL_LIMIT_IN_V.append(InverterSettings.hoy_battery_threshold_normal_limit_in_v)
+    HOY_BATTERY_THRESHOLD_ON_LIMIT_IN_V.append(InverterSettings.hoy_battery_threshold_on_limit_in_v)
+    HOY_COMPENSATE_WATT_FACTOR[i] = InverterSettings.hoy_compensate_watt_factor
+    HOY_BATTERY_IGNORE_PANELS.append(InverterSettings.hoy_battery_ignore_panels)
+    HOY_PANEL_VOLTAGE_LIST.append(RollingWindow(5))
+    HOY_PANEL_MIN_VOLTAGE_HISTORY_LIST.append(RollingWindow(InverterSettings.hoy_battery_average_cnt))
+    HOY_BATTERY_AVERAGE_CNT.append(InverterSettings.hoy_battery_average_cnt)
+USE_ASYNCIO = CONFIG_MODEL.common.use_asyncio
+ENGINE = None
+if USE_ASYNCIO:
+    # one worker per inverter, so all acknowledges can be awaited at once
+    ENGINE = AsyncEngine(max_workers=INVERTER_COUNT + 4) if SITE_CONTEXT is None else SITE_CONTEXT.get_engine()
+    ASYNC_DTU = CreateAsyncDTU(DTU, ENGINE)
+    ASYNC_POWERMETER = CreateAsyncPowermeter(POWERMETER, ENGINE)
+    ASYNC_INTERMEDIATE_POWERMETER = ASYNC_DTU if INTERMEDIATE_POWERMETER is DTU else CreateAsyncPowermeter(INTERMEDIATE_POWERMETER, ENGINE)
+# reads the actual production in the background, see GetCycleSample()
+FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='CycleFetch') if SITE_CONTEXT is None else SITE_CONTEXT.executor
+FLEET_AGGREGATES = FleetAggregates(INVERTER_COUNT)
+# rolling histograms of the duration of every phase of the control cycle, published via MQTT
+CYCLE_TIMER = CycleTimer()
+METRICS_PORT = CONFIG_MODEL.common.metrics_port
+
+CONFIG_PROVIDER = ConfigFileConfigProvider(config, CONFIG_MODEL)
 MQTT = None
+TIMING_PUBLISH_INTERVAL_IN_SECONDS = 0
 if config.has_section("MQTT_CONFIG"):
     broker = config.get("MQTT_CONFIG", "MQTT_BROKER")
     port = config.getint("MQTT_CONFIG", "MQTT_PORT", fallback=1883)
@@ -1541,6 +2311,7 @@ if config.has_section("MQTT_CONFIG"):
     topic_prefix = config.get("MQTT_CONFIG", "MQTT_SET_TOPIC", fallback="zeropower")
     log_level_config_value = config.get("MQTT_CONFIG", "MQTT_LOG_LEVEL", fallback=None)
     mqtt_log_level = logging.getLevelName(log_level_config_value) if log_level_config_value else None
+    TIMING_PUBLISH_INTERVAL_IN_SECONDS = config.getint("MQTT_CONFIG", "MQTT_TIMING_INTERVAL_IN_SECONDS", fallback=60)
     MQTT = MqttHandler(broker, port, client_id, username, password, topic_prefix, mqtt_log_level)
 
     if mqtt_log_level is not None:
@@ -1550,114 +2321,120 @@ if config.has_section("MQTT_CONFIG"):
 
         logger.addHandler(MqttLogHandler())
 
-    CONFIG_PROVIDER = ConfigProviderChain([MQTT, CONFIG_PROVIDER])
+    CONFIG_PROVIDER = ConfigProviderChain([MQTT, CONFIG_PROVIDER], INVERTER_COUNT)
+else:
+    CONFIG_PROVIDER = ConfigProviderChain([CONFIG_PROVIDER], INVERTER_COUNT)
 
-try:
-    logger.info("---Init---")
-    newLimitSetpoint = 0
-    DTU.CheckMinVersion()
-    if GetHoymilesAvailable():
-        for i in range(INVERTER_COUNT):
-            SetHoymilesPowerStatus(i, True)
-        newLimitSetpoint = GetMinWattFromAllInverters()
-        SetLimit(newLimitSetpoint)
-        GetHoymilesActualPower()
-        GetCheckBattery()
-    GetPowermeterWatts()
-except Exception as e:
-    if hasattr(e, 'message'):
-        logger.error(e.message)
-    else:
-        logger.error(e)
-    time.sleep(LOOP_INTERVAL_IN_SECONDS)
-logger.info("---Start Zero Export---")
+SLOW_APPROX_LIMIT = CastToInt(GetMaxWattFromAllInverters() * CONFIG_MODEL.common.slow_approx_limit_in_percent / 100)
+CONTROLLER = CreateController()
 
-while True:
-    CONFIG_PROVIDER.update()
+def CollectMetrics():
+    # read when the endpoint is scraped, the control loop does not publish these values
+    Samples = []
+    if globals().get('newLimitSetpoint') is not None:
+        Samples.append(('hoymiles_limit_setpoint_watts', 'hoymiles_limit_setpoint_watts', {}, CastToInt(newLimitSetpoint)))
+    for i in range(INVERTER_COUNT):
+        Labels = {'inverter': str(i), 'serial': SERIAL_NUMBER[i]}
+        if CURRENT_LIMIT[i] >= 0:
+            Samples.append(('hoymiles_inverter_limit_watts', 'hoymiles_inverter_limit_watts', Labels, CURRENT_LIMIT[i]))
+        try:
+            Samples.append(('hoymiles_inverter_temperature_celsius', 'hoymiles_inverter_temperature_celsius', Labels, float(TEMPERATURE[i].split()[0])))
+        except ValueError:
+            pass
+    return Samples
+
+def StartMetricsServer():
+    if METRICS_PORT <= 0:
+        return
+    METRICS.describe('hoymiles_loop_iterations_total', 'counter', 'Passes of the control loop')
+    METRICS.describe('hoymiles_ack_timeouts_total', 'counter', 'Limits not acknowledged by the inverter within SET_LIMIT_TIMEOUT_SECONDS')
+    METRICS.describe('hoymiles_limit_setpoint_watts', 'gauge', 'Limit setpoint of all inverters')
+    METRICS.describe('hoymiles_inverter_limit_watts', 'gauge', 'Last limit sent to the inverter')
+    METRICS.describe('hoymiles_inverter_temperature_celsius', 'gauge', 'Last temperature read from the inverter')
+    METRICS.describe('hoymiles_cycle_phase_duration_seconds', 'histogram', 'Duration of the phases of the control cycle')
+    METRICS.add_collector(CollectMetrics)
+    METRICS.add_collector(cycle_timer_samples(CYCLE_TIMER, 'hoymiles_cycle_phase_duration_seconds'))
+    try:
+        MetricsServer(METRICS, METRICS_PORT).start()
+        logger.info("Metrics: http://<host>:%s/metrics", METRICS_PORT)
+    except Exception as e:
+        logger.error("Exception at StartMetricsServer, port %s", METRICS_PORT)
+        if hasattr(e, 'message'):
+            logger.error(e.message)
+        else:
+            logger.error(e)
+
+def Init():
+    global newLimitSetpoint
+    try:
+        logger.info("---Init---")
+        newLimitSetpoint = 0
+        DTU.CheckMinVersion()
+        if GetHoymilesAvailable():
+            for i in range(INVERTER_COUNT):
+                SetHoymilesPowerStatus(i, True)
+            newLimitSetpoint = GetMinWattFromAllInverters()
+            SetLimit(newLimitSetpoint)
+            GetHoymilesActualPower()
+            GetCheckBattery()
+        GetPowermeterWatts()
+    except Exception as e:
+        if hasattr(e, 'message'):
+            logger.error(e.message)
+        else:
+            logger.error(e)
+        time.sleep(LOOP_INTERVAL_IN_SECONDS)
+    logger.info("---Start Zero Export---")
+
+def RunCycle():
+    # one pass of the control loop, the limit setpoint is kept for the next cycle
+    global newLimitSetpoint
+    CYCLE_TIMER.call('config_update', CONFIG_PROVIDER.update)
+    # min watt and battery priority can be changed by the config provider (e.g. MQTT)
+    FLEET_AGGREGATES.Invalidate()
     PublishConfigState()
-    on_grid_usage_jump_to_limit_percent = CONFIG_PROVIDER.on_grid_usage_jump_to_limit_percent()
-    on_grid_feed_fast_limit_decrease = CONFIG_PROVIDER.on_grid_feed_fast_limit_decrease()    
-    powermeter_target_point = CONFIG_PROVIDER.get_powermeter_target_point()
-    powermeter_max_point = CONFIG_PROVIDER.get_powermeter_max_point()
-    powermeter_min_point = CONFIG_PROVIDER.get_powermeter_min_point()
-    powermeter_tolerance = CONFIG_PROVIDER.get_powermeter_tolerance()
-    if powermeter_max_point < (powermeter_target_point + powermeter_tolerance):
-        powermeter_max_point = powermeter_target_point + powermeter_tolerance + 50
-        logger.info(
-            'Warning: POWERMETER_MAX_POINT < POWERMETER_TARGET_POINT + POWERMETER_TOLERANCE. Setting POWERMETER_MAX_POINT to ' + str(
-                powermeter_max_point))
+    PublishCycleTiming()
+    Settings = ControlSettings()
 
     try:
         PreviousLimitSetpoint = newLimitSetpoint
-        if GetHoymilesAvailable() and GetCheckBattery():
+        DTU.InvalidateCache()
+        if PENDING_LIMIT_ACKS:
+            CYCLE_TIMER.call('reconcile_limit_acks', ReconcileLimitAcks)
+        if CYCLE_TIMER.call('hoymiles_available', GetHoymilesAvailable) and CYCLE_TIMER.call('check_battery', GetCheckBattery):
             if LOG_TEMPERATURE:
                 GetHoymilesTemperature()
-            for x in range(CastToInt(LOOP_INTERVAL_IN_SECONDS / POLL_INTERVAL_IN_SECONDS)):
+            for RemainingDelay in PowermeterPolls():
                 powermeterWatts = GetPowermeterWatts()
-                if powermeterWatts > powermeter_max_point:
-                    if on_grid_usage_jump_to_limit_percent > 0:
-                        newLimitSetpoint = CastToInt(GetMaxInverterWattFromAllInverters() * on_grid_usage_jump_to_limit_percent / 100)
-                        if (newLimitSetpoint <= PreviousLimitSetpoint) and (on_grid_usage_jump_to_limit_percent != 100):
-                            newLimitSetpoint = PreviousLimitSetpoint + powermeterWatts - powermeter_target_point
-                    else:
-                        newLimitSetpoint = PreviousLimitSetpoint + powermeterWatts - powermeter_target_point
-                    newLimitSetpoint = ApplyLimitsToSetpoint(newLimitSetpoint)
+                PowermeterTimestamp = time.time()
+                Setpoint = CONTROLLER.PollSetpoint(PreviousLimitSetpoint, powermeterWatts, Settings)
+                if Setpoint is not None:
+                    newLimitSetpoint = ApplyLimitsToSetpoint(Setpoint)
                     SetLimit(newLimitSetpoint)
-                    RemainingDelay = CastToInt((LOOP_INTERVAL_IN_SECONDS / POLL_INTERVAL_IN_SECONDS - x) * POLL_INTERVAL_IN_SECONDS)
                     if RemainingDelay > 0:
                         time.sleep(RemainingDelay)
                         break
-                elif (powermeterWatts < powermeter_min_point) and on_grid_feed_fast_limit_decrease:
-                    newLimitSetpoint = PreviousLimitSetpoint + powermeterWatts - powermeter_target_point
-                    newLimitSetpoint = ApplyLimitsToSetpoint(newLimitSetpoint)
-                    SetLimit(newLimitSetpoint)
-                    RemainingDelay = CastToInt((LOOP_INTERVAL_IN_SECONDS / POLL_INTERVAL_IN_SECONDS - x) * POLL_INTERVAL_IN_SECONDS)
-                    if RemainingDelay > 0:
-                        time.sleep(RemainingDelay)
-                        break
-                else:
-                    time.sleep(POLL_INTERVAL_IN_SECONDS)
+
+            # the polling took up to LOOP_INTERVAL_IN_SECONDS, read the actual production again
+            DTU.InvalidateCache()
+            NeedsActualPower = CONTROLLER.NeedsActualPower(PreviousLimitSetpoint) or (MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER != 100 and newLimitSetpoint != GetMaxWattFromAllInverters())
+            Sample = GetCycleSample(PowermeterTimestamp, powermeterWatts, NeedsActualPower)
 
             if MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER != 100:
-                CutLimit = CutLimitToProduction(newLimitSetpoint)
+                CutLimit = CYCLE_TIMER.call('cut_limit_to_production', CutLimitToProduction, newLimitSetpoint, Sample)
                 if CutLimit != newLimitSetpoint:
                     newLimitSetpoint = CutLimit
                     PreviousLimitSetpoint = newLimitSetpoint
 
-            if powermeterWatts > powermeter_max_point:
-                continue
-
-            # producing too much power: reduce limit
-            if powermeterWatts < (powermeter_target_point - powermeter_tolerance):
-                if PreviousLimitSetpoint >= GetMaxWattFromAllInverters():
-                    hoymilesActualPower = GetHoymilesActualPower()
-                    newLimitSetpoint = hoymilesActualPower + powermeterWatts - powermeter_target_point
-                    LimitDifference = abs(hoymilesActualPower - newLimitSetpoint)
-                    if LimitDifference > SLOW_APPROX_LIMIT:
-                        newLimitSetpoint = newLimitSetpoint + (LimitDifference * SLOW_APPROX_FACTOR_IN_PERCENT / 100)
-                    if newLimitSetpoint > hoymilesActualPower:
-                        newLimitSetpoint = hoymilesActualPower
-                    logger.info("overproducing: reduce limit based on actual power")
-                else:
-                    newLimitSetpoint = PreviousLimitSetpoint + powermeterWatts - powermeter_target_point
-                    # check if it is necessary to approximate to the setpoint with some more passes. this reduce overshoot
-                    LimitDifference = abs(PreviousLimitSetpoint - newLimitSetpoint)
-                    if LimitDifference > SLOW_APPROX_LIMIT:
-                        logger.info("overproducing: reduce limit based on previous limit setpoint by approximation")
-                        newLimitSetpoint = newLimitSetpoint + (LimitDifference * SLOW_APPROX_FACTOR_IN_PERCENT / 100)
-                    else:
-                        logger.info("overproducing: reduce limit based on previous limit setpoint")
-
-            # producing too little power: increase limit
-            elif powermeterWatts > (powermeter_target_point + powermeter_tolerance):
-                if PreviousLimitSetpoint < GetMaxWattFromAllInverters():
-                    newLimitSetpoint = PreviousLimitSetpoint + powermeterWatts - powermeter_target_point
-                    logger.info("Not enough energy producing: increasing limit")
-                else:
-                    logger.info("Not enough energy producing: limit already at maximum")
+            if powermeterWatts > Settings.MaxPoint:
+                # the limit was already raised by the poll loop
+                return
 
+            Setpoint = CONTROLLER.CycleSetpoint(PreviousLimitSetpoint, newLimitSetpoint, Sample, Settings)
+            if Setpoint is None:
+                return
             # check for upper and lower limits
-            newLimitSetpoint = ApplyLimitsToSetpoint(newLimitSetpoint)
+            newLimitSetpoint = ApplyLimitsToSetpoint(Setpoint)
             # set new limit to inverter
             SetLimit(newLimitSetpoint)
         else:
@@ -1671,3 +2448,13 @@ while True:
         else:
             logger.error(e)
         time.sleep(LOOP_INTERVAL_IN_SECONDS)
+
+def Run():
+    StartMetricsServer()
+    Init()
+    while True:
+        CYCLE_TIMER.call('cycle', RunCycle)
+        METRICS.inc('hoymiles_loop_iterations_total')
+
+if __name__ == '__main__':
+    Run()
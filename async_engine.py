@@ -0,0 +1,166 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncEngine:
+    """
+    Runs an asyncio event loop in a background thread.
+
+    The control loop stays synchronous and hands every I/O phase (e.g. waiting for the acknowledges of all inverters)
+    to this loop, where the device requests run concurrently. Synchronous drivers are executed in a bounded thread pool.
+    """
+    def __init__(self, max_workers: int = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='AsyncEngine')
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(target=self.run_loop, name='AsyncEngine', daemon=True)
+        self.thread.start()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the event loop and returns a concurrent.futures.Future without waiting for it.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        """
+        Runs a coroutine on the event loop and waits for its result.
+        """
+        return self.submit(coro).result(timeout)
+
+    def gather(self, coros, return_exceptions: bool = True):
+        """
+        Runs several coroutines concurrently and returns their results in the given order.
+        With return_exceptions the exception of a failed coroutine is returned instead of raised.
+        """
+        async def gather_all():
+            return await asyncio.gather(*coros, return_exceptions=return_exceptions)
+        return self.run(gather_all())
+
+    async def call(self, func, *args):
+        """
+        Calls a blocking function in the thread pool of the engine.
+        """
+        return await self.loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+
+
+class AsyncPowermeter:
+    """
+    Asynchronous version of the Powermeter interface.
+    """
+    async def GetPowermeterWatts(self) -> int:
+        raise NotImplementedError()
+
+
+class AsyncDTU(AsyncPowermeter):
+    """
+    Asynchronous version of the DTU interface.
+    """
+    async def GetACPower(self, pInverterId: int):
+        raise NotImplementedError()
+
+    async def GetAvailable(self, pInverterId: int):
+        raise NotImplementedError()
+
+    async def GetActualLimitInW(self, pInverterId: int):
+        raise NotImplementedError()
+
+    async def GetInfo(self, pInverterId: int):
+        raise NotImplementedError()
+
+    async def GetTemperature(self, pInverterId: int):
+        raise NotImplementedError()
+
+    async def GetPanelMinVoltage(self, pInverterId: int):
+        raise NotImplementedError()
+
+    async def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
+        raise NotImplementedError()
+
+    async def WaitForAcks(self, pInverterIds: list, pTimeoutInS: int):
+        acks = await asyncio.gather(*(self.WaitForAck(pInverterId, pTimeoutInS) for pInverterId in pInverterIds))
+        return dict(zip(pInverterIds, acks))
+
+    async def SetLimit(self, pInverterId: int, pLimit: int):
+        raise NotImplementedError()
+
+    async def SetPowerStatus(self, pInverterId: int, pActive: bool):
+        raise NotImplementedError()
+
+
+class SyncPowermeterAdapter(AsyncPowermeter):
+    """
+    Runs a synchronous powermeter in the thread pool of the engine.
+    """
+    def __init__(self, powermeter, engine: AsyncEngine):
+        self.powermeter = powermeter
+        self.engine = engine
+
+    async def GetPowermeterWatts(self):
+        return await self.engine.call(self.powermeter.GetPowermeterWatts)
+
+
+class SyncDTUAdapter(AsyncDTU):
+    """
+    Runs a synchronous DTU in the thread pool of the engine.
+    """
+    def __init__(self, dtu, engine: AsyncEngine):
+        self.dtu = dtu
+        self.engine = engine
+
+    async def GetPowermeterWatts(self):
+        # read the AC power of all producing inverters at once
+        pInverterIds = self.dtu.GetProducingInverters()
+        return sum(await asyncio.gather(*(self.GetACPower(pInverterId) for pInverterId in pInverterIds)))
+
+    async def GetACPower(self, pInverterId: int):
+        return await self.engine.call(self.dtu.GetACPower, pInverterId)
+
+    async def GetAvailable(self, pInverterId: int):
+        return await self.engine.call(self.dtu.GetAvailable, pInverterId)
+
+    async def GetActualLimitInW(self, pInverterId: int):
+        return await self.engine.call(self.dtu.GetActualLimitInW, pInverterId)
+
+    async def GetInfo(self, pInverterId: int):
+        return await self.engine.call(self.dtu.GetInfo, pInverterId)
+
+    async def GetTemperature(self, pInverterId: int):
+        return await self.engine.call(self.dtu.GetTemperature, pInverterId)
+
+    async def GetPanelMinVoltage(self, pInverterId: int):
+        return await self.engine.call(self.dtu.GetPanelMinVoltage, pInverterId)
+
+    async def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
+        return await self.engine.call(self.dtu.WaitForAck, pInverterId, pTimeoutInS)
+
+    async def SetLimit(self, pInverterId: int, pLimit: int):
+        return await self.engine.call(self.dtu.SetLimit, pInverterId, pLimit)
+
+    async def SetPowerStatus(self, pInverterId: int, pActive: bool):
+        return await self.engine.call(self.dtu.SetPowerStatus, pInverterId, pActive)
+
+
+def CreateAsyncPowermeter(powermeter, engine: AsyncEngine) -> AsyncPowermeter:
+    """
+    Native asynchronous drivers are used as they are, synchronous drivers are wrapped into an executor adapter.
+    """
+    if isinstance(powermeter, AsyncPowermeter):
+        return powermeter
+    return SyncPowermeterAdapter(powermeter, engine)
+
+
+def CreateAsyncDTU(dtu, engine: AsyncEngine) -> AsyncDTU:
+    if isinstance(dtu, AsyncDTU):
+        return dtu
+    return SyncDTUAdapter(dtu, engine)
@@ -0,0 +1,64 @@
+# Micro benchmark of the limit allocation in SetLimit, for 10, 100 and 1000 inverters.
+# usage: python benchmarks/inverter_store_benchmark.py
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import inverter_store
+from inverter_store import InverterStore
+
+def CreateFleet(pInverterCount):
+    random.seed(pInverterCount)
+    store = InverterStore(pInverterCount)
+    for i in range(pInverterCount):
+        store.max_watt[i] = random.choice([300, 600, 800, 1500])
+        store.inverter_watt[i] = store.max_watt[i]
+        store.min_watt[i] = int(store.inverter_watt[i] * 5 / 100)
+        store.compensate_watt_factor[i] = random.choice([1.0, 1.0, 1.0, 1.1])
+    return store
+
+def AllocateLists(pMaxWatt, pInverterWatt, pMinWatt, pFactor, pInverterIds, pLimit, pSpan):
+    # per inverter calculation as it was done before the inverter store
+    result = []
+    for i in pInverterIds:
+        NewLimit = int(pLimit * (pMaxWatt[i] - pMinWatt[i]) / pSpan) + pMinWatt[i]
+        NewLimit = max(min(NewLimit, pMaxWatt[i]), pMinWatt[i])
+        if pFactor[i] != 1:
+            NewLimit = int(NewLimit * pFactor[i])
+            NewLimit = max(min(NewLimit, pInverterWatt[i]), pMinWatt[i])
+        result.append(NewLimit)
+    return result
+
+def Measure(pFunction):
+    number, _ = timeit.Timer(pFunction).autorange()
+    return min(timeit.repeat(pFunction, number=number, repeat=5)) / number * 1e6
+
+def main():
+    print(f"numpy: {inverter_store.numpy.__version__ if inverter_store.numpy is not None else 'not installed'}")
+    print(f"{'inverters':>10} {'lists':>12} {'array':>12} {'numpy':>12}   (microseconds per allocation)")
+    for inverter_count in (10, 100, 1000):
+        store = CreateFleet(inverter_count)
+        ids = list(range(inverter_count))
+        span = sum(store.max_watt) - sum(store.min_watt)
+        limit = span // 2
+        lists = (list(store.max_watt), list(store.inverter_watt), list(store.min_watt), list(store.compensate_watt_factor))
+        reference = AllocateLists(*lists, ids, limit, span)
+        time_lists = Measure(lambda: AllocateLists(*lists, ids, limit, span))
+
+        numpy_module = inverter_store.numpy
+        inverter_store.numpy = None
+        assert store.allocate_limits(ids, limit, span)[1] == reference
+        time_array = Measure(lambda: store.allocate_limits(ids, limit, span))
+        inverter_store.numpy = numpy_module
+
+        time_numpy = float('nan')
+        if numpy_module is not None:
+            assert store.allocate_limits_numpy(ids, limit, span)[1] == reference
+            time_numpy = Measure(lambda: store.allocate_limits_numpy(ids, limit, span))
+        print(f"{inverter_count:>10} {time_lists:>12.1f} {time_array:>12.1f} {time_numpy:>12.1f}")
+
+if __name__ == '__main__':
+    main()
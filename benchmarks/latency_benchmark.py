@@ -0,0 +1,297 @@
+# End-to-end control latency: the script runs against a local stand-in of a powermeter (Shelly 3EM or Tasmota) and a
+# DTU (Ahoy or OpenDTU) with configurable response latency. The household load is changed in steps, for every step the
+# reaction time (load step -> first limit command) and the settling time (load step -> grid power stays within
+# POWERMETER_TARGET_POINT +- POWERMETER_TOLERANCE) are measured.
+# usage: python benchmarks/latency_benchmark.py [--inverters 1,4] [--intervals 2,5] [--dtu ahoy] [--meter shelly]
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from configparser import ConfigParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCRIPT = os.path.join(ROOT, 'HoymilesZeroExport.py')
+INVERTER_WATT = 600
+
+class FakeInstallation:
+    # household load, inverters and the HTTP API of powermeter and DTU. A limit is acknowledged and produced after
+    # pAckDelay seconds, every response is delayed by pLatency seconds.
+    def __init__(self, pInverterCount, pLoad, pLatency, pAckDelay):
+        self.InverterCount = pInverterCount
+        self.Latency = pLatency
+        self.AckDelay = pAckDelay
+        self.Lock = threading.Lock()
+        self.Load = pLoad
+        self.Limits = [INVERTER_WATT] * pInverterCount
+        self.AckTime = [0.0] * pInverterCount
+        # (time, 'load', watts) and (time, 'limit', inverter, watts)
+        self.Events = [(time.monotonic(), 'load', pLoad)]
+        self.Server = ThreadingHTTPServer(('127.0.0.1', 0), self.CreateHandler())
+        self.Server.daemon_threads = True
+        self.Thread = threading.Thread(target=self.Server.serve_forever, daemon=True)
+        self.Thread.start()
+
+    @property
+    def Address(self):
+        return f'127.0.0.1:{self.Server.server_address[1]}'
+
+    def Stop(self):
+        self.Server.shutdown()
+        self.Server.server_close()
+
+    def SetLoad(self, pLoad):
+        with self.Lock:
+            self.Load = pLoad
+            self.Events.append((time.monotonic(), 'load', pLoad))
+
+    def SetLimit(self, pInverter, pWatts):
+        with self.Lock:
+            Now = time.monotonic()
+            self.Limits[pInverter] = pWatts
+            self.AckTime[pInverter] = Now + self.AckDelay
+            self.Events.append((Now, 'limit', pInverter, pWatts))
+
+    def Production(self, pInverter, pNow):
+        # the last limit that is already acknowledged
+        Watts = INVERTER_WATT
+        for Event in self.Events:
+            if Event[1] == 'limit' and Event[2] == pInverter and Event[0] + self.AckDelay <= pNow:
+                Watts = Event[3]
+        return Watts
+
+    def GridPower(self):
+        with self.Lock:
+            Now = time.monotonic()
+            return self.Load - sum(self.Production(i, Now) for i in range(self.InverterCount))
+
+    def Acknowledged(self, pInverter):
+        return time.monotonic() >= self.AckTime[pInverter]
+
+    def CreateHandler(self):
+        installation = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def Send(self, pData):
+                time.sleep(installation.Latency)
+                Body = json.dumps(pData).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(Body)))
+                self.end_headers()
+                self.wfile.write(Body)
+
+            def InverterDoc(self, i):
+                # Ahoy
+                Now = time.monotonic()
+                return {'id': i, 'serial': Serial(i), 'name': f'inverter {i}',
+                        'power_limit_read': installation.Limits[i] / INVERTER_WATT * 100,
+                        'power_limit_ack': installation.Acknowledged(i),
+                        'ch': [[230, 1, installation.Production(i, Now), 50, 1, 30], [40, 1, 100], [40, 1, 100]]}
+
+            def LiveData(self, i, pDetails):
+                # OpenDTU
+                Data = {'serial': Serial(i), 'name': f'inverter {i}', 'reachable': True, 'producing': True}
+                if pDetails:
+                    Data.update({'AC': {'0': {'Power': {'v': installation.Production(i, time.monotonic())}}},
+                                 'INV': {'0': {'Temperature': {'v': 30}}},
+                                 'DC': {'0': {'Voltage': {'v': 40}}, '1': {'Voltage': {'v': 40}}}})
+                return Data
+
+            def do_GET(self):
+                Url = urlparse(self.path)
+                Query = parse_qs(Url.query)
+                Path = Url.path
+                if Path == '/status':
+                    return self.Send({'total_power': installation.GridPower()})
+                if Path == '/cm':
+                    return self.Send({'StatusSNS': {'SML': {'curr_w': installation.GridPower()}}})
+                if Path == '/api/system':
+                    return self.Send({'version': '0.8.100'})
+                if Path == '/api/live':
+                    return self.Send({'generic': {'version': '0.8.100'},
+                                      'ch0_fld_names': ['U_AC', 'I_AC', 'P_AC', 'F_AC', 'PF_AC', 'Temp'],
+                                      'fld_names': ['U_DC', 'I_DC', 'P_DC']})
+                if Path == '/api/index':
+                    return self.Send({'inverter': [{'is_avail': True} for i in range(installation.InverterCount)]})
+                if Path.startswith('/api/inverter/id/'):
+                    return self.Send(self.InverterDoc(int(Path.rsplit('/', 1)[1])))
+                if Path == '/api/system/status':
+                    return self.Send({'git_hash': 'v24.6.10'})
+                if Path == '/api/livedata/status':
+                    if 'inv' in Query:
+                        return self.Send({'inverters': [self.LiveData(SerialToInverter(Query['inv'][0]), True)]})
+                    return self.Send({'inverters': [self.LiveData(i, False) for i in range(installation.InverterCount)]})
+                if Path == '/api/limit/status':
+                    return self.Send({Serial(i): {'limit_relative': installation.Limits[i] / INVERTER_WATT * 100,
+                                                  'limit_set_status': 'Ok' if installation.Acknowledged(i) else 'Pending'}
+                                      for i in range(installation.InverterCount)})
+                self.send_response(404)
+                self.end_headers()
+
+            def do_POST(self):
+                Body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+                Path = urlparse(self.path).path
+                if Path == '/api/ctrl':
+                    Data = json.loads(Body)
+                    if Data.get('cmd') == 'limit_nonpersistent_absolute':
+                        installation.SetLimit(Data['id'], Data['val'])
+                    return self.Send({'success': True, 'token': 'benchmark'})
+                if Path == '/api/limit/config':
+                    Data = json.loads(parse_qs(Body)['data'][0])
+                    installation.SetLimit(SerialToInverter(Data['serial']), Data['limit_value'] * INVERTER_WATT / 100)
+                    return self.Send({'type': 'success'})
+                if Path == '/api/power/config':
+                    return self.Send({'type': 'success'})
+                self.send_response(404)
+                self.end_headers()
+
+        return Handler
+
+def Serial(pInverter):
+    return f'1161{pInverter:08d}'
+
+def SerialToInverter(pSerial):
+    return int(pSerial[4:])
+
+def WriteConfig(pPath, pInstallation, pDtu, pMeter, pInterval, pJumpPercent):
+    config = ConfigParser()
+    config.optionxform = str
+    config['SELECT_DTU'] = {'USE_AHOY': str(pDtu == 'ahoy'), 'USE_OPENDTU': str(pDtu == 'opendtu')}
+    config['AHOY_DTU'] = {'AHOY_IP': pInstallation.Address}
+    config['OPEN_DTU'] = {'OPENDTU_IP': pInstallation.Address, 'OPENDTU_USER': 'admin', 'OPENDTU_PASS': ''}
+    config['SELECT_POWERMETER'] = {'USE_SHELLY_3EM': str(pMeter == 'shelly'), 'USE_TASMOTA': str(pMeter == 'tasmota')}
+    config['SHELLY'] = {'SHELLY_IP': pInstallation.Address}
+    config['TASMOTA'] = {'TASMOTA_IP': pInstallation.Address}
+    config['COMMON'] = {
+        'INVERTER_COUNT': str(pInstallation.InverterCount),
+        'LOOP_INTERVAL_IN_SECONDS': str(pInterval),
+        'POLL_INTERVAL_IN_SECONDS': '1',
+        'SET_POWER_STATUS_DELAY_IN_SECONDS': '0',
+        'ENABLE_LOG_TO_FILE': 'false',
+        'ON_GRID_USAGE_JUMP_TO_LIMIT_PERCENT': str(pJumpPercent),
+    }
+    for i in range(pInstallation.InverterCount):
+        config[f'INVERTER_{i + 1}'] = {'SERIAL_NUMBER': Serial(i), 'HOY_MAX_WATT': str(INVERTER_WATT), 'HOY_INVERTER_WATT': str(INVERTER_WATT)}
+    with open(pPath, 'w') as file:
+        config.write(file)
+
+def ReadControlConfig(pPath):
+    config = ConfigParser()
+    config.read([os.path.join(ROOT, 'HoymilesZeroExport_Config.ini'), pPath])
+    return config.getint('CONTROL', 'POWERMETER_TARGET_POINT'), config.getint('CONTROL', 'POWERMETER_TOLERANCE')
+
+def GridTimeline(pInstallation, pStart, pEnd):
+    # grid power at every change between pStart and pEnd: load steps and limits taking effect
+    Times = [pStart] + [Event[0] for Event in pInstallation.Events if Event[1] == 'load' and pStart < Event[0] < pEnd]
+    Times += [Event[0] + pInstallation.AckDelay for Event in pInstallation.Events if Event[1] == 'limit' and pStart < Event[0] + pInstallation.AckDelay < pEnd]
+    Timeline = []
+    for t in sorted(Times):
+        Load = [Event[2] for Event in pInstallation.Events if Event[1] == 'load' and Event[0] <= t][-1]
+        Timeline.append((t, Load - sum(pInstallation.Production(i, t) for i in range(pInstallation.InverterCount))))
+    return Timeline
+
+def MeasureStep(pInstallation, pStart, pEnd, pTarget, pTolerance):
+    # returns (reaction time, settling time), None if there was no reaction or the grid power did not settle
+    Commands = [Event[0] for Event in pInstallation.Events if Event[1] == 'limit' and pStart <= Event[0] < pEnd]
+    Reaction = Commands[0] - pStart if Commands else None
+    SettledAt = None
+    for t, GridPower in GridTimeline(pInstallation, pStart, pEnd):
+        if abs(GridPower - pTarget) <= pTolerance:
+            if SettledAt is None:
+                SettledAt = t
+        else:
+            SettledAt = None
+    Settling = SettledAt - pStart if SettledAt is not None else None
+    return Reaction, Settling
+
+def Percentile(pValues, pPercent):
+    # nearest rank
+    if not pValues:
+        return float('nan')
+    Values = sorted(pValues)
+    return Values[max(0, math.ceil(pPercent / 100 * len(Values)) - 1)]
+
+def RunScenario(pArgs, pDtu, pMeter, pInverterCount, pInterval):
+    random.seed(pInverterCount * 1000 + pInterval)
+    Capacity = pInverterCount * INVERTER_WATT
+    installation = FakeInstallation(pInverterCount, int(Capacity * 0.5), pArgs.latency, pArgs.ack_delay)
+    Reactions = []
+    SettlingTimes = []
+    Unsettled = 0
+    with tempfile.TemporaryDirectory() as Directory:
+        ConfigPath = os.path.join(Directory, 'benchmark.ini')
+        WriteConfig(ConfigPath, installation, pDtu, pMeter, pInterval, pArgs.jump_percent)
+        Target, Tolerance = ReadControlConfig(ConfigPath)
+        Log = open(pArgs.log, 'a') if pArgs.log else subprocess.DEVNULL
+        Process = subprocess.Popen([sys.executable, SCRIPT, '-c', ConfigPath], stdout=Log, stderr=subprocess.STDOUT, cwd=ROOT)
+        try:
+            StepDuration = pArgs.step_duration or max(5 * pInterval, 10)
+            time.sleep(StepDuration)
+            Load = installation.Load
+            for x in range(pArgs.steps):
+                # steps of at least 20% of the capacity, up and down
+                while True:
+                    NewLoad = int(Capacity * random.uniform(0.2, 0.8))
+                    if abs(NewLoad - Load) >= Capacity * 0.2:
+                        break
+                Load = NewLoad
+                installation.SetLoad(Load)
+                Start = time.monotonic()
+                time.sleep(StepDuration)
+                Reaction, Settling = MeasureStep(installation, Start, time.monotonic(), Target, Tolerance)
+                if Reaction is not None:
+                    Reactions.append(Reaction)
+                if Settling is not None:
+                    SettlingTimes.append(Settling)
+                else:
+                    Unsettled += 1
+        finally:
+            Process.kill()
+            Process.wait()
+            if Log is not subprocess.DEVNULL:
+                Log.close()
+            installation.Stop()
+    return Reactions, SettlingTimes, Unsettled
+
+def ParseList(pValue):
+    return [int(Value) for Value in pValue.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end control latency benchmark')
+    parser.add_argument('--inverters', type=ParseList, default=[1, 4], help='inverter counts, e.g. 1,4,16')
+    parser.add_argument('--intervals', type=ParseList, default=[2, 5], help='LOOP_INTERVAL_IN_SECONDS values, e.g. 2,5')
+    parser.add_argument('--dtu', choices=['ahoy', 'opendtu'], default='ahoy')
+    parser.add_argument('--meter', choices=['shelly', 'tasmota'], default='shelly')
+    parser.add_argument('--steps', type=int, default=5, help='load steps per scenario')
+    parser.add_argument('--step-duration', type=float, default=0, help='seconds per load step, default 5 loop intervals')
+    parser.add_argument('--latency', type=float, default=0.02, help='response latency of the devices in seconds')
+    parser.add_argument('--ack-delay', type=float, default=1.0, help='seconds until a limit is acknowledged')
+    # with a jump the limit toggles between the minimum and the jump limit as long as the load is below the jump limit
+    parser.add_argument('--jump-percent', type=int, default=0, help='ON_GRID_USAGE_JUMP_TO_LIMIT_PERCENT, default 0 (no jump)')
+    parser.add_argument('--log', help='append the output of the script to this file')
+    args = parser.parse_args()
+
+    print(f"dtu: {args.dtu} / meter: {args.meter} / latency: {args.latency} s / ack delay: {args.ack_delay} s / jump: {args.jump_percent} % / {args.steps} steps")
+    print(f"{'inverters':>10} {'interval':>9} | {'reaction p50':>12} {'p95':>6} {'p99':>6} | {'settling p50':>12} {'p95':>6} {'p99':>6} | {'unsettled':>9}")
+    for inverter_count in args.inverters:
+        for interval in args.intervals:
+            Reactions, SettlingTimes, Unsettled = RunScenario(args, args.dtu, args.meter, inverter_count, interval)
+            print(f"{inverter_count:>10} {interval:>9} | "
+                  f"{Percentile(Reactions, 50):>12.2f} {Percentile(Reactions, 95):>6.2f} {Percentile(Reactions, 99):>6.2f} | "
+                  f"{Percentile(SettlingTimes, 50):>12.2f} {Percentile(SettlingTimes, 95):>6.2f} {Percentile(SettlingTimes, 99):>6.2f} | "
+                  f"{Unsettled:>9}", flush=True)
+
+if __name__ == '__main__':
+    main()
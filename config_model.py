@@ -0,0 +1,158 @@
+from configparser import ConfigParser
+from dataclasses import dataclass, field, fields, replace
+from typing import Optional, Tuple
+
+REQUIRED = object()
+
+
+class ConfigError(Exception):
+    """
+    Raised when the config file has missing or invalid keys. All errors are collected, so they can be fixed at once.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("invalid configuration:\n" + "\n".join(errors))
+
+
+def option(key: str, fallback=REQUIRED, allow_empty: bool = False):
+    """
+    Maps a field of the config model to a key of the config file.
+
+    If the key is missing the fallback is used, keys without fallback are required.
+    With allow_empty an empty value is read as None.
+    """
+    return field(metadata={'key': key, 'fallback': fallback, 'allow_empty': allow_empty})
+
+
+@dataclass(frozen=True)
+class CommonConfig:
+    inverter_count: int = option('INVERTER_COUNT')
+    loop_interval_in_seconds: int = option('LOOP_INTERVAL_IN_SECONDS')
+    set_limit_timeout_seconds: int = option('SET_LIMIT_TIMEOUT_SECONDS')
+    set_limit_parallel_workers: int = option('SET_LIMIT_PARALLEL_WORKERS', 1)
+    set_power_status_delay_in_seconds: int = option('SET_POWER_STATUS_DELAY_IN_SECONDS')
+    poll_interval_in_seconds: int = option('POLL_INTERVAL_IN_SECONDS')
+    event_driven_loop: bool = option('EVENT_DRIVEN_LOOP', False)
+    use_asyncio: bool = option('USE_ASYNCIO', False)
+    pipelined_limit_ack: bool = option('PIPELINED_LIMIT_ACK', False)
+    max_difference_between_limit_and_outputpower: int = option('MAX_DIFFERENCE_BETWEEN_LIMIT_AND_OUTPUTPOWER')
+    set_powerstatus_cnt: int = option('SET_POWERSTATUS_CNT')
+    slow_approx_limit_in_percent: int = option('SLOW_APPROX_LIMIT_IN_PERCENT')
+    slow_approx_factor_in_percent: int = option('SLOW_APPROX_FACTOR_IN_PERCENT')
+    log_temperature: bool = option('LOG_TEMPERATURE')
+    set_inverter_to_min_on_powermeter_error: bool = option('SET_INVERTER_TO_MIN_ON_POWERMETER_ERROR', False)
+    on_grid_usage_jump_to_limit_percent: int = option('ON_GRID_USAGE_JUMP_TO_LIMIT_PERCENT')
+    on_grid_feed_fast_limit_decrease: bool = option('ON_GRID_FEED_FAST_LIMIT_DECREASE')
+    metrics_port: int = option('METRICS_PORT', 0)
+
+
+@dataclass(frozen=True)
+class ControlConfig:
+    powermeter_target_point: int = option('POWERMETER_TARGET_POINT')
+    powermeter_max_point: int = option('POWERMETER_MAX_POINT')
+    powermeter_min_point: int = option('POWERMETER_MIN_POINT')
+    powermeter_tolerance: int = option('POWERMETER_TOLERANCE')
+    controller: str = option('CONTROLLER', 'heuristic')
+    pid_kp: float = option('PID_KP', 0.2)
+    pid_ki: float = option('PID_KI', 0.6)
+    pid_kd: float = option('PID_KD', 0.0)
+    pid_feed_forward: bool = option('PID_FEED_FORWARD', True)
+
+
+@dataclass(frozen=True)
+class InverterConfig:
+    serial_number: str = option('SERIAL_NUMBER', '')
+    enabled: bool = option('ENABLED', True)
+    dtu: int = option('DTU', 1)
+    hoy_max_watt: int = option('HOY_MAX_WATT')
+    # empty: same as HOY_MAX_WATT
+    hoy_inverter_watt: Optional[int] = option('HOY_INVERTER_WATT', allow_empty=True)
+    hoy_min_watt_in_percent: int = option('HOY_MIN_WATT_IN_PERCENT')
+    hoy_compensate_watt_factor: float = option('HOY_COMPENSATE_WATT_FACTOR')
+    hoy_battery_mode: bool = option('HOY_BATTERY_MODE')
+    hoy_battery_threshold_off_limit_in_v: float = option('HOY_BATTERY_THRESHOLD_OFF_LIMIT_IN_V')
+    hoy_battery_threshold_reduce_limit_in_v: float = option('HOY_BATTERY_THRESHOLD_REDUCE_LIMIT_IN_V')
+    hoy_battery_threshold_normal_limit_in_v: float = option('HOY_BATTERY_THRESHOLD_NORMAL_LIMIT_IN_V')
+    hoy_battery_threshold_on_limit_in_v: float = option('HOY_BATTERY_THRESHOLD_ON_LIMIT_IN_V')
+    hoy_battery_normal_watt: int = option('HOY_BATTERY_NORMAL_WATT')
+    hoy_battery_reduce_watt: int = option('HOY_BATTERY_REDUCE_WATT')
+    hoy_battery_ignore_panels: str = option('HOY_BATTERY_IGNORE_PANELS')
+    hoy_battery_priority: int = option('HOY_BATTERY_PRIORITY')
+    hoy_battery_average_cnt: int = option('HOY_BATTERY_AVERAGE_CNT', 1)
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    """
+    Typed and validated configuration, read once at startup. The model is immutable, a reload creates a new one.
+    """
+    common: CommonConfig
+    control: ControlConfig
+    inverters: Tuple[InverterConfig, ...]
+
+
+def read_value(config: ConfigParser, section: str, key: str, value_type):
+    if value_type is bool:
+        return config.getboolean(section, key)
+    if value_type is int:
+        return config.getint(section, key)
+    if value_type is float:
+        return config.getfloat(section, key)
+    return config.get(section, key)
+
+
+def load_section(config: ConfigParser, section: str, model_type, errors: list):
+    if not config.has_section(section):
+        errors.append(f"[{section}]: section is missing")
+        return None
+    values = {}
+    for model_field in fields(model_type):
+        key = model_field.metadata['key']
+        fallback = model_field.metadata['fallback']
+        value_type = model_field.type
+        if value_type == Optional[int]:
+            value_type = int
+        if not config.has_option(section, key):
+            if fallback is REQUIRED:
+                errors.append(f"[{section}] {key}: key is missing")
+            else:
+                values[model_field.name] = fallback
+            continue
+        if model_field.metadata['allow_empty'] and not config.get(section, key).strip():
+            values[model_field.name] = None
+            continue
+        try:
+            values[model_field.name] = read_value(config, section, key, value_type)
+        except ValueError as e:
+            errors.append(f"[{section}] {key}: {e}")
+    if len(values) != len(fields(model_type)):
+        return None
+    return model_type(**values)
+
+
+def load_config(config: ConfigParser) -> AppConfig:
+    """
+    Reads and validates the COMMON, CONTROL and INVERTER_x sections. Raises a ConfigError with every missing or invalid
+    key.
+    """
+    errors = []
+    common = load_section(config, 'COMMON', CommonConfig, errors)
+    control = load_section(config, 'CONTROL', ControlConfig, errors)
+    if control is not None and control.controller not in ('heuristic', 'pid'):
+        errors.append(f"[CONTROL] CONTROLLER: must be heuristic or pid, not {control.controller}")
+    inverters = []
+    if common is not None:
+        if common.inverter_count < 1:
+            errors.append(f"[COMMON] INVERTER_COUNT: must be at least 1, not {common.inverter_count}")
+        for inverter_idx in range(common.inverter_count):
+            inverter = load_section(config, 'INVERTER_' + str(inverter_idx + 1), InverterConfig, errors)
+            if inverter is not None and inverter.dtu < 1:
+                errors.append(f"[INVERTER_{inverter_idx + 1}] DTU: must be at least 1, not {inverter.dtu}")
+            if inverter is not None and inverter.hoy_battery_average_cnt < 1:
+                errors.append(f"[INVERTER_{inverter_idx + 1}] HOY_BATTERY_AVERAGE_CNT: must be at least 1, not {inverter.hoy_battery_average_cnt}")
+            if inverter is not None and inverter.hoy_inverter_watt is None:
+                inverter = replace(inverter, hoy_inverter_watt=inverter.hoy_max_watt)
+            inverters.append(inverter)
+    if errors:
+        raise ConfigError(errors)
+    return AppConfig(common, control, tuple(inverters))
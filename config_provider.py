@@ -1,6 +1,9 @@
 import json
 import logging
+import threading
 from configparser import ConfigParser
+from types import MappingProxyType
+from config_model import AppConfig, load_config
 
 logger = logging.getLogger()
 
@@ -90,39 +93,103 @@ class ConfigProvider:
 class ConfigFileConfigProvider(ConfigProvider):
     """
     This class reads the configuration from the fixed config file.
+
+    The file is validated and converted into the typed config model once, the values are served from the model.
     """
-    def __init__(self, config: ConfigParser):
+    def __init__(self, config: ConfigParser, model: AppConfig = None):
         self.config = config
+        self.model = model if model is not None else load_config(config)
 
     def get_powermeter_target_point(self):
-        return self.config.getint('CONTROL', 'POWERMETER_TARGET_POINT')
+        return self.model.control.powermeter_target_point
 
     def get_powermeter_max_point(self):
-        return self.config.getint('CONTROL', 'POWERMETER_MAX_POINT')
+        return self.model.control.powermeter_max_point
     
     def get_powermeter_min_point(self):
-        return self.config.getint('CONTROL', 'POWERMETER_MIN_POINT')
+        return self.model.control.powermeter_min_point
 
     def get_powermeter_tolerance(self):
-        return self.config.getint('CONTROL', 'POWERMETER_TOLERANCE')
+        return self.model.control.powermeter_tolerance
 
     def on_grid_usage_jump_to_limit_percent(self):
-        return self.config.getint('COMMON', 'ON_GRID_USAGE_JUMP_TO_LIMIT_PERCENT')
+        return self.model.common.on_grid_usage_jump_to_limit_percent
     
     def on_grid_feed_fast_limit_decrease(self):
-        return self.config.getboolean('COMMON', 'ON_GRID_FEED_FAST_LIMIT_DECREASE')    
+        return self.model.common.on_grid_feed_fast_limit_decrease
 
     def get_min_wattage_in_percent(self, inverter_idx):
-        return self.config.getint('INVERTER_' + str(inverter_idx + 1), 'HOY_MIN_WATT_IN_PERCENT')
+        return self.model.inverters[inverter_idx].hoy_min_watt_in_percent
 
     def get_normal_wattage(self, inverter_idx):
-        return self.config.getint('INVERTER_' + str(inverter_idx + 1), 'HOY_BATTERY_NORMAL_WATT')
+        return self.model.inverters[inverter_idx].hoy_battery_normal_watt
 
     def get_reduce_wattage(self, inverter_idx):
-        return self.config.getint('INVERTER_' + str(inverter_idx + 1), 'HOY_BATTERY_REDUCE_WATT')
+        return self.model.inverters[inverter_idx].hoy_battery_reduce_watt
 
     def get_battery_priority(self, inverter_idx):
-        return self.config.getint('INVERTER_' + str(inverter_idx + 1), 'HOY_BATTERY_PRIORITY')
+        return self.model.inverters[inverter_idx].hoy_battery_priority
+
+
+COMMON_CONFIG_KEYS = [
+    'get_powermeter_target_point',
+    'get_powermeter_max_point',
+    'get_powermeter_min_point',
+    'get_powermeter_tolerance',
+    'on_grid_usage_jump_to_limit_percent',
+    'on_grid_feed_fast_limit_decrease',
+]
+
+INVERTER_CONFIG_KEYS = [
+    'get_min_wattage_in_percent',
+    'get_normal_wattage',
+    'get_reduce_wattage',
+    'get_battery_priority',
+]
+
+
+def resolve_config_value(providers, name, *args):
+    for provider in providers:
+        f = getattr(provider, name)
+        if callable(f):
+            value = f(*args)
+            if value is not None:
+                return value
+    return None
+
+
+class ConfigSnapshot:
+    """
+    Immutable effective configuration of a chain of config providers.
+
+    All values are resolved once. A value that could not be resolved (e.g. a missing key in the config file) keeps its
+    exception, which is raised when the value is read.
+    """
+    def __init__(self, providers, inverter_count: int):
+        self.common = MappingProxyType({name: self.resolve(providers, name) for name in COMMON_CONFIG_KEYS})
+        self.inverters = tuple(
+            MappingProxyType({name: self.resolve(providers, name, inverter_idx) for name in INVERTER_CONFIG_KEYS})
+            for inverter_idx in range(inverter_count)
+        )
+
+    @staticmethod
+    def resolve(providers, name, *args):
+        try:
+            return resolve_config_value(providers, name, *args)
+        except Exception as e:
+            return e
+
+    @staticmethod
+    def checked(value):
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def get_common_value(self, name):
+        return self.checked(self.common[name])
+
+    def get_inverter_value(self, inverter_idx, name):
+        return self.checked(self.inverters[inverter_idx][name])
 
 
 class ConfigProviderChain(ConfigProvider):
@@ -131,17 +198,88 @@ class ConfigProviderChain(ConfigProvider):
     first non-None value.
 
     This is useful if you want to combine multiple config sources, e.g. a config file and a MQTT topic.
+
+    The values are resolved into an immutable ConfigSnapshot. A change of an overriding provider (e.g. a MQTT set/reset
+    message) only queues the new values, they are resolved with the next update() at the start of the next control
+    cycle. So all values read within one cycle come from the same snapshot, and a cycle without changes reuses it.
+    Other providers with their own update() (e.g. a remote source) are resolved again in every update().
     """
-    def __init__(self, providers):
+    def __init__(self, providers, inverter_count: int = 0):
         self.providers = providers
+        self.inverter_count = inverter_count
+        self.lock = threading.Lock()
+        self.change_pending = False
+        self.resolve_every_update = False
+        for provider in self.providers:
+            if isinstance(provider, OverridingConfigProvider):
+                provider.add_change_listener(self.queue_change)
+            elif type(provider).update is not ConfigProvider.update:
+                self.resolve_every_update = True
+        self.resolve()
+
+    def queue_change(self):
+        # called from the thread of the overriding provider (e.g. the MQTT client)
+        with self.lock:
+            self.change_pending = True
 
     def update(self):
         for provider in self.providers:
             provider.update()
+        with self.lock:
+            change_pending = self.change_pending
+            self.change_pending = False
+        if change_pending:
+            logger.info("Applying changed config values")
+        if change_pending or self.resolve_every_update:
+            self.resolve()
+
+    def resolve(self):
+        with self.lock:
+            self.snapshot = ConfigSnapshot(self.providers, self.inverter_count)
+
+    def get_snapshot(self):
+        return self.snapshot
+
+    def get_inverter_value(self, inverter_idx, name):
+        snapshot = self.snapshot
+        if inverter_idx >= len(snapshot.inverters):
+            return resolve_config_value(self.providers, name, inverter_idx)
+        return snapshot.get_inverter_value(inverter_idx, name)
+
+    def get_powermeter_target_point(self):
+        return self.snapshot.get_common_value('get_powermeter_target_point')
+
+    def get_powermeter_max_point(self):
+        return self.snapshot.get_common_value('get_powermeter_max_point')
+
+    def get_powermeter_min_point(self):
+        return self.snapshot.get_common_value('get_powermeter_min_point')
+
+    def get_powermeter_tolerance(self):
+        return self.snapshot.get_common_value('get_powermeter_tolerance')
+
+    def on_grid_usage_jump_to_limit_percent(self):
+        return self.snapshot.get_common_value('on_grid_usage_jump_to_limit_percent')
+
+    def on_grid_feed_fast_limit_decrease(self):
+        return self.snapshot.get_common_value('on_grid_feed_fast_limit_decrease')
+
+    def get_min_wattage_in_percent(self, inverter_idx):
+        return self.get_inverter_value(inverter_idx, 'get_min_wattage_in_percent')
+
+    def get_normal_wattage(self, inverter_idx):
+        return self.get_inverter_value(inverter_idx, 'get_normal_wattage')
 
-    def __getattribute__(self, name):
-        if name in ['update', 'providers']:
-            return object.__getattribute__(self, name)
+    def get_reduce_wattage(self, inverter_idx):
+        return self.get_inverter_value(inverter_idx, 'get_reduce_wattage')
+
+    def get_battery_priority(self, inverter_idx):
+        return self.get_inverter_value(inverter_idx, 'get_battery_priority')
+
+    def __getattr__(self, name):
+        # methods of custom providers that are not part of the snapshot are resolved on every call
+        if name.startswith('__'):
+            raise AttributeError(name)
 
         def method(*args, **kwargs):
             for provider in self.providers:
@@ -159,10 +297,25 @@ class OverridingConfigProvider(ConfigProvider):
 
     This can be used as a base class for config providers that allow to change the configuration
     using a push mechanism, e.g. MQTT or a REST API.
+
+    The values are copied on write: a change builds new dicts and replaces the old ones, so readers in other threads
+    always see either the old or the new configuration.
     """
     def __init__(self):
         self.common_config = {}
         self.inverter_config = []
+        self.lock = threading.Lock()
+        self.change_listeners = []
+
+    def add_change_listener(self, listener):
+        """
+        The listener is called without arguments after a value was set or reset, in the thread that changed the value.
+        """
+        self.change_listeners.append(listener)
+
+    def notify_change(self):
+        for listener in self.change_listeners:
+            listener()
 
     @staticmethod
     def cast_value(is_inverter_value, key, value):
@@ -180,26 +333,38 @@ class OverridingConfigProvider(ConfigProvider):
                 logger.error(f"Unknown common key {key}")
 
     def set_common_value(self, name, value):
-        if value is None:
-            if name in self.common_config:
-                del self.common_config[name]
+        with self.lock:
+            common_config = dict(self.common_config)
+            if value is None:
+                if name not in common_config:
+                    return
+                del common_config[name]
                 logger.info(f"Unset common config value {name}")
-        else:
-            cast_value = self.cast_value(False, name, value)
-            self.common_config[name] = cast_value
-            logger.info(f"Set common config value {name} to {cast_value}")
+            else:
+                cast_value = self.cast_value(False, name, value)
+                common_config[name] = cast_value
+                logger.info(f"Set common config value {name} to {cast_value}")
+            self.common_config = common_config
+        self.notify_change()
 
     def set_inverter_value(self, inverter_idx: int, name: str, value):
-        if value is None:
-            if inverter_idx < len(self.inverter_config) and name in self.inverter_config[inverter_idx]:
-                del self.inverter_config[inverter_idx][name]
+        with self.lock:
+            inverter_config = list(self.inverter_config)
+            if value is None:
+                if inverter_idx >= len(inverter_config) or name not in inverter_config[inverter_idx]:
+                    return
+                inverter_config[inverter_idx] = dict(inverter_config[inverter_idx])
+                del inverter_config[inverter_idx][name]
                 logger.info(f"Unset inverter {inverter_idx} config value {name}")
-        else:
-            while len(self.inverter_config) <= inverter_idx:
-                self.inverter_config.append({})
-            cast_value = self.cast_value(True, name, value)
-            self.inverter_config[inverter_idx][name] = cast_value
-            logger.info(f"Set inverter {inverter_idx} config value {name} to {cast_value}")
+            else:
+                while len(inverter_config) <= inverter_idx:
+                    inverter_config.append({})
+                cast_value = self.cast_value(True, name, value)
+                inverter_config[inverter_idx] = dict(inverter_config[inverter_idx])
+                inverter_config[inverter_idx][name] = cast_value
+                logger.info(f"Set inverter {inverter_idx} config value {name} to {cast_value}")
+            self.inverter_config = inverter_config
+        self.notify_change()
 
     def get_powermeter_target_point(self):
         return self.common_config.get('powermeter_target_point')
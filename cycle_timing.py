@@ -0,0 +1,113 @@
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# upper bounds of the histogram buckets in milliseconds, the last bucket takes everything above
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def percentile(sorted_durations: list, percent: int) -> float:
+    # nearest rank
+    return sorted_durations[max(0, -(-len(sorted_durations) * percent // 100) - 1)]
+
+
+class RollingHistogram:
+    """
+    Durations of the last `window` spans of one phase (and device), counted in fixed buckets. When the window is full
+    the oldest span leaves its bucket, so the histogram always describes the recent cycles.
+    """
+    def __init__(self, window: int):
+        self.durations = deque(maxlen=window)
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.total = 0.0
+        self.count = 0
+        # since the start, for monitoring systems that calculate the rates themselves
+        self.cumulative_buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.cumulative_total = 0.0
+
+    def add(self, duration_ms: float):
+        if len(self.durations) == self.durations.maxlen:
+            oldest = self.durations[0]
+            self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, oldest)] -= 1
+            self.total -= oldest
+        self.durations.append(duration_ms)
+        bucket = bisect.bisect_left(BUCKET_BOUNDS_MS, duration_ms)
+        self.buckets[bucket] += 1
+        self.total += duration_ms
+        self.count += 1
+        self.cumulative_buckets[bucket] += 1
+        self.cumulative_total += duration_ms
+
+    def snapshot(self) -> dict:
+        """
+        Summary in milliseconds: spans in the window, spans since the start, mean, p50, p95, max and the bucket counts
+        keyed by their upper bound ("inf" for the last one).
+        """
+        durations = sorted(self.durations)
+        if not durations:
+            return {'window': 0, 'count': self.count}
+        buckets = {str(bound): count for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets)}
+        buckets['inf'] = self.buckets[-1]
+        return {
+            'window': len(durations),
+            'count': self.count,
+            'mean': round(self.total / len(durations), 1),
+            'p50': round(percentile(durations, 50), 1),
+            'p95': round(percentile(durations, 95), 1),
+            'max': round(durations[-1], 1),
+            'buckets': buckets,
+        }
+
+
+class CycleTimer:
+    """
+    Measures the phases of the control cycle (config update, DTU and powermeter reads, limit commands, acknowledges).
+    Every phase has a rolling histogram, phases of a single device (e.g. one inverter) have one per device.
+    Spans can be recorded from several threads.
+    """
+    def __init__(self, window: int = 100):
+        self.window = window
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, phase: str, device: str, duration_ms: float):
+        with self.lock:
+            histogram = self.histograms.get((phase, device))
+            if histogram is None:
+                histogram = self.histograms[(phase, device)] = RollingHistogram(self.window)
+            histogram.add(duration_ms)
+
+    @contextmanager
+    def span(self, phase: str, device: str = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, device, (time.perf_counter() - start) * 1000)
+
+    def call(self, phase: str, function, *args, device: str = None):
+        with self.span(phase, device):
+            return function(*args)
+
+    def snapshot(self) -> dict:
+        # state key ("phase" or "phase/device") -> summary of the histogram
+        with self.lock:
+            return {phase if device is None else f'{phase}/{device}': histogram.snapshot()
+                    for (phase, device), histogram in self.histograms.items()}
+
+    def totals(self) -> dict:
+        # (phase, device) -> (bucket counts, sum in milliseconds, count) of all spans since the start
+        with self.lock:
+            return {key: (list(histogram.cumulative_buckets), histogram.cumulative_total, histogram.count)
+                    for key, histogram in self.histograms.items()}
+
+    def publish(self, publish_state):
+        """
+        Publishes the summary of every histogram as JSON with publish_state(key, value), e.g. MqttHandler.publish_state.
+        The keys are timing/<phase> and timing/<phase>/<device>.
+        """
+        for key, summary in self.snapshot().items():
+            publish_state(f'timing/{key}', json.dumps(summary))
@@ -0,0 +1,72 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# below this group size the plain python loop is faster than creating the numpy views
+NUMPY_MIN_GROUP_SIZE = 32
+
+
+class InverterStore:
+    """
+    State of all inverters as compact arrays (structure of arrays), one element per inverter.
+
+    The arrays can be indexed and assigned like the former lists (booleans are stored as 0/1). The limit allocation of a
+    whole group is calculated at once, with NumPy on views of the arrays if it is installed.
+    """
+    def __init__(self, inverter_count: int):
+        self.inverter_count = inverter_count
+        self.max_watt = array('q', [0] * inverter_count)
+        self.inverter_watt = array('q', [0] * inverter_count)
+        self.min_watt = array('q', [0] * inverter_count)
+        self.compensate_watt_factor = array('d', [1.0] * inverter_count)
+        self.current_limit = array('q', [-1] * inverter_count)
+        self.available = array('b', [0] * inverter_count)
+        self.battery_mode = array('b', [0] * inverter_count)
+        self.battery_good_voltage = array('b', [1] * inverter_count)
+        self.last_limit_acknowledged = array('b', [0] * inverter_count)
+
+    def allocate_limits(self, inverter_ids: list, limit: int, span: int):
+        """
+        Splits the limit of a group proportionally to (max_watt - min_watt) of each inverter, span is the sum of
+        (max_watt - min_watt) of the group. Every limit is raised by min_watt and clamped to [min_watt, max_watt].
+        Inverters with a compensate factor are scaled and clamped to [min_watt, inverter_watt].
+
+        Returns the limits and the compensated limits as lists of int, in the order of inverter_ids.
+        """
+        if not inverter_ids:
+            return [], []
+        if span == 0:
+            raise ZeroDivisionError('division by zero')
+        if numpy is not None and len(inverter_ids) >= NUMPY_MIN_GROUP_SIZE:
+            return self.allocate_limits_numpy(inverter_ids, limit, span)
+        max_watt, min_watt, inverter_watt, factors = self.max_watt, self.min_watt, self.inverter_watt, self.compensate_watt_factor
+        limits = []
+        compensated_limits = []
+        for i in inverter_ids:
+            inverter_max_watt = max_watt[i]
+            inverter_min_watt = min_watt[i]
+            new_limit = int(limit * (inverter_max_watt - inverter_min_watt) / span) + inverter_min_watt
+            new_limit = max(min(new_limit, inverter_max_watt), inverter_min_watt)
+            limits.append(new_limit)
+            factor = factors[i]
+            if factor != 1:
+                new_limit = int(new_limit * factor)
+                new_limit = max(min(new_limit, inverter_watt[i]), inverter_min_watt)
+            compensated_limits.append(new_limit)
+        return limits, compensated_limits
+
+    def allocate_limits_numpy(self, inverter_ids: list, limit: int, span: int):
+        ids = numpy.asarray(inverter_ids, dtype=numpy.intp)
+        max_watt = numpy.frombuffer(self.max_watt, dtype=numpy.int64)[ids]
+        min_watt = numpy.frombuffer(self.min_watt, dtype=numpy.int64)[ids]
+        inverter_watt = numpy.frombuffer(self.inverter_watt, dtype=numpy.int64)[ids]
+        factor = numpy.frombuffer(self.compensate_watt_factor, dtype=numpy.float64)[ids]
+        limits = numpy.trunc(limit * (max_watt - min_watt) / span).astype(numpy.int64) + min_watt
+        limits = numpy.maximum(numpy.minimum(limits, max_watt), min_watt)
+        compensated = numpy.maximum(numpy.minimum(numpy.trunc(limits * factor).astype(numpy.int64), inverter_watt), min_watt)
+        compensated = numpy.where(factor != 1, compensated, limits)
+        # tolist() converts to python int, the values are published via MQTT and sent as JSON
+        return limits.tolist(), compensated.tolist()
@@ -0,0 +1,61 @@
+import re
+
+# a plain chain of keys and list indices like "$.ENERGY.Power" or "data[0].tuples[0][1]"
+SIMPLE_JSON_PATH_TOKEN = re.compile(r'\.?([A-Za-z_][A-Za-z0-9_]*)|\[(\d+)\]')
+
+
+def parse_simple_json_path(path: str):
+    """
+    Returns the keys and list indices of a simple path, None if the path needs jsonpath_ng.
+    """
+    path = path.strip()
+    if path.startswith('$'):
+        path = path[1:]
+    keys = []
+    pos = 0
+    while pos < len(path):
+        match = SIMPLE_JSON_PATH_TOKEN.match(path, pos)
+        if match is None:
+            return None
+        keys.append(match.group(1) if match.group(1) is not None else int(match.group(2)))
+        pos = match.end()
+    return keys
+
+
+class JsonPathExtractor:
+    """
+    A JSON path compiled once: simple paths are read key by key, everything else is compiled once with jsonpath_ng.
+    find() raises ValueError if the path has no match.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.keys = parse_simple_json_path(path)
+        self.expression = None
+        if self.keys is None:
+            from jsonpath_ng import parse
+            self.expression = parse(path)
+
+    def find(self, data):
+        if self.expression is not None:
+            match = self.expression.find(data)
+            if not match:
+                raise ValueError("No match found for the JSON path")
+            return match[0].value
+        for key in self.keys:
+            if not isinstance(data, (list, str) if isinstance(key, int) else dict):
+                raise ValueError("No match found for the JSON path")
+            try:
+                data = data[key]
+            except (KeyError, IndexError):
+                raise ValueError("No match found for the JSON path")
+        return data
+
+
+EXTRACTORS = {}
+
+
+def get_json_path_extractor(path: str) -> JsonPathExtractor:
+    extractor = EXTRACTORS.get(path)
+    if extractor is None:
+        extractor = EXTRACTORS[path] = JsonPathExtractor(path)
+    return extractor
@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class LimitStatusPoller:
+    """
+    Reads the limit status of a DTU, one response covers all of its inverters.
+
+    Every caller gets a response that was requested at or after the given time. Concurrent callers share one request,
+    so the traffic does not grow with the number of waiting inverters. A failed request raises its exception in every
+    caller that waited for it.
+    """
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.condition = threading.Condition()
+        self.fetching = False
+        self.request_time = None
+        self.response = None
+        self.error = None
+
+    def get(self, not_before: float):
+        with self.condition:
+            while True:
+                if self.request_time is not None and self.request_time >= not_before:
+                    if self.error is not None:
+                        raise self.error
+                    return self.response
+                if not self.fetching:
+                    break
+                # a request is running, it may be new enough
+                self.condition.wait()
+            self.fetching = True
+        request_time = time.time()
+        response = None
+        error = None
+        try:
+            response = self.fetch()
+        except Exception as e:
+            error = e
+        with self.condition:
+            self.fetching = False
+            self.request_time = request_time
+            self.response = response
+            self.error = error
+            self.condition.notify_all()
+        if error is not None:
+            raise error
+        return response
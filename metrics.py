@@ -0,0 +1,188 @@
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from cycle_timing import BUCKET_BOUNDS_MS, CycleTimer
+
+logger = logging.getLogger()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class MetricsRegistry:
+    """
+    Counters and gauges in the Prometheus text exposition format.
+
+    The control loop only increments counters and sets gauges, which takes a short lock. Values that already exist as
+    state of the script (limits, temperatures, cycle timings) are read by collectors when the endpoint is scraped.
+    """
+    def __init__(self, labels: dict = None):
+        # added to every sample, e.g. the name of the site if several sites run in one process
+        self.labels = tuple(sorted((labels or {}).items()))
+        self.descriptions = {}
+        self.values = {}
+        self.collectors = []
+        self.included = []
+        self.lock = threading.Lock()
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self.descriptions[name] = (metric_type, help_text)
+
+    def key(self, name: str, labels: dict):
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def inc(self, name: str, labels: dict = None, value: float = 1):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: dict = None):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = value
+
+    def add_collector(self, collector):
+        """
+        collector() is called on every scrape and returns (family, sample name, labels dict, value) tuples.
+        """
+        self.collectors.append(collector)
+
+    def include(self, registry: 'MetricsRegistry'):
+        # samples of another registry, e.g. the HTTP counters of a session shared by several sites
+        self.included.append(registry)
+
+    def collect(self) -> list:
+        with self.lock:
+            values = list(self.values.items())
+        samples = [(name, name, labels, value) for (name, labels), value in values]
+        for collector in self.collectors:
+            try:
+                samples += [(family, name, tuple(sorted(labels.items())), value) for family, name, labels, value in collector()]
+            except Exception as e:
+                logger.error('Exception at collecting metrics: %s', e)
+        if self.labels:
+            samples = [(family, name, self.labels + labels, value) for family, name, labels, value in samples]
+        for registry in self.included:
+            samples += registry.collect()
+        return samples
+
+    def get_descriptions(self) -> dict:
+        descriptions = {}
+        for registry in self.included:
+            descriptions.update(registry.get_descriptions())
+        descriptions.update(self.descriptions)
+        return descriptions
+
+    def render(self) -> str:
+        families = {}
+        for family, name, labels, value in self.collect():
+            families.setdefault(family, []).append(f'{name}{format_labels(labels)} {format_value(value)}')
+        descriptions = self.get_descriptions()
+        lines = []
+        for family, family_lines in families.items():
+            metric_type, help_text = descriptions.get(family, ('untyped', ''))
+            lines.append(f'# HELP {family} {help_text}')
+            lines.append(f'# TYPE {family} {metric_type}')
+            lines += family_lines
+        return '\n'.join(lines) + '\n'
+
+
+def cycle_timer_samples(timer: CycleTimer, family: str):
+    """
+    Returns a collector that reports the spans of a CycleTimer (since the start) as histogram in seconds, labeled with
+    phase and device.
+    """
+    bounds = [str(bound / 1000) for bound in BUCKET_BOUNDS_MS] + ['+Inf']
+
+    def collect():
+        samples = []
+        for (phase, device), (buckets, total_ms, count) in timer.totals().items():
+            labels = {'phase': phase, 'device': device or ''}
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, buckets):
+                cumulative += bucket_count
+                samples.append((family, family + '_bucket', dict(labels, le=bound), cumulative))
+            samples.append((family, family + '_sum', labels, total_ms / 1000))
+            samples.append((family, family + '_count', labels, count))
+        return samples
+    return collect
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that counts the requests and the failed requests (connection errors, timeouts, HTTP status >= 400) per
+    device. The device is the host (and port) of the URL.
+    """
+    def __init__(self, registry: MetricsRegistry, *args, **kwargs):
+        self.registry = registry
+        registry.describe('hoymiles_http_requests_total', 'counter', 'HTTP requests per device')
+        registry.describe('hoymiles_http_errors_total', 'counter', 'Failed HTTP requests per device (connection errors, timeouts, status >= 400)')
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        url = urlsplit(request.url)
+        labels = {'device': url.hostname if url.port is None else f'{url.hostname}:{url.port}'}
+        self.registry.inc('hoymiles_http_requests_total', labels)
+        try:
+            response = super().send(request, *args, **kwargs)
+        except Exception:
+            self.registry.inc('hoymiles_http_errors_total', labels)
+            raise
+        if response.status_code >= 400:
+            self.registry.inc('hoymiles_http_errors_total', labels)
+        return response
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry on http://<address>:<port>/metrics in its own thread. The text is rendered in this
+    thread, a scrape does not wait for the control loop.
+    """
+    def __init__(self, registry: MetricsRegistry, port: int, address: str = ''):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = HTTPServer((address, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='Metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,149 @@
+import argparse
+import importlib.util
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from pathlib import Path
+
+from requests.sessions import Session
+from urllib3.util import Retry
+
+from async_engine import AsyncEngine
+from metrics import InstrumentedHTTPAdapter, MetricsRegistry
+
+SCRIPT_PATH = Path(__file__).parent.resolve() / 'HoymilesZeroExport.py'
+BASE_CONFIG_PATH = Path(__file__).parent.resolve() / 'HoymilesZeroExport_Config.ini'
+
+logger = logging.getLogger()
+
+
+def read_site_config(config_path: str) -> ConfigParser:
+    config = ConfigParser()
+    config.read([str(BASE_CONFIG_PATH), config_path] if config_path else [str(BASE_CONFIG_PATH)])
+    return config
+
+
+class SharedResources:
+    """
+    Objects shared by all sites of the process: one HTTP session with a connection pool per device, one thread pool for
+    the background reads of the control loops and one asyncio engine, created when the first site needs it.
+    """
+    def __init__(self, configs: list):
+        # the retry settings are taken from the first site
+        config = configs[0]
+        retry = Retry(total=config.getint('COMMON', 'MAX_RETRIES', fallback=3),
+                      backoff_factor=config.getfloat('COMMON', 'RETRY_BACKOFF_FACTOR', fallback=0.1),
+                      status_forcelist=[int(status_code) for status_code in config.get('COMMON', 'RETRY_STATUS_CODES', fallback='500,502,503,504').split(',')],
+                      allowed_methods={"GET", "POST"})
+        # the requests of all sites are counted here, every site includes these counters in its metrics
+        self.metrics = MetricsRegistry()
+        adapter = InstrumentedHTTPAdapter(self.metrics, max_retries=retry, pool_connections=4 * len(configs))
+        self.session = Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # every site has at most one background read in flight
+        self.executor = ThreadPoolExecutor(max_workers=len(configs), thread_name_prefix='CycleFetch')
+        self.engine_workers = sum(config.getint('COMMON', 'INVERTER_COUNT', fallback=1) for config in configs) + 4
+        self.engine = None
+        self.lock = threading.Lock()
+
+    def get_engine(self) -> AsyncEngine:
+        with self.lock:
+            if self.engine is None:
+                self.engine = AsyncEngine(max_workers=self.engine_workers)
+            return self.engine
+
+
+class SiteContext:
+    """
+    Passed to HoymilesZeroExport.py as SITE_CONTEXT: the name and arguments of the site and the shared resources.
+    With devices (DTU, powermeter, intermediate powermeter) the site does not create its own devices.
+    """
+    def __init__(self, name: str, config_path: str, shared: SharedResources):
+        self.name = name
+        self.arguments = ['-c', config_path] if config_path else []
+        self.shared = shared
+        self.session = shared.session
+        self.executor = shared.executor
+        self.devices = None
+
+    def get_engine(self) -> AsyncEngine:
+        return self.shared.get_engine()
+
+
+def load_site(context: SiteContext):
+    """
+    Loads HoymilesZeroExport.py as a separate module for the site. Every site has its own module globals (devices,
+    inverter state, MQTT clients), the code and the imported libraries are shared.
+    """
+    spec = importlib.util.spec_from_file_location('HoymilesZeroExport_' + context.name, SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    module.SITE_CONTEXT = context
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_site_names(config_paths: list) -> list:
+    names = []
+    for config_path in config_paths:
+        name = Path(config_path).stem
+        if name in names:
+            name = f'{name}_{len(names) + 1}'
+        names.append(name)
+    return names
+
+
+class SiteRunner:
+    """
+    Runs the control loops of several sites in one process. The loops block while they wait for the devices, so every
+    site runs in its own thread. The starts are spread over one loop interval, so the requests of the sites do not
+    coincide.
+    """
+    def __init__(self, config_paths: list):
+        self.config_paths = config_paths
+        self.configs = [read_site_config(config_path) for config_path in config_paths]
+        self.shared = SharedResources(self.configs)
+        self.sites = {}
+        self.threads = []
+
+    def load(self):
+        for name, config_path in zip(get_site_names(self.config_paths), self.config_paths):
+            logger.info('Load site "%s" from %s', name, config_path)
+            self.sites[name] = load_site(SiteContext(name, config_path, self.shared))
+
+    def start(self):
+        for index, (name, site) in enumerate(self.sites.items()):
+            if index > 0:
+                time.sleep(site.LOOP_INTERVAL_IN_SECONDS / len(self.sites))
+            thread = threading.Thread(target=self.run_site, args=(name, site), name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def run_site(self, name: str, site):
+        try:
+            site.Run()
+        except BaseException as e:
+            logger.error('Site "%s" stopped: %s', name, e)
+
+    def run(self):
+        self.load()
+        self.start()
+        for thread in self.threads:
+            thread.join()
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(name)s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description='Run several HoymilesZeroExport sites in one process')
+    parser.add_argument('configs', nargs='+', help='Override configuration file of every site')
+    args = parser.parse_args()
+    SiteRunner(args.configs).run()
+
+
+if __name__ == '__main__':
+    main()
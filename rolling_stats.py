@@ -0,0 +1,69 @@
+import math
+from collections import deque
+
+
+class RollingWindow:
+    """
+    The last `size` values of a series with mean, min and max in O(1) per value, independent of the size of the window.
+
+    The values are kept in a ring buffer with a running sum. Min and max use monotonic deques: a value that can never
+    be the min (max) of the window again, because a newer value is smaller (larger), is dropped when the newer value is
+    added.
+    """
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError(f'size must be at least 1, not {size}')
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.values = [0.0] * self.size
+        self.count = 0
+        self.added = 0
+        self.total = 0.0
+        # (number of the value, value), ascending for the min, descending for the max
+        self.min_candidates = deque()
+        self.max_candidates = deque()
+
+    def add(self, value: float):
+        index = self.added % self.size
+        if self.count == self.size:
+            self.total -= self.values[index]
+        else:
+            self.count += 1
+        self.values[index] = value
+        self.total += value
+        if index == self.size - 1:
+            # the running sum collects rounding errors, it is recalculated once per pass through the buffer
+            self.total = math.fsum(self.values[:self.count])
+
+        oldest = self.added - self.size
+        while self.min_candidates and self.min_candidates[-1][1] >= value:
+            self.min_candidates.pop()
+        self.min_candidates.append((self.added, value))
+        if self.min_candidates[0][0] <= oldest:
+            self.min_candidates.popleft()
+        while self.max_candidates and self.max_candidates[-1][1] <= value:
+            self.max_candidates.pop()
+        self.max_candidates.append((self.added, value))
+        if self.max_candidates[0][0] <= oldest:
+            self.max_candidates.popleft()
+        self.added += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def mean(self) -> float:
+        if not self.count:
+            raise ValueError('mean of an empty window')
+        return self.total / self.count
+
+    def min(self) -> float:
+        if not self.count:
+            raise ValueError('min of an empty window')
+        return self.min_candidates[0][1]
+
+    def max(self) -> float:
+        if not self.count:
+            raise ValueError('max of an empty window')
+        return self.max_candidates[0][1]
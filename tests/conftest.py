@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# the modules of the repository are not installed, they are imported from the root
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+sys.path.insert(0, str(Path(__file__).parent.resolve()))
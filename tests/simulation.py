@@ -0,0 +1,164 @@
+"""
+Closed loop simulation of the unmodified control loop of HoymilesZeroExport.py: simulated inverters and a simulated
+grid powermeter (household load - production) with the virtual clock of the trace replay.
+"""
+from configparser import ConfigParser
+
+from multi_site import SharedResources, SiteContext, load_site, read_site_config
+from trace_replay import InlineExecutor, VirtualClock, record_devices
+
+START = 1700000000.0
+
+
+class SimulatedDTU:
+    """
+    Inverters that produce their limit at once (up to the available PV power) and acknowledge every limit, unless
+    acknowledged is False. The DTU is also the intermediate powermeter (actual production).
+    """
+    def __init__(self, simulation, pv_watt: int):
+        self.simulation = simulation
+        self.pv_watt = pv_watt
+        self.site = None
+        self.limits = {}
+        self.acknowledged = True
+        # inverter ids of the GetActualLimitInW calls (limit cross checks)
+        self.limit_reads = []
+        # (virtual time, inverter id, limit) of every limit command
+        self.commands = []
+
+    def IsParallel(self):
+        return False
+
+    def InvalidateCache(self):
+        return
+
+    def PrefetchStatus(self):
+        return
+
+    def CheckMinVersion(self):
+        return
+
+    def GetAvailable(self, pInverterId: int):
+        return True
+
+    def GetInfo(self, pInverterId: int):
+        self.site['NAME'][pInverterId] = f'inverter {pInverterId}'
+
+    def GetTemperature(self, pInverterId: int):
+        return
+
+    def GetPanelMinVoltage(self, pInverterId: int):
+        return 50
+
+    def GetActualLimitInW(self, pInverterId: int):
+        self.limit_reads.append(pInverterId)
+        return self.limits.get(pInverterId, 0)
+
+    def GetACPower(self, pInverterId: int):
+        return min(self.limits.get(pInverterId, 0), self.pv_watt)
+
+    def GetPowermeterWatts(self):
+        return sum(self.GetACPower(pInverterId) for pInverterId in self.limits)
+
+    def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
+        return self.acknowledged
+
+    def IsLimitAcknowledged(self, pInverterId: int):
+        return self.acknowledged
+
+    def WaitForAcks(self, pInverterIds: list, pTimeoutInS: int):
+        return {pInverterId: self.acknowledged for pInverterId in pInverterIds}
+
+    def SetLimit(self, pInverterId: int, pLimit: int):
+        self.limits[pInverterId] = pLimit
+        self.commands.append((self.simulation.clock.now, pInverterId, pLimit))
+        self.site['CURRENT_LIMIT'][pInverterId] = pLimit
+
+    def SetPowerStatus(self, pInverterId: int, pActive: bool):
+        return
+
+
+class SimulatedPowermeter:
+    def __init__(self, simulation):
+        self.simulation = simulation
+
+    def GetPowermeterWatts(self):
+        return self.simulation.get_grid_watts()
+
+    def WaitForNewValue(self, pTimeoutInS: float, pPollIntervalInS: float):
+        self.simulation.clock.sleep(min(pTimeoutInS, pPollIntervalInS))
+        return True
+
+
+class SimulationContext(SiteContext):
+    def __init__(self, name: str, config_path: str, devices: tuple):
+        super().__init__(name, config_path, SharedResources([read_site_config(config_path)]))
+        self.executor = InlineExecutor()
+        self.devices = devices
+
+    def get_engine(self):
+        return None
+
+
+class Simulation:
+    """
+    Loads the script with the simulated devices. config: {section: {key: value}} on top of the base config.
+    load(seconds since start) returns the household load in watts. With trace_path the device traffic is recorded like
+    with --record (trace_replay.time has to be the clock of the simulation).
+    """
+    def __init__(self, config_path, config: dict, load, pv_watt: int = 2000, trace_path=None, clock: VirtualClock = None):
+        parser = ConfigParser()
+        parser.read_dict(config)
+        with open(config_path, 'w') as file:
+            parser.write(file)
+        self.load = load
+        self.clock = clock if clock is not None else VirtualClock(START)
+        self.dtu = SimulatedDTU(self, pv_watt)
+        self.powermeter = SimulatedPowermeter(self)
+        devices = (self.dtu, self.powermeter, self.dtu)
+        self.trace_writer = None
+        if trace_path is not None:
+            self.trace_writer, *devices = record_devices(str(trace_path), *devices, None)
+        self.site = load_site(SimulationContext(f'simulation_{id(self)}', str(config_path), tuple(devices)))
+        self.site.time = self.clock
+        self.dtu.site = vars(self.site)
+        if self.trace_writer is not None:
+            devices[0].site = vars(self.site)
+        self.site.Init()
+
+    def elapsed(self) -> float:
+        return self.clock.now - START
+
+    def get_grid_watts(self) -> int:
+        return int(self.load(self.elapsed())) - self.dtu.GetPowermeterWatts()
+
+    def run_until(self, seconds: float) -> list:
+        """
+        Runs control cycles until the given time (seconds since start), returns (seconds since start, grid watts) at the
+        end of every cycle.
+        """
+        samples = []
+        while self.elapsed() < seconds:
+            self.site.RunCycle()
+            samples.append((self.elapsed(), self.get_grid_watts()))
+        return samples
+
+    def commands_between(self, start: float, end: float) -> list:
+        return [limit for timestamp, _, limit in self.dtu.commands if START + start <= timestamp < START + end]
+
+
+def settling_time(samples: list, step: float, target: int, tolerance: int):
+    """
+    Seconds from the step until the grid power stays within target +- tolerance up to the end of the samples, None if
+    it does not settle.
+    """
+    settled = None
+    for timestamp, watts in samples:
+        if timestamp < step:
+            continue
+        if abs(watts - target) <= tolerance:
+            if settled is None:
+                settled = timestamp
+        else:
+            settled = None
+    return None if settled is None else settled - step
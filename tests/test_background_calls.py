@@ -0,0 +1,31 @@
+import pytest
+
+from async_engine import AsyncEngine
+from simulation import Simulation
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    site = Simulation(tmp_path / 'config.ini', {}, lambda seconds: 0).site
+    engine = AsyncEngine(max_workers=2)
+    monkeypatch.setattr(site, 'ENGINE', engine)
+    yield site
+    engine.close()
+
+
+def test_background_exception_is_logged(site, caplog):
+    def PublishState():
+        raise ConnectionError('MQTT broker not reachable')
+
+    future = site.SubmitInBackground(PublishState)
+    with pytest.raises(ConnectionError):
+        future.result(5)
+    # the done callback runs in the event loop, a later call of the loop waits for it
+    site.ENGINE.run(site.ENGINE.call(lambda: None), 5)
+    assert 'Exception at test_background_exception_is_logged.<locals>.PublishState' in caplog.messages
+    assert 'MQTT broker not reachable' in caplog.messages
+
+
+def test_background_result(site, caplog):
+    assert site.SubmitInBackground(max, 3, 4).result(5) == 4
+    assert not [record for record in caplog.records if record.levelname == 'ERROR']
@@ -0,0 +1,69 @@
+from configparser import ConfigParser
+from pathlib import Path
+
+import pytest
+
+from config_model import ConfigError, load_config
+
+CONFIG_FILE = Path(__file__).parent.parent / 'HoymilesZeroExport_Config.ini'
+
+
+@pytest.fixture
+def config():
+    parser = ConfigParser()
+    parser.read(CONFIG_FILE)
+    return parser
+
+
+def test_shipped_config_is_valid(config):
+    model = load_config(config)
+    assert len(model.inverters) == config.getint('COMMON', 'INVERTER_COUNT')
+    assert model.control.controller == 'heuristic'
+    # every inverter is connected to the DTU of [SELECT_DTU] by default
+    assert all(inverter.dtu == 1 for inverter in model.inverters)
+
+
+def test_fallbacks(config):
+    config.remove_option('CONTROL', 'CONTROLLER')
+    config.remove_option('INVERTER_1', 'HOY_BATTERY_AVERAGE_CNT')
+    config.set('INVERTER_1', 'HOY_INVERTER_WATT', '')
+    model = load_config(config)
+    assert model.control.controller == 'heuristic'
+    assert model.inverters[0].hoy_battery_average_cnt == 1
+    # an empty HOY_INVERTER_WATT is the same as HOY_MAX_WATT
+    assert model.inverters[0].hoy_inverter_watt == model.inverters[0].hoy_max_watt
+
+
+def test_all_errors_are_collected(config):
+    config.set('COMMON', 'INVERTER_COUNT', '3')
+    config.set('CONTROL', 'CONTROLLER', 'fuzzy')
+    config.set('INVERTER_1', 'DTU', '0')
+    config.set('INVERTER_1', 'HOY_BATTERY_AVERAGE_CNT', '0')
+    config.set('INVERTER_2', 'HOY_BATTERY_MODE', 'maybe')
+    config.remove_option('INVERTER_3', 'HOY_MAX_WATT')
+    with pytest.raises(ConfigError) as error:
+        load_config(config)
+    assert error.value.errors[0] == '[CONTROL] CONTROLLER: must be heuristic or pid, not fuzzy'
+    assert error.value.errors[1] == '[INVERTER_1] DTU: must be at least 1, not 0'
+    assert error.value.errors[2] == '[INVERTER_1] HOY_BATTERY_AVERAGE_CNT: must be at least 1, not 0'
+    assert error.value.errors[3].startswith('[INVERTER_2] HOY_BATTERY_MODE: ')
+    assert error.value.errors[4] == '[INVERTER_3] HOY_MAX_WATT: key is missing'
+    assert len(error.value.errors) == 5
+
+
+def test_invalid_value(config):
+    config.remove_option('COMMON', 'LOOP_INTERVAL_IN_SECONDS')
+    config.set('CONTROL', 'POWERMETER_TOLERANCE', 'abc')
+    with pytest.raises(ConfigError) as error:
+        load_config(config)
+    assert error.value.errors[0] == '[COMMON] LOOP_INTERVAL_IN_SECONDS: key is missing'
+    assert error.value.errors[1].startswith('[CONTROL] POWERMETER_TOLERANCE: ')
+
+
+def test_inverter_count(config):
+    config.set('COMMON', 'INVERTER_COUNT', '0')
+    with pytest.raises(ConfigError, match='INVERTER_COUNT: must be at least 1'):
+        load_config(config)
+    config.set('COMMON', 'INVERTER_COUNT', str(len([s for s in config.sections() if s.startswith('INVERTER_')]) + 1))
+    with pytest.raises(ConfigError, match='section is missing'):
+        load_config(config)
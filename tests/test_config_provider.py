@@ -0,0 +1,92 @@
+from configparser import ConfigParser
+from pathlib import Path
+
+import pytest
+
+from config_provider import ConfigFileConfigProvider, ConfigProvider, ConfigProviderChain, ConfigSnapshot, OverridingConfigProvider
+
+CONFIG_FILE = Path(__file__).parent.parent / 'HoymilesZeroExport_Config.ini'
+
+
+class FailingConfigProvider(OverridingConfigProvider):
+    def get_powermeter_tolerance(self):
+        raise KeyError('POWERMETER_TOLERANCE')
+
+
+@pytest.fixture
+def file_provider():
+    config = ConfigParser()
+    config.read(CONFIG_FILE)
+    return ConfigFileConfigProvider(config)
+
+
+def test_snapshot_keeps_exception_until_read(file_provider):
+    snapshot = ConfigSnapshot([FailingConfigProvider(), file_provider], 1)
+    assert snapshot.get_common_value('get_powermeter_target_point') == file_provider.get_powermeter_target_point()
+    with pytest.raises(KeyError):
+        snapshot.get_common_value('get_powermeter_tolerance')
+
+
+def test_snapshot_is_immutable(file_provider):
+    snapshot = ConfigSnapshot([file_provider], 1)
+    with pytest.raises(TypeError):
+        snapshot.common['get_powermeter_target_point'] = 0
+
+
+def test_override_is_applied_with_next_update(file_provider):
+    overrides = OverridingConfigProvider()
+    chain = ConfigProviderChain([overrides, file_provider], 1)
+    target_point = file_provider.get_powermeter_target_point()
+    snapshot = chain.get_snapshot()
+
+    overrides.set_common_value('powermeter_target_point', target_point + 100)
+    overrides.set_inverter_value(0, 'normal_watt', 123)
+    assert chain.get_powermeter_target_point() == target_point
+    assert chain.get_normal_wattage(0) == file_provider.get_normal_wattage(0)
+    assert chain.get_snapshot() is snapshot
+
+    chain.update()
+    assert chain.get_powermeter_target_point() == target_point + 100
+    assert chain.get_normal_wattage(0) == 123
+    # the snapshot of the previous cycle is not changed
+    assert snapshot.get_common_value('get_powermeter_target_point') == target_point
+
+    overrides.set_common_value('powermeter_target_point', None)
+    chain.update()
+    assert chain.get_powermeter_target_point() == target_point
+
+
+def test_inverter_outside_of_snapshot():
+    overrides = OverridingConfigProvider()
+    chain = ConfigProviderChain([overrides], 1)
+    overrides.set_inverter_value(1, 'battery_priority', 3)
+    # inverters that are not part of the snapshot are resolved on every call
+    assert chain.get_battery_priority(1) == 3
+
+
+def test_snapshot_is_reused_without_changes(file_provider):
+    overrides = OverridingConfigProvider()
+    chain = ConfigProviderChain([overrides, file_provider], 1)
+    snapshot = chain.get_snapshot()
+    chain.update()
+    assert chain.get_snapshot() is snapshot
+    overrides.set_common_value('powermeter_tolerance', 10)
+    chain.update()
+    assert chain.get_snapshot() is not snapshot
+
+
+def test_provider_with_update_is_resolved_every_update(file_provider):
+    class RemoteConfigProvider(ConfigProvider):
+        def __init__(self):
+            self.tolerance = None
+
+        def update(self):
+            self.tolerance = 42
+
+        def get_powermeter_tolerance(self):
+            return self.tolerance
+
+    chain = ConfigProviderChain([RemoteConfigProvider(), file_provider], 1)
+    assert chain.get_powermeter_tolerance() == file_provider.get_powermeter_tolerance()
+    chain.update()
+    assert chain.get_powermeter_tolerance() == 42
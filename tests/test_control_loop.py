@@ -0,0 +1,52 @@
+import pytest
+
+from simulation import Simulation, settling_time
+
+TARGET = -75
+TOLERANCE = 25
+LOOP_INTERVAL = 5
+STEP = 60
+
+
+def step_load(seconds):
+    # household load in watts, steps up after STEP seconds
+    return 200 if seconds < STEP else 900
+
+
+def make_config(controller: str, jump_percent: int) -> dict:
+    return {
+        'COMMON': {
+            'INVERTER_COUNT': '1',
+            'LOOP_INTERVAL_IN_SECONDS': str(LOOP_INTERVAL),
+            'POLL_INTERVAL_IN_SECONDS': '1',
+            'ON_GRID_USAGE_JUMP_TO_LIMIT_PERCENT': str(jump_percent),
+        },
+        'CONTROL': {
+            'CONTROLLER': controller,
+            'POWERMETER_TARGET_POINT': str(TARGET),
+            'POWERMETER_TOLERANCE': str(TOLERANCE),
+            'POWERMETER_MAX_POINT': '0',
+            'POWERMETER_MIN_POINT': '-600',
+        },
+    }
+
+
+@pytest.mark.parametrize('controller', ['heuristic', 'pid'])
+@pytest.mark.parametrize('jump_percent', [0, 100])
+def test_load_step_settles(tmp_path, controller, jump_percent):
+    simulation = Simulation(tmp_path / 'config.ini', make_config(controller, jump_percent), step_load)
+    samples = simulation.run_until(STEP + 24 * LOOP_INTERVAL)
+    assert settling_time(samples, 0, TARGET, TOLERANCE) is not None
+    settled = settling_time(samples, STEP, TARGET, TOLERANCE)
+    assert settled is not None and settled <= 12 * LOOP_INTERVAL
+    # no limit changes once the grid power is within the tolerance
+    assert simulation.commands_between(STEP + settled + LOOP_INTERVAL, simulation.elapsed()) == []
+
+
+def test_jump_is_not_undone_in_the_same_cycle(tmp_path):
+    simulation = Simulation(tmp_path / 'config.ini', make_config('heuristic', 100), step_load)
+    simulation.run_until(STEP - 1)
+    before = len(simulation.dtu.commands)
+    simulation.run_until(STEP + LOOP_INTERVAL)
+    # the grid usage jump sets the full limit, the cycle ends without another correction
+    assert [limit for _, _, limit in simulation.dtu.commands[before:]] == [1500]
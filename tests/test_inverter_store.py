@@ -0,0 +1,69 @@
+import pytest
+
+import inverter_store
+from inverter_store import InverterStore
+
+
+def make_store(inverters: list) -> InverterStore:
+    # inverters: (max_watt, min_watt, inverter_watt, compensate factor)
+    store = InverterStore(len(inverters))
+    for i, (max_watt, min_watt, inverter_watt, factor) in enumerate(inverters):
+        store.max_watt[i] = max_watt
+        store.min_watt[i] = min_watt
+        store.inverter_watt[i] = inverter_watt
+        store.compensate_watt_factor[i] = factor
+    return store
+
+
+def test_proportional_split():
+    store = make_store([(1500, 100, 1500, 1), (800, 100, 800, 1)])
+    limits, compensated = store.allocate_limits([0, 1], 1050, 2100)
+    assert limits == [800, 450]
+    assert compensated == limits
+
+
+def test_clamped_to_min_and_max():
+    store = make_store([(1500, 100, 1500, 1), (800, 100, 800, 1)])
+    assert store.allocate_limits([0, 1], 5000, 2100)[0] == [1500, 800]
+    assert store.allocate_limits([0, 1], -500, 2100)[0] == [100, 100]
+
+
+def test_compensate_factor():
+    store = make_store([(600, 50, 800, 1.5), (600, 50, 600, 1)])
+    limits, compensated = store.allocate_limits([0, 1], 1100, 1100)
+    assert limits == [600, 600]
+    # scaled, but not above the nominal power of the inverter
+    assert compensated == [800, 600]
+    limits, compensated = store.allocate_limits([0], 200, 550)
+    assert limits == [250]
+    assert compensated == [375]
+
+
+def test_subset_keeps_order_of_ids():
+    store = make_store([(1000, 0, 1000, 1), (500, 0, 500, 1), (2000, 0, 2000, 1)])
+    assert store.allocate_limits([2, 0], 1500, 3000)[0] == [1000, 500]
+
+
+def test_empty_group():
+    assert InverterStore(2).allocate_limits([], 100, 0) == ([], [])
+
+
+def test_zero_span_raises():
+    store = make_store([(500, 500, 500, 1)])
+    with pytest.raises(ZeroDivisionError):
+        store.allocate_limits([0], 100, 0)
+
+
+@pytest.mark.skipif(inverter_store.numpy is None, reason='numpy is not installed')
+def test_numpy_matches_python_loop():
+    inverters = [(300 + 37 * i, 20 + i % 7, 400 + 40 * i, 1 if i % 3 else 1.0 + i / 100) for i in range(64)]
+    store = make_store(inverters)
+    ids = list(range(0, 64, 2)) + list(range(1, 64, 2))
+    span = sum(max_watt - min_watt for max_watt, min_watt, _, _ in inverters)
+    for limit in (-100, 0, 1234, span // 2, span, 2 * span):
+        numpy_limits = store.allocate_limits_numpy(ids, limit, span)
+        inverter_store.numpy, numpy = None, inverter_store.numpy
+        try:
+            assert store.allocate_limits(ids, limit, span) == numpy_limits
+        finally:
+            inverter_store.numpy = numpy
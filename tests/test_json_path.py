@@ -0,0 +1,50 @@
+import pytest
+from jsonpath_ng import parse
+
+from json_path import JsonPathExtractor, get_json_path_extractor, parse_simple_json_path
+
+PAYLOAD = {
+    'ENERGY': {'Power': 123, 'Total': 4.5},
+    'meters': [{'power': -5}, {'power': 17}],
+    'data': {'tuples': [[1700000000, 42]]},
+}
+
+
+@pytest.mark.parametrize('path, keys', [
+    ('$.ENERGY.Power', ['ENERGY', 'Power']),
+    (' ENERGY.Total ', ['ENERGY', 'Total']),
+    ('$.data.tuples[0][1]', ['data', 'tuples', 0, 1]),
+    ('$.meters[*].power', None),
+    ("$['ENERGY']['Power']", None),
+])
+def test_parse_simple_json_path(path, keys):
+    assert parse_simple_json_path(path) == keys
+
+
+@pytest.mark.parametrize('path', [
+    '$.ENERGY.Power',
+    'ENERGY.Total',
+    '$.meters[1].power',
+    '$.data.tuples[0][1]',
+])
+def test_simple_path_matches_jsonpath_ng(path):
+    extractor = JsonPathExtractor(path)
+    assert extractor.expression is None
+    assert extractor.find(PAYLOAD) == parse(path).find(PAYLOAD)[0].value
+
+
+def test_other_paths_use_jsonpath_ng():
+    extractor = JsonPathExtractor('$.meters[*].power')
+    assert extractor.expression is not None
+    assert extractor.find(PAYLOAD) == -5
+    assert JsonPathExtractor("$['ENERGY']['Power']").find(PAYLOAD) == 123
+
+
+@pytest.mark.parametrize('path', ['$.ENERGY.Missing', '$.meters[5].power', '$.ENERGY[0]', '$.meters.power', '$.meters[*].missing'])
+def test_no_match_raises(path):
+    with pytest.raises(ValueError):
+        JsonPathExtractor(path).find(PAYLOAD)
+
+
+def test_extractors_are_cached():
+    assert get_json_path_extractor('$.ENERGY.Power') is get_json_path_extractor('$.ENERGY.Power')
@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from limit_status import LimitStatusPoller
+from simulation import Simulation
+
+
+class BlockingFetch:
+    """
+    Fetch that blocks until it is released, returns the number of the request or raises the given error.
+    """
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.count = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.count += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.count
+
+
+def call_in_thread(function, *args) -> dict:
+    # the result or the exception of the call is stored in the returned dict
+    result = {}
+
+    def run():
+        try:
+            result['value'] = function(*args)
+        except Exception as e:
+            result['error'] = e
+    result['thread'] = threading.Thread(target=run)
+    result['thread'].start()
+    return result
+
+
+def join(results: list):
+    for result in results:
+        result['thread'].join(5)
+        assert not result['thread'].is_alive()
+
+
+def test_concurrent_callers_share_one_request():
+    fetch = BlockingFetch()
+    poller = LimitStatusPoller(fetch)
+    not_before = time.time()
+    results = [call_in_thread(poller.get, not_before)]
+    assert fetch.started.wait(5)
+    results += [call_in_thread(poller.get, not_before) for _ in range(4)]
+    # the other callers wait for the running request
+    time.sleep(0.05)
+    fetch.release.set()
+    join(results)
+    assert fetch.count == 1
+    assert [result['value'] for result in results] == [1] * 5
+    # a response that is new enough is returned without a request
+    assert poller.get(not_before) == 1
+    assert fetch.count == 1
+
+
+def test_caller_after_the_running_request_starts_a_new_one():
+    fetch = BlockingFetch()
+    poller = LimitStatusPoller(fetch)
+    first = call_in_thread(poller.get, time.time())
+    assert fetch.started.wait(5)
+    time.sleep(0.01)
+    # e.g. a limit was sent after the running request was started
+    second = call_in_thread(poller.get, time.time())
+    time.sleep(0.05)
+    fetch.release.set()
+    join([first, second])
+    assert first['value'] == 1
+    assert second['value'] == 2
+    assert fetch.count == 2
+
+
+def test_error_reaches_every_waiting_caller():
+    error = ConnectionError('DTU not reachable')
+    fetch = BlockingFetch(error)
+    poller = LimitStatusPoller(fetch)
+    not_before = time.time()
+    results = [call_in_thread(poller.get, not_before)]
+    assert fetch.started.wait(5)
+    results += [call_in_thread(poller.get, not_before) for _ in range(3)]
+    time.sleep(0.05)
+    fetch.release.set()
+    join(results)
+    assert fetch.count == 1
+    assert all(result.get('error') is error for result in results)
+
+
+class FakeOpenDTU:
+    """
+    Limit status and limit commands of an OpenDTU: a new limit is 'Pending' until acknowledge() is called.
+    """
+    def __init__(self, serial: str):
+        self.serial = serial
+        self.status = 'Ok'
+        self.status_requests = 0
+
+    def GetJson(self, path):
+        assert path == '/api/limit/status'
+        self.status_requests += 1
+        return {self.serial: {'limit_set_status': self.status, 'limit_relative': 50}}
+
+    def GetResponseJson(self, path, sendStr):
+        assert path == '/api/limit/config'
+        self.status = 'Pending'
+        return {'type': 'success'}
+
+    def acknowledge(self):
+        self.status = 'Ok'
+
+
+@pytest.fixture
+def open_dtu(tmp_path, monkeypatch):
+    site = Simulation(tmp_path / 'config.ini', {}, lambda seconds: 0).site
+    # the limit status poller uses the real time
+    monkeypatch.setattr(site, 'time', time)
+    site.SERIAL_NUMBER[0] = '112233'
+    fake = FakeOpenDTU('112233')
+    dtu = site.OpenDTU(1, '127.0.0.1', 'admin', 'secret')
+    dtu.GetJson = fake.GetJson
+    dtu.GetResponseJson = fake.GetResponseJson
+    return dtu, fake
+
+
+def test_no_acknowledge_from_before_the_limit_was_sent(open_dtu):
+    dtu, fake = open_dtu
+    # the status of the previous limit is read shortly before the new limit is sent
+    assert dtu.IsLimitAcknowledged(0)
+    dtu.SetLimit(0, 300)
+    assert not dtu.IsLimitAcknowledged(0)
+    assert fake.status_requests == 2
+    fake.acknowledge()
+    # a status is reused for LIMIT_STATUS_MAX_AGE_IN_SECONDS
+    time.sleep(dtu.LIMIT_STATUS_MAX_AGE_IN_SECONDS)
+    assert dtu.IsLimitAcknowledged(0)
+    assert fake.status_requests == 3
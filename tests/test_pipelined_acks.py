@@ -0,0 +1,80 @@
+import pytest
+
+from simulation import Simulation
+
+TIMEOUT = 10
+LIMIT = 600
+
+
+@pytest.fixture
+def simulation(tmp_path):
+    simulation = Simulation(tmp_path / 'config.ini', {
+        'COMMON': {
+            'INVERTER_COUNT': '1',
+            'SET_LIMIT_TIMEOUT_SECONDS': str(TIMEOUT),
+            'PIPELINED_LIMIT_ACK': 'true',
+        },
+    }, lambda seconds: 500)
+    # the limit of Init is acknowledged
+    simulation.site.ReconcileLimitAcks()
+    assert simulation.site.PENDING_LIMIT_ACKS == {}
+    return simulation
+
+
+def sent_limits(simulation) -> list:
+    return [limit for _, _, limit in simulation.dtu.commands]
+
+
+def test_acknowledged_limit_is_no_longer_pending(simulation):
+    site = simulation.site
+    site.SetLimit(LIMIT)
+    # the control loop does not wait for the acknowledge
+    assert list(site.PENDING_LIMIT_ACKS) == [0]
+    site.ReconcileLimitAcks()
+    assert site.PENDING_LIMIT_ACKS == {}
+    assert site.LASTLIMITACKNOWLEDGED[0]
+    simulation.clock.sleep(TIMEOUT)
+    site.SetLimit(LIMIT)
+    assert sent_limits(simulation)[-1:] == [LIMIT]
+    assert sent_limits(simulation).count(LIMIT) == 1
+
+
+def test_limit_without_acknowledge_is_sent_again(simulation):
+    site = simulation.site
+    simulation.dtu.acknowledged = False
+    site.SetLimit(LIMIT)
+    simulation.clock.sleep(TIMEOUT - 1)
+    site.ReconcileLimitAcks()
+    assert list(site.PENDING_LIMIT_ACKS) == [0]
+    assert site.LASTLIMITACKNOWLEDGED[0]
+    # same limit within the timeout: not sent again
+    site.SetLimit(LIMIT)
+    assert sent_limits(simulation).count(LIMIT) == 1
+
+    simulation.clock.sleep(1)
+    site.ReconcileLimitAcks()
+    assert site.PENDING_LIMIT_ACKS == {}
+    assert not site.LASTLIMITACKNOWLEDGED[0]
+    site.SetLimit(LIMIT)
+    assert sent_limits(simulation).count(LIMIT) == 2
+    assert list(site.PENDING_LIMIT_ACKS) == [0]
+
+
+def test_cross_check_skips_pending_limits(simulation):
+    site = simulation.site
+    dtu = simulation.dtu
+    dtu.acknowledged = False
+    site.SetLimit(LIMIT)
+    # the inverter still reports another limit, the new limit may not be active yet
+    dtu.limits[0] = 100
+    reads = len(dtu.limit_reads)
+    site.CrossCheckLimit()
+    assert len(dtu.limit_reads) == reads
+    assert sent_limits(simulation).count(LIMIT) == 1
+
+    dtu.acknowledged = True
+    site.ReconcileLimitAcks()
+    site.CrossCheckLimit()
+    assert dtu.limit_reads[reads:] == [0]
+    # not pending anymore: the wrong limit is sent again
+    assert sent_limits(simulation).count(LIMIT) == 2
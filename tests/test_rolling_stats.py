@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from rolling_stats import RollingWindow
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 50])
+def test_matches_full_recalculation(size):
+    generator = random.Random(size)
+    window = RollingWindow(size)
+    values = []
+    for _ in range(300):
+        value = generator.uniform(-100, 100)
+        window.add(value)
+        values.append(value)
+        last = values[-size:]
+        assert len(window) == len(last)
+        assert window.mean() == pytest.approx(sum(last) / len(last))
+        assert window.min() == min(last)
+        assert window.max() == max(last)
+
+
+def test_repeated_values():
+    window = RollingWindow(3)
+    for value in [5, 5, 1, 5, 5, 5]:
+        window.add(value)
+    assert window.min() == 5
+    assert window.max() == 5
+
+
+def test_empty_window_raises():
+    window = RollingWindow(3)
+    for statistic in (window.mean, window.min, window.max):
+        with pytest.raises(ValueError):
+            statistic()
+    window.add(1)
+    window.clear()
+    assert len(window) == 0
+    with pytest.raises(ValueError):
+        window.mean()
+
+
+def test_size_must_be_positive():
+    with pytest.raises(ValueError):
+        RollingWindow(0)
@@ -0,0 +1,45 @@
+import re
+from configparser import ConfigParser
+
+import trace_replay
+from simulation import START, Simulation
+from test_control_loop import LOOP_INTERVAL, STEP, make_config, step_load
+from trace_replay import VirtualClock, replay
+
+REPLAYED_LIMIT = re.compile(r'Replay: Inverter ".*": setting new limit from -?\d+ Watt to (-?\d+) Watt')
+
+
+def record(tmp_path, monkeypatch, config: dict):
+    clock = VirtualClock(START)
+    # the trace is written with the virtual time of the simulation
+    monkeypatch.setattr(trace_replay, 'time', clock)
+    trace_path = tmp_path / 'trace.jsonl.gz'
+    simulation = Simulation(tmp_path / 'config.ini', config, step_load, trace_path=trace_path, clock=clock)
+    simulation.run_until(STEP + 12 * LOOP_INTERVAL)
+    simulation.trace_writer.close()
+    return simulation, trace_path
+
+
+def replayed_limits(caplog, trace_path, config_path) -> list:
+    caplog.clear()
+    caplog.set_level('INFO')
+    replay(str(trace_path), str(config_path))
+    return [int(match.group(1)) for match in map(REPLAYED_LIMIT.match, caplog.messages) if match]
+
+
+def test_replay_sends_the_recorded_limits(tmp_path, monkeypatch, caplog):
+    simulation, trace_path = record(tmp_path, monkeypatch, make_config('heuristic', 0))
+    recorded = [limit for _, _, limit in simulation.dtu.commands]
+    assert len(recorded) > 2
+    assert replayed_limits(caplog, trace_path, tmp_path / 'config.ini') == recorded
+
+
+def test_replay_with_other_settings(tmp_path, monkeypatch, caplog):
+    simulation, trace_path = record(tmp_path, monkeypatch, make_config('heuristic', 0))
+    parser = ConfigParser()
+    parser.read_dict(make_config('heuristic', 100))
+    with open(tmp_path / 'jump.ini', 'w') as file:
+        parser.write(file)
+    # the recorded load step jumps to the full limit
+    assert 1500 not in [limit for _, _, limit in simulation.dtu.commands]
+    assert 1500 in replayed_limits(caplog, trace_path, tmp_path / 'jump.ini')
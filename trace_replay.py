@@ -0,0 +1,405 @@
+import argparse
+import atexit
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from multi_site import SharedResources, SiteContext, load_site, read_site_config
+
+TRACE_VERSION = 1
+MISSING = object()
+
+logger = logging.getLogger()
+
+
+def open_trace(path: str, mode: str):
+    # a file name ending with .gz is compressed
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class TraceWriter:
+    """
+    Writes the device traffic of the control loop to a trace file. The first line is a JSON header, then one JSON list
+    per call: [seconds since start, duration, source, method, arguments, result] and the error message as 7th element
+    if the call failed.
+    """
+    def __init__(self, path: str, header: dict):
+        self.file = open_trace(path, 'w')
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.last_flush = self.start
+        self.write_line(dict(header, version=TRACE_VERSION, start=self.start))
+        atexit.register(self.close)
+
+    def write_line(self, obj):
+        self.file.write(json.dumps(obj, separators=(',', ':')) + '\n')
+
+    def write(self, start: float, source: str, method: str, args: tuple, result, error: str = None):
+        now = time.time()
+        record = [round(start - self.start, 3), round(now - start, 3), source, method, list(args), result]
+        if error is not None:
+            record.append(error)
+        with self.lock:
+            if self.file.closed:
+                return
+            self.write_line(record)
+            # flushed at most once per second, a compressed trace stays readable if the script is killed
+            if now - self.last_flush >= 1:
+                self.file.flush()
+                self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingDevice:
+    """
+    Forwards every call to the device and writes it to the trace.
+    """
+    def __init__(self, device, source: str, writer: TraceWriter):
+        self.device = device
+        self.source = source
+        self.writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def call(self, method: str, args: tuple, result_of=None):
+        start = time.time()
+        try:
+            result = getattr(self.device, method)(*args)
+        except Exception as e:
+            self.writer.write(start, self.source, method, args, None, str(e))
+            raise
+        self.writer.write(start, self.source, method, args, result if result_of is None else result_of(result))
+        return result
+
+
+class RecordingPowermeter(RecordingDevice):
+    def GetPowermeterWatts(self):
+        return self.call('GetPowermeterWatts', ())
+
+    def WaitForNewValue(self, pTimeoutInS: float, pPollIntervalInS: float):
+        return self.call('WaitForNewValue', (pTimeoutInS, pPollIntervalInS))
+
+
+class RecordingDTU(RecordingDevice):
+    def __init__(self, device, writer: TraceWriter, site: dict):
+        super().__init__(device, 'dtu', writer)
+        # globals of the script, GetInfo and GetTemperature return their values there
+        self.site = site
+
+    def GetPowermeterWatts(self):
+        return self.call('GetPowermeterWatts', ())
+
+    def CheckMinVersion(self):
+        return self.call('CheckMinVersion', ())
+
+    def GetACPower(self, pInverterId: int):
+        return self.call('GetACPower', (pInverterId,))
+
+    def GetAvailable(self, pInverterId: int):
+        return self.call('GetAvailable', (pInverterId,))
+
+    def GetActualLimitInW(self, pInverterId: int):
+        return self.call('GetActualLimitInW', (pInverterId,))
+
+    def GetInfo(self, pInverterId: int):
+        return self.call('GetInfo', (pInverterId,), lambda result: [self.site['SERIAL_NUMBER'][pInverterId], self.site['NAME'][pInverterId], self.site['TEMPERATURE'][pInverterId]])
+
+    def GetTemperature(self, pInverterId: int):
+        return self.call('GetTemperature', (pInverterId,), lambda result: self.site['TEMPERATURE'][pInverterId])
+
+    def GetPanelMinVoltage(self, pInverterId: int):
+        return self.call('GetPanelMinVoltage', (pInverterId,))
+
+    def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
+        return self.call('WaitForAck', (pInverterId, pTimeoutInS))
+
+    def IsLimitAcknowledged(self, pInverterId: int):
+        return self.call('IsLimitAcknowledged', (pInverterId,))
+
+    def WaitForAcks(self, pInverterIds: list, pTimeoutInS: int):
+        # written as one WaitForAck per inverter, like the acknowledges awaited by the asyncio engine
+        start = time.time()
+        try:
+            acks = self.device.WaitForAcks(pInverterIds, pTimeoutInS)
+        except Exception as e:
+            for pInverterId in pInverterIds:
+                self.writer.write(start, self.source, 'WaitForAck', (pInverterId, pTimeoutInS), None, str(e))
+            raise
+        for pInverterId, ack in acks.items():
+            self.writer.write(start, self.source, 'WaitForAck', (pInverterId, pTimeoutInS), ack)
+        return acks
+
+    def SetLimit(self, pInverterId: int, pLimit: int):
+        return self.call('SetLimit', (pInverterId, pLimit))
+
+    def SetPowerStatus(self, pInverterId: int, pActive: bool):
+        return self.call('SetPowerStatus', (pInverterId, pActive))
+
+
+def record_devices(path: str, dtu, powermeter, intermediate_powermeter, site: dict):
+    """
+    Wraps the devices of the script, every call is written to the trace file. Returns the writer and the wrapped
+    DTU, powermeter and intermediate powermeter.
+    """
+    writer = TraceWriter(path, {
+        'dtu_parallel': dtu.IsParallel(),
+        'intermediate_is_dtu': intermediate_powermeter is dtu,
+    })
+    recording_dtu = RecordingDTU(dtu, writer, site)
+    recording_powermeter = RecordingPowermeter(powermeter, 'powermeter', writer)
+    if intermediate_powermeter is dtu:
+        recording_intermediate_powermeter = recording_dtu
+    else:
+        recording_intermediate_powermeter = RecordingPowermeter(intermediate_powermeter, 'intermediate', writer)
+    return writer, recording_dtu, recording_powermeter, recording_intermediate_powermeter
+
+
+class TraceEnd(BaseException):
+    """
+    Raised when the powermeter readings of the trace are used up. Like KeyboardInterrupt it passes the error handling
+    of the control loop.
+    """
+
+
+class VirtualClock:
+    """
+    Replaces the time module of the replayed script: sleep() only advances the clock, a replayed call advances it to
+    the end of the recorded call.
+    """
+    def __init__(self, start: float):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += max(0, seconds)
+
+    def advance_to(self, timestamp: float):
+        self.now = max(self.now, timestamp)
+
+
+class TraceReader:
+    """
+    Reads a trace into one queue per source, method and inverter. A replayed call takes the next record of its queue,
+    so the concurrent reads of the control loop can not mix up the records.
+    """
+    def __init__(self, path: str):
+        self.queues = {}
+        self.last = {}
+        with open_trace(path, 'r') as file:
+            self.header = json.loads(file.readline())
+            try:
+                for line in file:
+                    record = json.loads(line)
+                    self.queues.setdefault(self.get_key(record[2], record[3], record[4]), deque()).append(record)
+            except (EOFError, json.JSONDecodeError):
+                # the recording script was killed, the last block is incomplete
+                pass
+
+    def get_key(self, source: str, method: str, args):
+        return source, method, args[0] if args else None
+
+    def next(self, source: str, method: str, args: tuple, hold: bool = True):
+        """
+        Returns the next record of the call. If the queue is used up the last record is returned again (hold), or None.
+        """
+        key = self.get_key(source, method, args)
+        queue = self.queues.get(key)
+        if queue:
+            self.last[key] = queue.popleft()
+            return self.last[key]
+        return self.last.get(key) if hold else None
+
+
+class ReplayDevice:
+    def __init__(self, source: str, reader: TraceReader, clock: VirtualClock):
+        self.source = source
+        self.reader = reader
+        self.clock = clock
+
+    def replay(self, method: str, args: tuple, default=MISSING, hold: bool = True):
+        record = self.reader.next(self.source, method, args, hold)
+        if record is None:
+            if default is MISSING:
+                raise Exception(f'Replay: {self.source} {method}{args} is not in the trace')
+            return default
+        self.clock.advance_to(self.reader.header['start'] + record[0] + record[1])
+        if len(record) > 6:
+            raise Exception(record[6])
+        return record[5]
+
+
+class ReplayPowermeter(ReplayDevice):
+    def GetPowermeterWatts(self):
+        if self.source == 'powermeter':
+            # the grid powermeter readings define the end of the trace
+            record = self.replay('GetPowermeterWatts', (), None, hold=False)
+            if record is None:
+                raise TraceEnd()
+            return record
+        return self.replay('GetPowermeterWatts', ())
+
+    def WaitForNewValue(self, pTimeoutInS: float, pPollIntervalInS: float):
+        NewValue = self.replay('WaitForNewValue', (pTimeoutInS, pPollIntervalInS), None, hold=False)
+        if NewValue is None:
+            self.clock.sleep(max(0, min(pTimeoutInS, pPollIntervalInS)))
+            return True
+        return NewValue
+
+
+class ReplayDTU(ReplayDevice):
+    def __init__(self, reader: TraceReader, clock: VirtualClock):
+        super().__init__('dtu', reader, clock)
+        self.site = None
+
+    def bind(self, site: dict):
+        # globals of the replayed script
+        self.site = site
+
+    def IsParallel(self):
+        return self.reader.header['dtu_parallel']
+
+    def InvalidateCache(self):
+        return
+
+    def PrefetchStatus(self):
+        return
+
+    def GetProducingInverters(self):
+        return [pInverterId for pInverterId in range(self.site['INVERTER_COUNT']) if self.site['AVAILABLE'][pInverterId] and self.site['HOY_BATTERY_GOOD_VOLTAGE'][pInverterId]]
+
+    def GetPowermeterWatts(self):
+        Watts = self.replay('GetPowermeterWatts', (), None)
+        if Watts is None:
+            # recorded with the asyncio engine, which reads every inverter
+            Watts = sum(self.GetACPower(pInverterId) for pInverterId in self.GetProducingInverters())
+        return Watts
+
+    def CheckMinVersion(self):
+        return self.replay('CheckMinVersion', (), None)
+
+    def GetACPower(self, pInverterId: int):
+        return self.replay('GetACPower', (pInverterId,))
+
+    def GetAvailable(self, pInverterId: int):
+        return self.replay('GetAvailable', (pInverterId,))
+
+    def GetActualLimitInW(self, pInverterId: int):
+        return self.replay('GetActualLimitInW', (pInverterId,))
+
+    def GetInfo(self, pInverterId: int):
+        self.site['SERIAL_NUMBER'][pInverterId], self.site['NAME'][pInverterId], self.site['TEMPERATURE'][pInverterId] = self.replay('GetInfo', (pInverterId,))
+
+    def GetTemperature(self, pInverterId: int):
+        self.site['TEMPERATURE'][pInverterId] = self.replay('GetTemperature', (pInverterId,))
+
+    def GetPanelMinVoltage(self, pInverterId: int):
+        return self.replay('GetPanelMinVoltage', (pInverterId,))
+
+    def WaitForAck(self, pInverterId: int, pTimeoutInS: int):
+        return self.replay('WaitForAck', (pInverterId, pTimeoutInS), True)
+
+    def IsLimitAcknowledged(self, pInverterId: int):
+        return self.replay('IsLimitAcknowledged', (pInverterId,), True)
+
+    def WaitForAcks(self, pInverterIds: list, pTimeoutInS: int):
+        return {pInverterId: self.WaitForAck(pInverterId, pTimeoutInS) for pInverterId in pInverterIds}
+
+    def SetLimit(self, pInverterId: int, pLimit: int):
+        logger.info('Replay: Inverter "%s": setting new limit from %s Watt to %s Watt', self.site['NAME'][pInverterId], int(self.site['CURRENT_LIMIT'][pInverterId]), int(pLimit))
+        self.replay('SetLimit', (pInverterId, pLimit), None)
+        self.site['CURRENT_LIMIT'][pInverterId] = pLimit
+
+    def SetPowerStatus(self, pInverterId: int, pActive: bool):
+        return self.replay('SetPowerStatus', (pInverterId, pActive), None)
+
+
+class InlineExecutor:
+    """
+    Runs the background reads of the replayed control loop at once, so the replay is deterministic.
+    """
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class ReplayContext(SiteContext):
+    def __init__(self, config_path: str, devices: tuple):
+        super().__init__('replay', config_path, SharedResources([read_site_config(config_path)]))
+        self.executor = InlineExecutor()
+        self.devices = devices
+
+    def get_engine(self):
+        # the replay always uses the synchronous code paths
+        return None
+
+
+class VirtualTimeFilter(logging.Filter):
+    # the log of the replay shows the virtual time
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def filter(self, record):
+        record.created = self.clock.now
+        record.msecs = (self.clock.now - int(self.clock.now)) * 1000
+        return True
+
+
+def replay(trace_path: str, config_path: str = None):
+    """
+    Runs the unmodified control loop of HoymilesZeroExport.py with the devices of a trace and a virtual clock.
+    The recorded powermeter values do not react to the replayed limits, the replay ends with the last grid powermeter
+    reading. Returns the replayed time span in seconds.
+    """
+    reader = TraceReader(trace_path)
+    clock = VirtualClock(reader.header['start'])
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(VirtualTimeFilter(clock))
+    dtu = ReplayDTU(reader, clock)
+    powermeter = ReplayPowermeter('powermeter', reader, clock)
+    intermediate_powermeter = dtu if reader.header['intermediate_is_dtu'] else ReplayPowermeter('intermediate', reader, clock)
+    site = load_site(ReplayContext(config_path, (dtu, powermeter, intermediate_powermeter)))
+    site.time = clock
+    dtu.bind(vars(site))
+    try:
+        site.Run()
+    except TraceEnd:
+        pass
+    return clock.now - reader.header['start']
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description='Replay a trace recorded with HoymilesZeroExport.py --record')
+    parser.add_argument('trace', help='Trace file')
+    parser.add_argument('-c', '--config', help='Override configuration file path, e.g. with other control settings')
+    args = parser.parse_args()
+    start = time.time()
+    duration = replay(args.trace, args.config)
+    logger.info('Replayed %.0f seconds of the trace in %.1f seconds', duration, time.time() - start)
+
+
+if __name__ == '__main__':
+    main()